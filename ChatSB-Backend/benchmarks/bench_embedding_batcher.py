@@ -0,0 +1,157 @@
+# benchmarks/bench_embedding_batcher.py
+"""
+Throughput benchmark for utils/embedding_batcher.py against a simulated
+Bedrock endpoint: N concurrent callers each embed M offer queries, once
+with one request per query (the old ResilientEmbeddings path) and once
+through the micro-batcher.
+
+Run from the ChatSB-Backend directory:
+
+    python -m benchmarks.bench_embedding_batcher
+    python -m benchmarks.bench_embedding_batcher --callers 16,64,256 --model titan
+
+The simulated endpoint serves at most --upstream-concurrency requests at
+a time (account throttling) and answers after --request-ms, plus
+--per-text-ms per text for batch requests (--model cohere). Queries are
+drawn from a small pool so concurrent users repeat each other, as they
+do in practice ("HDFC offers", ...).
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from benchmarks.load_test import RESULTS_DIR, git_commit
+from utils import embedding_batcher
+
+QUERIES = [
+    f"{bank} offers on {platform}"
+    for bank in ("HDFC", "ICICI", "SBI", "Axis", "Kotak", "IndusInd", "RBL", "AU")
+    for platform in ("MakeMyTrip", "Goibibo", "Cleartrip", "EaseMyTrip", "Yatra", "Ixigo")
+]
+
+
+class SimulatedBedrock:
+    def __init__(self, concurrency, request_s, per_text_s):
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self.request_s = request_s
+        self.per_text_s = per_text_s
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _serve(self, n):
+        with self._slots:
+            with self._lock:
+                self.requests += 1
+            time.sleep(self.request_s + self.per_text_s * n)
+
+    def embed_one(self, text):
+        self._serve(1)
+        return [float(len(text))]
+
+    def embed_many(self, texts):
+        self._serve(len(texts))
+        return [[float(len(t))] for t in texts]
+
+
+def drive(embed, callers, per_caller, seed=7):
+    rng = random.Random(seed)
+    work = [[rng.choice(QUERIES) for _ in range(per_caller)] for _ in range(callers)]
+    latencies = []
+    lock = threading.Lock()
+
+    def caller(queries):
+        mine = []
+        for q in queries:
+            start = time.perf_counter()
+            vector = embed(q)
+            mine.append(time.perf_counter() - start)
+            if vector != [float(len(q))]:
+                raise AssertionError(f"wrong vector for {q!r}")
+        with lock:
+            latencies.extend(mine)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        for future in [pool.submit(caller, w) for w in work]:
+            future.result()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "queries_per_s": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1),
+    }
+
+
+def run(sizes, per_caller, args):
+    report = {}
+    for callers in sizes:
+        direct_upstream = SimulatedBedrock(args.upstream_concurrency, args.request_ms / 1000, args.per_text_ms / 1000)
+        direct = drive(direct_upstream.embed_one, callers, per_caller)
+        direct["upstream_requests"] = direct_upstream.requests
+
+        batched_upstream = SimulatedBedrock(args.upstream_concurrency, args.request_ms / 1000, args.per_text_ms / 1000)
+        if args.model == "cohere":
+            batcher = embedding_batcher.EmbeddingBatcher(
+                embed_many=batched_upstream.embed_many, window=args.window_ms / 1000, max_batch=args.max_batch,
+            )
+        else:
+            batcher = embedding_batcher.EmbeddingBatcher(
+                embed_one=batched_upstream.embed_one, window=args.window_ms / 1000, max_batch=args.max_batch,
+            )
+        batched = drive(batcher.embed, callers, per_caller)
+        batched["upstream_requests"] = batched_upstream.requests
+
+        report[str(callers)] = {"direct": direct, "batched": batched}
+        print(
+            f"callers={callers:<5d} direct {direct['queries_per_s']:8.1f} q/s mean {direct['mean_ms']:7.1f} ms "
+            f"({direct['upstream_requests']} requests)  batched {batched['queries_per_s']:8.1f} q/s "
+            f"mean {batched['mean_ms']:7.1f} ms ({batched['upstream_requests']} requests)"
+        )
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Embedding micro-batcher throughput benchmark")
+    parser.add_argument("--callers", default="1,16,64,256", help="comma list of concurrent callers")
+    parser.add_argument("--queries", type=int, default=20, help="queries per caller")
+    parser.add_argument("--model", choices=("cohere", "titan"), default="cohere",
+                        help="cohere: one request per batch; titan: one request per distinct text")
+    parser.add_argument("--upstream-concurrency", type=int, default=8, help="requests the endpoint serves at once")
+    parser.add_argument("--request-ms", type=float, default=40.0, help="simulated latency per request")
+    parser.add_argument("--per-text-ms", type=float, default=0.5, help="extra latency per text in a batch")
+    parser.add_argument("--window-ms", type=float, default=embedding_batcher.EMBED_BATCH_WINDOW_MS)
+    parser.add_argument("--max-batch", type=int, default=embedding_batcher.EMBED_BATCH_MAX)
+    parser.add_argument("--output", help="result file (default: benchmarks/results/embedding_batcher-<commit>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(s) for s in args.callers.split(",") if s.strip()]
+    results = run(sizes, args.queries, args)
+    commit = git_commit()
+    report = {
+        "benchmark": "embedding_batcher",
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"embedding_batcher-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
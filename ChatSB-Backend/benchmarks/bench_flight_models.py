@@ -0,0 +1,144 @@
+# benchmarks/bench_flight_models.py
+"""
+Memory benchmark for the compact flight cache representation: holds N
+cached searches (one search response plus a booking response per
+itinerary, all from the flight fixture) as plain JSON dicts and as
+utils/flight_models.py objects, and compares retained bytes.
+
+Run from the ChatSB-Backend directory:
+
+    python -m benchmarks.bench_flight_models
+    python -m benchmarks.bench_flight_models --searches 100,1000 --repeat 3
+
+Every payload is decoded from JSON text separately, like responses
+arriving from SerpAPI or the shared MongoDB tier. Also reports the CPU
+time of pack() and unpack() per payload and checks that the round trip
+is lossless.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from datetime import datetime, timezone
+
+from benchmarks.stubs import FLIGHT_FIXTURE
+from benchmarks.load_test import RESULTS_DIR, git_commit
+from utils import flight_models
+
+
+def payload_texts(searches):
+    """
+    JSON texts of `searches` search responses and their booking responses.
+    Tokens differ per search so no two payloads are identical.
+    """
+    with open(FLIGHT_FIXTURE, encoding="utf-8") as f:
+        entries = json.load(f)
+    texts = []
+    for s in range(searches):
+        flights = [
+            {"flights": e["flight_data"], "price": 5000 + i, "type": "One way", "booking_token": f"token-{s}-{i}"}
+            for i, e in enumerate(entries)
+        ]
+        texts.append(json.dumps({"best_flights": flights[:3], "other_flights": flights[3:]}))
+        texts.extend(
+            json.dumps({"selected_flights": [{"flights": e["flight_data"]}], "booking_options": e["booking_options"]})
+            for e in entries
+        )
+    return texts
+
+
+def retained_bytes(build):
+    """
+    Bytes still allocated after `build()` returns (its result is kept alive).
+    """
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    kept = build()
+    gc.collect()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return after - before, peak - before
+
+
+def cpu_time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.process_time()
+        fn()
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def run(sizes, repeat):
+    report = {}
+    for searches in sizes:
+        texts = payload_texts(searches)
+        dicts = [json.loads(t) for t in texts]
+        packed = [flight_models.pack(d) for d in dicts]
+        if [flight_models.unpack(p) for p in packed] != dicts:
+            raise AssertionError("compact round trip is not lossless")
+        del dicts, packed
+
+        dict_bytes, dict_peak = retained_bytes(lambda: [json.loads(t) for t in texts])
+        compact_bytes, compact_peak = retained_bytes(lambda: [flight_models.pack(json.loads(t)) for t in texts])
+        sample = [json.loads(t) for t in texts[: 21 * min(searches, 10)]]
+        sample_packed = [flight_models.pack(d) for d in sample]
+        pack_t = cpu_time(lambda: [flight_models.pack(d) for d in sample], repeat)
+        unpack_t = cpu_time(lambda: [flight_models.unpack(p) for p in sample_packed], repeat)
+
+        entry = {
+            "payloads": len(texts),
+            "dict_bytes": dict_bytes,
+            "compact_bytes": compact_bytes,
+            "saving": round(1 - compact_bytes / dict_bytes, 3),
+            "dict_peak_bytes": dict_peak,
+            "compact_peak_bytes": compact_peak,
+            "pack_us_per_payload": round(pack_t / len(sample) * 1e6, 1),
+            "unpack_us_per_payload": round(unpack_t / len(sample) * 1e6, 1),
+        }
+        report[str(searches)] = entry
+        print(
+            f"searches={searches:<6d} dict {dict_bytes / 2**20:8.1f} MiB  compact {compact_bytes / 2**20:8.1f} MiB  "
+            f"(-{entry['saving']:.0%})  pack {entry['pack_us_per_payload']} us  "
+            f"unpack {entry['unpack_us_per_payload']} us per payload"
+        )
+        del texts
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compact flight cache memory benchmark")
+    parser.add_argument("--searches", default="100,500", help="comma list of cached search counts")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs for pack/unpack; best is reported")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/flight_models-<commit>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(s) for s in args.searches.split(",") if s.strip()]
+    results = run(sizes, args.repeat)
+    commit = git_commit()
+    report = {
+        "benchmark": "flight_models",
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {"searches": sizes, "repeat": args.repeat},
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"flight_models-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
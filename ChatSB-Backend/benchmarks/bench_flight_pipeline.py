@@ -0,0 +1,261 @@
+# benchmarks/bench_flight_pipeline.py
+"""
+Microbenchmarks for the CPU-only stages of the flight tool, comparing the
+original implementations (copied verbatim below as `baseline_*`) with
+utils/flight_pipeline.py on payloads synthesized from the flight fixture.
+
+Run from the ChatSB-Backend directory:
+
+    python -m benchmarks.bench_flight_pipeline
+    python -m benchmarks.bench_flight_pipeline --sizes 10000,100000,1000000 --repeat 3
+
+Per stage it reports best-of-N CPU time (time.process_time) and, from one
+extra traced run, tracemalloc peak bytes and allocated blocks.
+"""
+import os
+import re
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from datetime import datetime, timezone
+
+from benchmarks.stubs import FLIGHT_FIXTURE
+from benchmarks.load_test import RESULTS_DIR, git_commit
+from utils import flight_pipeline
+from utils.logger import get_logger, debug_sampled
+
+logger = get_logger("bench_flight_pipeline")
+
+
+# ------------------------------------------------------------ baseline code
+def baseline_normalize_price(value):
+    if not value:
+        return None
+    cleaned = re.sub(r"[^\d]", "", str(value))
+    return cleaned if cleaned.isdigit() else None
+
+
+def baseline_is_flight_under_budget(flight, max_price):
+    if not max_price:
+        return True
+    cleaned_max_price = baseline_normalize_price(max_price)
+    if not cleaned_max_price:
+        return True
+    price_amount = None
+    price_obj = flight.get("price", {})
+    if isinstance(price_obj, dict):
+        price_amount = price_obj.get("amount")
+    if price_amount is None:
+        price_amount = flight.get("price_amount")
+    if price_amount:
+        try:
+            price_int = int(str(price_amount).replace(",", ""))
+            is_under = price_int <= int(cleaned_max_price)
+            debug_sampled(logger, "💰 Flight price %s %s max %s", price_int, "≤" if is_under else ">", cleaned_max_price)
+            return is_under
+        except (ValueError, TypeError):
+            debug_sampled(logger, "⚠️ Could not parse price: %s, including flight", price_amount)
+            return True
+    debug_sampled(logger, "⚠️ No price found for flight, including anyway")
+    return True
+
+
+def baseline_filter(flights, max_price):
+    kept = []
+    for flight in flights:
+        if baseline_is_flight_under_budget(flight, max_price):
+            kept.append(flight)
+    return kept
+
+
+def baseline_merge(results):
+    best_flights = results.get("best_flights", [])
+    other_flights = results.get("other_flights", [])
+    return best_flights + other_flights
+
+
+def baseline_enhance(booking_responses):
+    enhanced = []
+    for booking_options in booking_responses:
+        selected = booking_options.get("selected_flights", [])
+        booking_opts = booking_options.get("booking_options", [])
+        flight_obj = []
+        if selected and isinstance(selected, list):
+            first = selected[0]
+            if isinstance(first, dict) and first.get("flights"):
+                flight_obj = first.get("flights")
+        enhanced.append({"flight_data": flight_obj, "booking_options": booking_opts})
+    return enhanced
+
+
+def baseline_parse_user_max_price(value):
+    raw_price = str(value).lower().strip()
+    if any(phrase in raw_price for phrase in ["any", "no budget", "no preference", "unlimited", "no limit"]):
+        return None
+    cleaned = re.sub(r"[^\d]", "", raw_price)
+    return cleaned if cleaned else None
+
+
+# ------------------------------------------------------------ optimized code
+def optimized_enhance(booking_responses):
+    return [flight_pipeline.build_enhanced_flight(b) for b in booking_responses]
+
+
+def optimized_parse_user_max_price(value):
+    return flight_pipeline.parse_user_max_price(value)[0]
+
+
+# ------------------------------------------------------------ payloads
+def synthesize(n, seed=7):
+    """
+    Build an n-flight SerpAPI search result, n booking responses, n price
+    strings and n user budget strings from the fixture's 20 itineraries.
+    Prices are jittered so roughly half the flights are over budget.
+    """
+    with open(FLIGHT_FIXTURE, encoding="utf-8") as f:
+        entries = json.load(f)
+    rng = random.Random(seed)
+    formats = ("₹ {:,}", "Rs{}", "{}", "INR {:,}")
+    flights, bookings, price_strings = [], [], []
+    for i in range(n):
+        entry = entries[i % len(entries)]
+        price = rng.randint(3500, 12000)
+        flights.append({
+            "flights": entry["flight_data"],
+            "price": {"amount": f"{price:,}"},
+            "booking_token": f"token-{i}",
+        })
+        bookings.append({
+            "selected_flights": [{"flights": entry["flight_data"]}],
+            "booking_options": entry["booking_options"],
+        })
+        price_strings.append(formats[i % len(formats)].format(price))
+    user_budgets = [rng.choice(("under 8000", "Rs 7,500", "₹6000", "any price", "no budget", "9000")) for _ in range(n)]
+    split = max(1, n // 10)
+    results = {"best_flights": flights[:split], "other_flights": flights[split:]}
+    return results, flights, bookings, price_strings, user_budgets
+
+
+def stages(payload, max_price="8000"):
+    results, flights, bookings, price_strings, user_budgets = payload
+    return {
+        "normalize_price": (
+            lambda: [baseline_normalize_price(p) for p in price_strings],
+            lambda: [flight_pipeline.normalize_price(p) for p in price_strings],
+        ),
+        "budget_filter": (
+            lambda: baseline_filter(flights, max_price),
+            lambda: flight_pipeline.filter_under_budget(flights, max_price),
+        ),
+        "merge_best_other": (
+            lambda: baseline_merge(results),
+            lambda: flight_pipeline.merge_flight_results(results),
+        ),
+        "selected_flights": (
+            lambda: baseline_enhance(bookings),
+            lambda: optimized_enhance(bookings),
+        ),
+        "rag_agent_budget": (
+            lambda: [baseline_parse_user_max_price(b) for b in user_budgets],
+            lambda: [optimized_parse_user_max_price(b) for b in user_budgets],
+        ),
+    }
+
+
+# ------------------------------------------------------------ measurement
+def cpu_time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.process_time()
+        fn()
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def allocations(fn):
+    gc.collect()
+    tracemalloc.start()
+    before_blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    result = fn()
+    after_blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak, after_blocks - before_blocks
+
+
+def check_equivalence(baseline, optimized):
+    a, b = baseline(), optimized()
+    if a != b:
+        raise AssertionError("optimized stage output differs from baseline")
+
+
+def run(sizes, repeat, trace_allocations=True):
+    report = {}
+    for n in sizes:
+        payload = synthesize(n)
+        per_stage = {}
+        for name, (baseline, optimized) in stages(payload).items():
+            check_equivalence(baseline, optimized)
+            base_t = cpu_time(baseline, repeat)
+            opt_t = cpu_time(optimized, repeat)
+            entry = {
+                "baseline_cpu_ms": round(base_t * 1000.0, 3),
+                "optimized_cpu_ms": round(opt_t * 1000.0, 3),
+                "speedup": round(base_t / opt_t, 2) if opt_t else None,
+            }
+            if trace_allocations:
+                base_peak, base_blocks = allocations(baseline)
+                opt_peak, opt_blocks = allocations(optimized)
+                entry.update({
+                    "baseline_peak_bytes": base_peak,
+                    "optimized_peak_bytes": opt_peak,
+                    "baseline_blocks": base_blocks,
+                    "optimized_blocks": opt_blocks,
+                })
+            per_stage[name] = entry
+            print(
+                f"n={n:<8d} {name:18s} baseline {entry['baseline_cpu_ms']:10.2f} ms  "
+                f"optimized {entry['optimized_cpu_ms']:10.2f} ms  x{entry['speedup']}"
+            )
+        report[str(n)] = per_stage
+        del payload
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Flight post-processing microbenchmarks")
+    parser.add_argument("--sizes", default="10000,100000", help="comma list of flight counts (e.g. 10000,100000,1000000)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per stage; best is reported")
+    parser.add_argument("--no-alloc", action="store_true", help="skip tracemalloc runs (much faster at 1M)")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/flight_pipeline-<commit>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    results = run(sizes, args.repeat, trace_allocations=not args.no_alloc)
+    commit = git_commit()
+    report = {
+        "benchmark": "flight_pipeline",
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {"sizes": sizes, "repeat": args.repeat, "allocations": not args.no_alloc},
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"flight_pipeline-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# benchmarks/eval_retrieval.py
+"""
+Offline retrieval quality vs latency evaluation for the offer retriever.
+Every query in a labeled set (benchmarks/data/retrieval_eval.jsonl, one
+{"query", "relevant": [coupon codes]} per line) is run against the deals
+CSV with each retriever configuration, and recall@k, MRR and retrieval
+latency are reported per configuration.
+
+Run from the ChatSB-Backend directory:
+
+    python -m benchmarks.eval_retrieval
+    python -m benchmarks.eval_retrieval --k 3,5,10 --thresholds 0,0.2,0.4 --embedding-latency-ms 60
+    python -m benchmarks.eval_retrieval --embeddings bedrock --thresholds 0.5,0.75
+
+Retrievers mirror utils/rag_retriever.py:
+
+- vector:  cosine top-k over the offer strings, dropping hits below the
+           score threshold (what Atlas $vectorSearch does)
+- lexical: utils/lexical_index.py BM25 only
+- hybrid:  keyword-only answer when the query is decisive, otherwise
+           vector and BM25 hits fused by reciprocal rank fusion
+
+`--embeddings hash` (default) uses the deterministic hashed bag-of-words
+stand-in from benchmarks/stubs.py, so runs are reproducible offline. Its
+cosine scores run far lower than Titan's, so thresholds tuned on it do
+not carry over; `--embeddings bedrock` uses EMBEDDING_MODEL_ID for that.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks.stubs import DEALS_CSV, hash_embed
+from benchmarks.load_test import RESULTS_DIR, git_commit
+from utils import lexical_index
+from utils.create_vector_store import generate_offer_string
+
+EVAL_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "retrieval_eval.jsonl")
+
+
+def load_corpus(csv_path):
+    """
+    (offer string, metadata) per deal, as create_vector_store stores them.
+    """
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    return [(generate_offer_string(row), {k: (v or "").strip() for k, v in row.items()}) for row in rows]
+
+
+def load_eval_set(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def make_embedder(kind, latency_s=0.0):
+    """
+    Returns (embed_documents, embed_query) for `kind` ("hash" or "bedrock").
+    Hash query embeddings sleep `latency_s` to stand in for the Bedrock
+    round trip.
+    """
+    if kind == "hash":
+        def embed_query(text):
+            if latency_s > 0:
+                time.sleep(latency_s)
+            return hash_embed(text)
+
+        return (lambda texts: [hash_embed(t) for t in texts]), embed_query
+    from langchain_aws import BedrockEmbeddings
+
+    bedrock = BedrockEmbeddings(
+        model_id=os.getenv("EMBEDDING_MODEL_ID"),
+        region_name=os.getenv("AWS_DEFAULT_REGION"),
+    )
+    return bedrock.embed_documents, bedrock.embed_query
+
+
+class Retrievers:
+    """
+    The three retrieval paths over one in-memory corpus. Each returns the
+    ranked doc indices for a query.
+    """
+
+    def __init__(self, corpus, embed_documents, embed_query):
+        self.corpus = corpus
+        self.embed_query = embed_query
+        matrix = np.asarray(embed_documents([text for text, _ in corpus]), dtype=np.float64)
+        self.matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        self.index = lexical_index.BM25Index.build(corpus)
+        self.embedding_calls = 0
+
+    def vector(self, query, k, threshold):
+        self.embedding_calls += 1
+        q = np.asarray(self.embed_query(query), dtype=np.float64)
+        scores = self.matrix @ (q / max(np.linalg.norm(q), 1e-12))
+        order = np.argsort(-scores)[:k]
+        return [int(i) for i in order if scores[i] >= threshold]
+
+    def lexical(self, query, k, threshold=None):
+        return [i for i, _ in self.index.search(query, k)]
+
+    def hybrid(self, query, k, threshold):
+        hits = self.index.decisive(query, k)
+        if hits is not None:
+            return [i for i, _ in hits]
+        return lexical_index.rrf([self.vector(query, k, threshold), self.lexical(query, k)])[:k]
+
+
+def evaluate(retrieve, queries, codes, k):
+    """
+    Mean recall@k and MRR over the labeled queries, plus latency stats.
+    """
+    recalls, reciprocal_ranks, latencies, returned = [], [], [], []
+    for item in queries:
+        relevant = set(item["relevant"])
+        start = time.perf_counter()
+        ranked = retrieve(item["query"])[:k]
+        latencies.append(time.perf_counter() - start)
+        found = [codes[i] for i in ranked]
+        returned.append(len(found))
+        recalls.append(len(relevant.intersection(found)) / len(relevant))
+        rank = next((r for r, code in enumerate(found, 1) if code in relevant), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+    latencies.sort()
+    return {
+        "recall_at_k": round(float(np.mean(recalls)), 3),
+        "mrr": round(float(np.mean(reciprocal_ranks)), 3),
+        "mean_returned": round(float(np.mean(returned)), 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 3),
+    }
+
+
+def run(retrievers, queries, ks, thresholds):
+    codes = [meta.get("coupon_code", "") for _, meta in retrievers.corpus]
+    results = []
+    for mode in ("vector", "lexical", "hybrid"):
+        for k in ks:
+            # BM25 has no score threshold
+            for threshold in (thresholds if mode != "lexical" else [None]):
+                retrievers.embedding_calls = 0
+                fn = getattr(retrievers, mode)
+                entry = {"retriever": mode, "k": k, "threshold": threshold}
+                entry.update(evaluate(lambda q: fn(q, k, threshold), queries, codes, k))
+                entry["embedding_calls"] = retrievers.embedding_calls
+                results.append(entry)
+                print(
+                    f"{mode:<8s} k={k:<3d} threshold={'-' if threshold is None else threshold:<5}  "
+                    f"recall@k {entry['recall_at_k']:.3f}  MRR {entry['mrr']:.3f}  "
+                    f"returned {entry['mean_returned']:4.1f}  p50 {entry['p50_ms']:7.3f} ms  "
+                    f"p95 {entry['p95_ms']:7.3f} ms  embeddings {entry['embedding_calls']}"
+                )
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offer retrieval quality vs latency evaluation")
+    parser.add_argument("--csv", default=DEALS_CSV, help="deals CSV to index")
+    parser.add_argument("--queries", default=EVAL_SET, help="labeled query set (JSON lines)")
+    parser.add_argument("--k", default="3,5,10", help="comma list of k values")
+    parser.add_argument("--thresholds", default="0,0.2,0.4", help="comma list of vector score thresholds")
+    parser.add_argument("--embeddings", choices=("hash", "bedrock"), default="hash")
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0,
+                        help="simulated query embedding latency for --embeddings hash")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/eval_retrieval-<commit>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    ks = [int(k) for k in args.k.split(",") if k.strip()]
+    thresholds = [float(t) for t in args.thresholds.split(",") if t.strip()]
+    corpus = load_corpus(args.csv)
+    queries = load_eval_set(args.queries)
+    retrievers = Retrievers(corpus, *make_embedder(args.embeddings, args.embedding_latency_ms / 1000.0))
+    print(f"{len(queries)} labeled queries over {len(corpus)} offers ({args.embeddings} embeddings)")
+    results = run(retrievers, queries, ks, thresholds)
+    commit = git_commit()
+    report = {
+        "benchmark": "eval_retrieval",
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {"csv": os.path.relpath(args.csv), "queries": os.path.relpath(args.queries),
+                   "k": ks, "thresholds": thresholds, "embeddings": args.embeddings,
+                   "embedding_latency_ms": args.embedding_latency_ms},
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"eval_retrieval-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# benchmarks/load_test.py
+"""
+End-to-end load test of the FastAPI app with every upstream stubbed
+(see benchmarks/stubs.py). Starts uvicorn in-process, drives /chat and
+/get_latest_deals at a fixed concurrency and writes a JSON report.
+
+Run from the ChatSB-Backend directory:
+
+    python -m benchmarks.load_test --concurrency 32 --requests 500
+    python -m benchmarks.load_test --endpoints chat --llm-latency-ms 300 --serpapi-latency-ms 800
+"""
+import os
+import sys
+import json
+import math
+import time
+import socket
+import asyncio
+import argparse
+import threading
+import subprocess
+from datetime import datetime, timezone
+
+from benchmarks import stubs
+
+RESULTS_DIR = os.path.join(stubs.BACKEND_DIR, "benchmarks", "results")
+
+# Conversation mix sent to /chat, cycled in order
+CHAT_PAYLOADS = [
+    {"chat_history": [{"role": "human", "content": "Show me flights from DEL to MAA on 2025-09-30 under 8000"}]},
+    {"chat_history": [{"role": "human", "content": "Any HDFC credit card offers on MakeMyTrip for domestic flights?"}]},
+    {"chat_history": [{"role": "human", "content": "hello"}]},
+    {"chat_history": [
+        {"role": "human", "content": "I want to fly Delhi to Chennai on the 30th"},
+        {"role": "ai", "content": "Sure, I can help you with that! What is your maximum price?"},
+        {"role": "human", "content": "flights with no budget please"},
+    ]},
+]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the ChatSB backend")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests per endpoint")
+    parser.add_argument("--endpoints", default="chat,deals", help="comma list of: chat, deals")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--serpapi-latency-ms", type=float, default=0.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout (s)")
+    parser.add_argument("--max-shed-rate", type=float, default=0.0,
+                        help="fail if more than this fraction of SerpAPI calls were shed by the scheduler")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/load_test-<commit>.json)")
+    return parser.parse_args(argv)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=stubs.BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app, port):
+    import uvicorn
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, name="bench-uvicorn", daemon=True)
+    thread.start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline or not thread.is_alive():
+            raise RuntimeError("uvicorn did not start")
+        time.sleep(0.02)
+    return server, thread
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = math.ceil(pct / 100.0 * len(sorted_values)) - 1
+    return sorted_values[max(0, min(rank, len(sorted_values) - 1))]
+
+
+async def drive(client, method, path, payloads, total, concurrency):
+    """
+    Issue `total` requests with at most `concurrency` in flight; returns
+    per-request latencies (s), status counts and wall time.
+    """
+    latencies = []
+    statuses = {}
+    errors = 0
+    next_idx = 0
+
+    async def worker():
+        nonlocal next_idx, errors
+        while next_idx < total:
+            idx = next_idx
+            next_idx += 1
+            payload = payloads[idx % len(payloads)] if payloads else None
+            start = time.perf_counter()
+            try:
+                resp = await client.request(method, path, json=payload)
+                statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+                if resp.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+                statuses["exception"] = statuses.get("exception", 0) + 1
+            latencies.append(time.perf_counter() - start)
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, errors, time.perf_counter() - wall_start
+
+
+def summarize(latencies, statuses, errors, wall):
+    ordered = sorted(latencies)
+    ms = lambda v: round(v * 1000.0, 3) if v is not None else None
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "status_codes": {str(k): v for k, v in statuses.items()},
+        "wall_seconds": round(wall, 4),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "latency_ms": {
+            "mean": ms(sum(ordered) / len(ordered)) if ordered else None,
+            "p50": ms(percentile(ordered, 50)),
+            "p95": ms(percentile(ordered, 95)),
+            "p99": ms(percentile(ordered, 99)),
+            "max": ms(ordered[-1]) if ordered else None,
+        },
+    }
+
+
+async def run_benchmarks(base_url, args):
+    import httpx
+
+    targets = {
+        "chat": ("POST", "/chat", CHAT_PAYLOADS),
+        "deals": ("GET", "/get_latest_deals", None),
+    }
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        for name in [e.strip() for e in args.endpoints.split(",") if e.strip()]:
+            if name not in targets:
+                raise SystemExit(f"unknown endpoint '{name}' (expected one of {', '.join(targets)})")
+            method, path, payloads = targets[name]
+            if args.warmup:
+                await drive(client, method, path, payloads, args.warmup, min(args.concurrency, args.warmup))
+            results[name] = summarize(*await drive(client, method, path, payloads, args.requests, args.concurrency))
+            results[name]["path"] = path
+    return results
+
+
+def scheduler_report():
+    """
+    SerpAPI scheduler decisions and booking lookups that came back empty
+    during the run (read from the in-process metrics).
+    """
+    from utils import get_flights, serpapi_scheduler
+
+    decisions = {}
+    for labels, count in serpapi_scheduler.SCHEDULER_DECISIONS.items():
+        labels = dict(labels)
+        decisions.setdefault(labels.get("priority"), {})[labels.get("outcome")] = count
+    shed = sum(n for outcomes in decisions.values() for outcome, n in outcomes.items() if outcome.startswith("shed_"))
+    total = sum(n for outcomes in decisions.values() for n in outcomes.values())
+    return {
+        "decisions": decisions,
+        "shed": shed,
+        "shed_rate": round(shed / total, 4) if total else 0.0,
+        "booking_unavailable": get_flights.BOOKING_UNAVAILABLE.value(),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stubs.install(
+        llm_latency_ms=args.llm_latency_ms,
+        serpapi_latency_ms=args.serpapi_latency_ms,
+        embedding_latency_ms=args.embedding_latency_ms,
+    )
+    import main as backend
+
+    port = free_port()
+    server, thread = start_server(backend.app, port)
+    try:
+        results = asyncio.run(run_benchmarks(f"http://127.0.0.1:{port}", args))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    commit = git_commit()
+    report = {
+        "benchmark": "load_test",
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "upstream_calls": dict(stubs.SERPAPI.calls),
+        "scheduler": scheduler_report(),
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"load_test-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    for name, res in results.items():
+        lat = res["latency_ms"]
+        print(
+            f"{name:6s} {res['requests']:6d} req  {res['throughput_rps']:8.1f} req/s  "
+            f"p50 {lat['p50']:8.1f} ms  p95 {lat['p95']:8.1f} ms  p99 {lat['p99']:8.1f} ms  errors {res['errors']}"
+        )
+    scheduler = report["scheduler"]
+    print(
+        f"serpapi shed {scheduler['shed']} ({scheduler['shed_rate']:.1%})  "
+        f"bookings unavailable {scheduler['booking_unavailable']}"
+    )
+    print(f"Results written to {output}")
+    if scheduler["shed_rate"] > args.max_shed_rate:
+        print(f"FAIL: shed rate {scheduler['shed_rate']:.1%} above --max-shed-rate {args.max_shed_rate:.1%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
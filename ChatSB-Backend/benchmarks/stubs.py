@@ -0,0 +1,511 @@
+# benchmarks/stubs.py
+"""
+Offline stand-ins for every external dependency of the backend so the real
+FastAPI app can be benchmarked without network access or credentials:
+
+- Gemini (`init_chat_model`)      -> FakeChatModel (keyword-routed tool calls)
+- Bedrock (`BedrockEmbeddings`)   -> HashEmbeddings (deterministic hashed bag-of-words)
+- SerpAPI (`serpapi.GoogleSearch`) -> FixtureGoogleSearch fed from the flight fixture
+- MongoDB (`mongoDB.connect_db`)  -> InMemoryClient seeded from data/deals_sample.csv
+- Atlas vector search             -> brute-force cosine over the in-memory collection
+
+Call install() BEFORE importing `main` or anything under `utils`.
+"""
+import os
+import re
+import csv
+import sys
+import json
+import math
+import time
+import zlib
+import types
+import asyncio
+import threading
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FLIGHT_FIXTURE = os.path.join(BACKEND_DIR, "flights_DEL_to_MAA_2025-09-30.json")
+DEALS_CSV = os.path.join(BACKEND_DIR, "benchmarks", "data", "deals_sample.csv")
+
+# Simulated upstream latencies (seconds); set through install()
+LATENCY = {"llm": 0.0, "serpapi": 0.0, "embedding": 0.0}
+
+_TOKEN_RE = re.compile(r"[a-z0-9₹]+")
+
+
+def _sleep(kind):
+    if LATENCY[kind] > 0:
+        time.sleep(LATENCY[kind])
+
+
+async def _asleep(kind):
+    if LATENCY[kind] > 0:
+        await asyncio.sleep(LATENCY[kind])
+
+
+# ---------------------------------------------------------------- embeddings
+def hash_embed(text: str, dim: int = 256):
+    """
+    Deterministic hashed bag-of-words vector (L2-normalised). crc32 keeps it
+    stable across processes, unlike hash().
+    """
+    vec = [0.0] * dim
+    for token in _TOKEN_RE.findall(str(text).lower()):
+        h = zlib.crc32(token.encode("utf-8"))
+        vec[h % dim] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def _cosine(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+def _make_embeddings_class():
+    from langchain_core.embeddings import Embeddings
+
+    class HashEmbeddings(Embeddings):
+        def __init__(self, *args, dim: int = 256, **kwargs):
+            self.dim = dim
+
+        def embed_documents(self, texts):
+            _sleep("embedding")
+            return [hash_embed(t, self.dim) for t in texts]
+
+        def embed_query(self, text):
+            _sleep("embedding")
+            return hash_embed(text, self.dim)
+
+    return HashEmbeddings
+
+
+# ---------------------------------------------------------------- chat model
+class FakeChatModel:
+    """
+    Routes the last human message to a tool call the way Gemini would for
+    the benchmark prompts: flight searches, offer lookups or small talk.
+    """
+
+    _DIGITS = re.compile(r"\d{3,}")
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _respond(self, messages):
+        from langchain_core.messages import AIMessage
+
+        if isinstance(messages, str):
+            # rag_tool's formatting call: echo a numbered bold list
+            offers = [line for line in messages.splitlines() if "Take advantage" in line]
+            body = "\n".join(f"{i}. **{line.strip()}**" for i, line in enumerate(offers[:5], 1))
+            return AIMessage(content=body or "I couldn't find any offers for that query.")
+
+        text = ""
+        for msg in reversed(messages):
+            if getattr(msg, "type", "") == "human":
+                text = str(msg.content).lower()
+                break
+        if "flight" in text:
+            prices = self._DIGITS.findall(text.replace(",", ""))
+            args = {
+                "departure_id": "DEL",
+                "arrival_id": "MAA",
+                "departure_date": "2025-09-30",
+                "max_price": prices[-1] if prices else "no preference",
+            }
+            return AIMessage(content="", tool_calls=[
+                {"name": "get_flight_with_aggregator", "args": args, "id": "call_flights", "type": "tool_call"}
+            ])
+        if any(word in text for word in ("offer", "coupon", "deal", "discount", "cashback")):
+            return AIMessage(content="", tool_calls=[
+                {"name": "rag_tool", "args": {"query": text}, "id": "call_rag", "type": "tool_call"}
+            ])
+        return AIMessage(content="Hey there 👋 Looking for flight deals or want to search for flights today?")
+
+    def invoke(self, messages, *args, **kwargs):
+        _sleep("llm")
+        return self._respond(messages)
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        await _asleep("llm")
+        return self._respond(messages)
+
+
+def fake_init_chat_model(*args, **kwargs):
+    return FakeChatModel()
+
+
+# ---------------------------------------------------------------- SerpAPI
+def _load_fixture():
+    with open(FLIGHT_FIXTURE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _lowest_price(entry):
+    prices = [
+        opt.get("together", {}).get("price")
+        for opt in entry.get("booking_options", [])
+        if isinstance(opt.get("together", {}).get("price"), (int, float))
+    ]
+    return min(prices) if prices else None
+
+
+class FixtureSerpApi:
+    """
+    Replays the fixture as SerpAPI Google Flights responses. Search calls get
+    best/other flights with a booking_token per itinerary; booking calls get
+    the matching selected_flights + booking_options.
+    """
+
+    def __init__(self):
+        self.entries = _load_fixture()
+        self.calls = {"search": 0, "booking": 0}
+        self._lock = threading.Lock()
+
+    def respond(self, params):
+        token = params.get("booking_token")
+        with self._lock:
+            self.calls["booking" if token else "search"] += 1
+        if token:
+            idx = int(str(token).rsplit("-", 1)[-1]) % len(self.entries)
+            entry = self.entries[idx]
+            return {
+                "selected_flights": [{"flights": entry["flight_data"]}],
+                "booking_options": entry["booking_options"],
+            }
+
+        max_price = params.get("max_price")
+        flights = []
+        for idx, entry in enumerate(self.entries):
+            price = _lowest_price(entry)
+            if max_price and price is not None and price > int(max_price):
+                continue
+            flights.append({
+                "flights": entry["flight_data"],
+                "price": price,
+                "type": "One way",
+                "booking_token": f"bench-token-{idx}",
+            })
+        return {"best_flights": flights[:3], "other_flights": flights[3:]}
+
+
+SERPAPI = None
+
+
+def _make_serpapi_module():
+    module = types.ModuleType("serpapi")
+
+    class GoogleSearch:
+        def __init__(self, params):
+            self.params = params
+
+        def get_dict(self):
+            _sleep("serpapi")
+            return SERPAPI.respond(self.params)
+
+    module.GoogleSearch = GoogleSearch
+    return module
+
+
+async def _serpapi_http_handler(request):
+    """
+    httpx.MockTransport handler serving the async SerpAPI client.
+    """
+    import httpx
+
+    await _asleep("serpapi")
+    return httpx.Response(200, json=SERPAPI.respond(dict(request.url.params)))
+
+
+# ---------------------------------------------------------------- MongoDB
+class InMemoryCursor(list):
+    def batch_size(self, n):
+        return self
+
+    def limit(self, n):
+        return InMemoryCursor(self[:n]) if n else self
+
+
+class InMemoryCollection:
+    """
+    The subset of pymongo's Collection API the backend touches.
+    Filters support plain equality only.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.docs = []
+        self._lock = threading.Lock()
+        self._next_id = 1
+
+    @staticmethod
+    def _matches(doc, flt):
+        return all(doc.get(k) == v for k, v in (flt or {}).items())
+
+    @staticmethod
+    def _project(doc, projection):
+        if not projection:
+            return dict(doc)
+        include = {k for k, v in projection.items() if v and k != "_id"}
+        if include:
+            out = {k: doc[k] for k in include if k in doc}
+            if projection.get("_id", 1) and "_id" in doc:
+                out["_id"] = doc["_id"]
+            return out
+        return {k: v for k, v in doc.items() if projection.get(k, 1)}
+
+    def find(self, flt=None, projection=None, **kwargs):
+        with self._lock:
+            docs = [self._project(d, projection) for d in self.docs if self._matches(d, flt)]
+        return InMemoryCursor(docs)
+
+    def find_one(self, flt=None, projection=None, **kwargs):
+        found = self.find(flt, projection)
+        return found[0] if found else None
+
+    def insert_one(self, doc):
+        with self._lock:
+            doc.setdefault("_id", self._next_id)
+            self._next_id += 1
+            self.docs.append(doc)
+        return types.SimpleNamespace(inserted_id=doc["_id"])
+
+    def insert_many(self, docs):
+        return types.SimpleNamespace(inserted_ids=[self.insert_one(d).inserted_id for d in docs])
+
+    def replace_one(self, flt, doc, upsert=False):
+        with self._lock:
+            for i, existing in enumerate(self.docs):
+                if self._matches(existing, flt):
+                    doc.setdefault("_id", existing["_id"])
+                    self.docs[i] = doc
+                    return types.SimpleNamespace(matched_count=1)
+        if upsert:
+            self.insert_one({**flt, **doc})
+        return types.SimpleNamespace(matched_count=0)
+
+    def delete_many(self, flt):
+        with self._lock:
+            before = len(self.docs)
+            self.docs = [d for d in self.docs if not self._matches(d, flt)]
+            return types.SimpleNamespace(deleted_count=before - len(self.docs))
+
+    def count_documents(self, flt=None):
+        return len(self.find(flt))
+
+    def estimated_document_count(self):
+        return len(self.docs)
+
+    def create_index(self, *args, **kwargs):
+        return "stub_index"
+
+
+class InMemoryDatabase(dict):
+    def __missing__(self, name):
+        coll = self[name] = InMemoryCollection(name)
+        return coll
+
+
+class InMemoryClient(dict):
+    def __missing__(self, name):
+        db = self[name] = InMemoryDatabase()
+        return db
+
+    def close(self):
+        pass
+
+
+MONGO = InMemoryClient()
+
+
+class AsyncInMemoryCursor:
+    def __init__(self, docs):
+        self._docs = list(docs)
+
+    def batch_size(self, n):
+        return self
+
+    async def __aiter__(self):
+        for doc in self._docs:
+            yield doc
+
+
+class AsyncInMemoryCollection:
+    """
+    pymongo AsyncCollection facade over an InMemoryCollection. aggregate()
+    understands the $vectorSearch pipeline used by mongoDB.vector_search_async.
+    """
+
+    def __init__(self, sync):
+        self.sync = sync
+
+    def find(self, flt=None, projection=None, **kwargs):
+        return AsyncInMemoryCursor(self.sync.find(flt, projection))
+
+    async def find_one(self, flt=None, projection=None, **kwargs):
+        return self.sync.find_one(flt, projection)
+
+    async def aggregate(self, pipeline):
+        docs = self.sync.find({})
+        for stage in pipeline:
+            if "$vectorSearch" in stage:
+                spec = stage["$vectorSearch"]
+                scored = [
+                    dict(doc, score=_cosine(spec["queryVector"], doc[spec["path"]]))
+                    for doc in docs if spec["path"] in doc
+                ]
+                scored.sort(key=lambda d: d["score"], reverse=True)
+                docs = scored[: spec["limit"]]
+            elif "$project" in stage:
+                dropped = {k for k, v in stage["$project"].items() if v == 0}
+                docs = [{k: v for k, v in doc.items() if k not in dropped} for doc in docs]
+            # $match on score is ignored, like InMemoryRetriever's threshold
+        return AsyncInMemoryCursor(docs)
+
+
+class AsyncInMemoryClient:
+    def __init__(self, sync):
+        self.sync = sync
+
+    def __getitem__(self, name):
+        sync_db = self.sync[name]
+        return _AsyncInMemoryDatabase(sync_db)
+
+    async def close(self):
+        pass
+
+
+class _AsyncInMemoryDatabase:
+    def __init__(self, sync):
+        self.sync = sync
+
+    def __getitem__(self, name):
+        return AsyncInMemoryCollection(self.sync[name])
+
+
+ASYNC_MONGO = AsyncInMemoryClient(MONGO)
+
+
+def _make_vector_store_class():
+    from langchain_core.documents import Document
+
+    class InMemoryRetriever:
+        def __init__(self, store, search_kwargs):
+            self.store = store
+            self.k = (search_kwargs or {}).get("k", 4)
+
+        def invoke(self, query, *args, **kwargs):
+            # Threshold is ignored: hashed vectors score far lower than
+            # Titan embeddings, and the benchmark measures cost, not quality.
+            qvec = self.store.embedding.embed_query(query)
+            scored = []
+            for doc in self.store.collection.find({}):
+                if "embedding" in doc:
+                    scored.append((_cosine(qvec, doc["embedding"]), doc))
+            scored.sort(key=lambda pair: pair[0], reverse=True)
+            return [
+                Document(
+                    page_content=doc.get("text", ""),
+                    metadata={k: v for k, v in doc.items() if k not in ("text", "embedding", "_id")},
+                )
+                for _, doc in scored[: self.k]
+            ]
+
+        async def ainvoke(self, query, *args, **kwargs):
+            return await asyncio.to_thread(self.invoke, query)
+
+    class InMemoryVectorSearch:
+        def __init__(self, embedding=None, collection=None, index_name=None, **kwargs):
+            self.embedding = embedding
+            self.collection = collection
+
+        def as_retriever(self, search_type=None, search_kwargs=None, **kwargs):
+            return InMemoryRetriever(self, search_kwargs)
+
+        def add_documents(self, documents, **kwargs):
+            vectors = self.embedding.embed_documents([d.page_content for d in documents])
+            self.collection.insert_many([
+                {"text": d.page_content, "embedding": v, **d.metadata}
+                for d, v in zip(documents, vectors)
+            ])
+
+    return InMemoryVectorSearch
+
+
+def seed_deals(collection, csv_path=DEALS_CSV):
+    """
+    Load the sample deals into the in-memory collection in the same shape
+    create_vector_store writes: offer string as `text`, metadata flattened.
+    """
+    from utils.create_vector_store import generate_offer_string
+
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    docs = []
+    for row in rows:
+        text = generate_offer_string(row)
+        doc = {k: (v or "").strip() for k, v in row.items()}
+        doc["emi"] = 1 if doc.get("emi", "").lower() == "y" else 0
+        doc["text"] = text
+        doc["embedding"] = hash_embed(text)
+        docs.append(doc)
+    collection.insert_many(docs)
+    return len(docs)
+
+
+# ---------------------------------------------------------------- install
+def install(llm_latency_ms=0, serpapi_latency_ms=0, embedding_latency_ms=0):
+    """
+    Patch every external dependency and seed the in-memory Mongo. Must run
+    before `main` / `utils.*` are imported.
+    """
+    global SERPAPI
+    LATENCY["llm"] = llm_latency_ms / 1000.0
+    LATENCY["serpapi"] = serpapi_latency_ms / 1000.0
+    LATENCY["embedding"] = embedding_latency_ms / 1000.0
+
+    if "main" in sys.modules or any(m.startswith("utils.") for m in sys.modules):
+        raise RuntimeError("benchmarks.stubs.install() must run before importing the app")
+
+    os.environ.update({
+        "SERPAPI_API_KEY": "bench-serpapi-key",
+        "SEARCH_ENGINE": "google_flights",
+        "LANGUAGE": "en",
+        "COUNTRY": "in",
+        "CURRENCY": "INR",
+        "FLIGHT_TYPE": "2",
+        "MONGO_DB_URI": "mongodb://bench-in-memory",
+        "DB_NAME": "bench",
+        "GOOGLE_API_KEY": "bench-google-key",
+        # Force /get_latest_deals onto the Mongo fallback path
+        "UPDATED_DEALS_CSV": os.path.join(BACKEND_DIR, "benchmarks", "data", "__missing__.csv"),
+    })
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # Keep background SerpAPI traffic out of the measurements unless asked for
+    os.environ.setdefault("PREFETCH_ENABLED", "false")
+
+    SERPAPI = FixtureSerpApi()
+    sys.modules["serpapi"] = _make_serpapi_module()
+
+    import langchain.chat_models
+    import langchain_aws
+    import langchain_mongodb
+
+    langchain.chat_models.init_chat_model = fake_init_chat_model
+    langchain_aws.BedrockEmbeddings = _make_embeddings_class()
+    langchain_mongodb.MongoDBAtlasVectorSearch = _make_vector_store_class()
+
+    from utils import mongoDB
+
+    mongoDB.connect_db = lambda: MONGO
+
+    async def connect_db_async():
+        return ASYNC_MONGO
+
+    mongoDB.connect_db_async = connect_db_async
+    seed_deals(MONGO[os.environ["DB_NAME"]]["flight_coupons"])
+
+    import httpx
+    from utils import serpapi_async
+
+    serpapi_async.configure(transport=httpx.MockTransport(_serpapi_http_handler))
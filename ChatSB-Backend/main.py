@@ -1,21 +1,76 @@
 # # main.py
 # main.py
-from typing import List
-from fastapi import FastAPI
+from typing import List, Optional
+from fastapi import FastAPI, Request
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 import os
 import csv
+import json
+import time
+import asyncio
+from datetime import date
 from dotenv import load_dotenv
-from utils import model_with_tool, mongoDB
+from utils import model_with_tool, mongoDB, metrics, tracing, prefetch, serpapi_async, get_flights, chat_sessions, admission, fare_analytics, profiling, deals_watcher, deal_catalogue
+from utils.flight_cache import TTLCache
+from utils.logger import get_logger
 
 load_dotenv()
 
+logger = get_logger("main")
+
 app = FastAPI()
 
 origins = ["*"]
 
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """
+    Bounded concurrency per lane (see utils/admission.py): requests past the
+    limit wait briefly in a queue, and are shed with 503 + Retry-After when
+    the queue is full or the wait runs out.
+    """
+    lane = admission.lane_for(request.url.path, request.method)
+    if lane is None:
+        return await call_next(request)
+    try:
+        async with lane.slot():
+            return await call_next(request)
+    except admission.AdmissionRejected as e:
+        logger.warning("🚦 Shedding %s: %s", request.url.path, e)
+        return JSONResponse(
+            content={"error": "Server is busy, please retry shortly"},
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
+# Registered after admission_control so it wraps it and also sees shed requests
+@app.middleware("http")
+async def http_metrics(request: Request, call_next):
+    """
+    Record latency, status and in-flight count per route template
+    (route paths keep label cardinality bounded).
+    """
+    metrics.HTTP_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - start, path=path)
+        metrics.HTTP_REQUESTS.inc(path=path, status=status)
+        metrics.HTTP_IN_FLIGHT.dec()
+
+
+# Registered last so it is the outermost middleware: shed 503s and every
+# other response get CORS headers, and preflights are answered before admission
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -26,88 +81,253 @@ app.add_middleware(
 
 # Request body model
 class ChatRequest(BaseModel):
-    chat_history: List[dict]  # [{"role": "human", "content": "..."}, {"role": "ai", "content": "..."}]
+    chat_history: Optional[List[dict]] = None  # [{"role": "human", "content": "..."}, {"role": "ai", "content": "..."}]
+    # Session mode: only the new message, plus the session_id returned by the previous turn
+    session_id: Optional[str] = None
+    message: Optional[str] = None
 
 CSV_FILE_PATH = os.getenv(
     "UPDATED_DEALS_CSV",
     r"C:\Users\newbr\OneDrive\Desktop\mongo_dataentry\updated_deals.csv"
 )
 
+# MongoDB deals catalogue, kept until the deals watcher reports a change;
+# it drops deals by itself as they expire
+DEALS_CACHE_TTL = float(os.getenv("DEALS_CACHE_TTL", "3600" if deals_watcher.DEALS_WATCH_ENABLED else "60"))
+_deals_cache = TTLCache(max_entries=1)
+deals_watcher.subscribe(lambda event: _deals_cache.clear())
+
+@app.on_event("startup")
+def start_background_jobs():
+    if prefetch.PREFETCH_ENABLED:
+        prefetch.prefetcher.start()
+    if deals_watcher.DEALS_WATCH_ENABLED:
+        deals_watcher.watcher.start()
+    if deal_catalogue.DEAL_PURGE_ENABLED:
+        deal_catalogue.purger.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    prefetch.prefetcher.stop()
+    deals_watcher.watcher.stop()
+    deal_catalogue.purger.stop()
+    await serpapi_async.close()
+    await mongoDB.close_async()
+
+
 @app.get("/")
 def home():
     return {"message": "its working fine :)"}
 
 
+@app.get("/metrics")
+def metrics_endpoint():
+    """
+    Prometheus scrape endpoint (text exposition format 0.0.4).
+    """
+    return PlainTextResponse(
+        metrics.render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 @app.post("/chat")
-def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, http_request: Request):
     """
-    Chat endpoint that uses model_with_tool.rag_agent.
+    Chat endpoint that uses model_with_tool.rag_agent_async, so waiting on
+    Gemini and SerpAPI does not hold a threadpool slot.
     Returns both the assistant's message and any structured flight data.
+    Send either the full `chat_history`, or a `message` with the
+    `session_id` from the previous turn (omit it to start a session); in
+    session mode the server keeps the history and echoes `session_id`.
+    Send `X-Debug-Trace: 1` to get a `_trace` field and a Server-Timing header.
+    Admins can send `X-Profile: 1` (with `X-Admin-Token`) to profile the
+    request; the profile id comes back in `X-Profile-Id`.
     """
-    result = model_with_tool.rag_agent(request.chat_history)
+    with profiling.profile_request(http_request.headers, "/chat") as profile_id:
+        response = await _chat(request, http_request)
+    if profile_id is not None and profiling.is_admin(http_request.headers):
+        response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+async def _chat(request: ChatRequest, http_request: Request):
+    if request.message is None and request.chat_history is None:
+        return JSONResponse(content={"error": "Send chat_history or message"}, status_code=422)
+
+    debug = tracing.debug_requested(http_request.headers)
+    with tracing.start_trace("chat_endpoint") as trace:
+        if request.message is None:
+            result = await model_with_tool.rag_agent_async(request.chat_history)
+        else:
+            try:
+                session = await chat_sessions.open_session(request.session_id)
+            except Exception as e:
+                logger.error("❌ Chat session store unavailable: %s", e)
+                return JSONResponse(content={"error": "Chat sessions are unavailable"}, status_code=503)
+            session.append("human", request.message)
+            result = await model_with_tool.rag_agent_async(session.messages, session=session)
+            session.append("ai", result["content"])
+            try:
+                await chat_sessions.save_session(session)
+            except Exception as e:
+                logger.error("❌ Could not save chat session %s: %s", session.session_id, e)
+            result["session_id"] = session.session_id
     # result is already a dict: {"content": "...", "flight_data": [...]}
-    return JSONResponse(content=result)
+    headers = {}
+    if debug or tracing.TRACE_SERVER_TIMING:
+        headers["Server-Timing"] = trace.server_timing()
+    if debug:
+        result["_trace"] = trace.to_dict()
+    return JSONResponse(content=result, headers=headers)
+
+
+def _read_deals_csv(path: str):
+    deals = []
+    today = date.today()
+    with open(path, newline="", encoding="utf-8") as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            if not deal_catalogue.is_active(row, today):
+                continue
+            # normalize to expected columns: if missing columns exist, insert empty string
+            normalized = {
+                k: (row.get(k, "") if row.get(k, None) is not None else "")
+                for k in mongoDB.EXPECTED_COLUMNS
+            }
+            normalized.update({k: row[k] for k in mongoDB.OPTIONAL_COLUMNS if row.get(k)})
+            deals.append(normalized)
+    return deals
+
+
+def _dumps(value) -> str:
+    # Same encoding as JSONResponse
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+
+
+async def _stream_deals(first, deals, version):
+    """
+    Write {"deals": [...]} as MongoDB batches arrive. A failure mid-stream
+    closes the array and adds "error", like the non-streamed error body.
+    A complete listing is cached as a DealCatalogue unless the deals
+    changed meanwhile.
+    """
+    listing = [first]
+    yield '{"deals":[' + _dumps(first)
+    try:
+        async for deal in deals:
+            listing.append(deal)
+            yield "," + _dumps(deal)
+    except Exception as e:
+        logger.error("[get_latest_deals] Mongo stream error: %s", e)
+        yield '],"error":' + _dumps(str(e)) + "}"
+        return
+    yield "]}"
+    if deals_watcher.version() == version:
+        _deals_cache.set("deals", deal_catalogue.DealCatalogue(listing))
+
+
+def _admin_denied(http_request: Request):
+    if not profiling.ADMIN_TOKEN:
+        return JSONResponse(content={"error": "Admin endpoints are disabled"}, status_code=404)
+    if not profiling.is_admin(http_request.headers):
+        return JSONResponse(content={"error": "Admin token required"}, status_code=403)
+    return None
+
+
+@app.get("/admin/profiles")
+def list_profiles(http_request: Request):
+    """
+    Recent request profiles, newest first (requires `X-Admin-Token`).
+    """
+    denied = _admin_denied(http_request)
+    if denied is not None:
+        return denied
+    return JSONResponse(content={"profiles": profiling.recent_profiles()})
+
+
+@app.get("/admin/profiles/{profile_id}")
+def download_profile(profile_id: str, http_request: Request):
+    """
+    One profile as folded stacks, ready for flamegraph.pl or speedscope.
+    """
+    denied = _admin_denied(http_request)
+    if denied is not None:
+        return denied
+    path = profiling.profile_path(profile_id)
+    if path is None or not os.path.exists(path):
+        return JSONResponse(content={"error": "Unknown or expired profile"}, status_code=404)
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=f"{profile_id}.folded")
+
+
+@app.get("/booking_options/{job_id}")
+async def booking_options_endpoint(job_id: str):
+    """
+    Poll a two-phase booking job started by /chat (`booking_job` in its
+    response). `status` is "running" until every deep search has finished;
+    `flight_data` always holds the best options known so far.
+    """
+    update = await asyncio.to_thread(get_flights.booking_updates, job_id)
+    if update is None:
+        return JSONResponse(content={"error": "Unknown or expired booking job"}, status_code=404)
+    return JSONResponse(content=update)
+
+
+@app.get("/fare_analytics")
+async def fare_analytics_endpoint(departure_id: str, arrival_id: str, departure_date: str):
+    """
+    Cheapest fare per airline, prices by departure hour and price spread
+    across sellers for a route, computed from cached SerpAPI answers only.
+    """
+    analytics = await asyncio.to_thread(fare_analytics.route_analytics, departure_id, arrival_id, departure_date)
+    if analytics is None:
+        return JSONResponse(content={"error": "No recent searches for this route"}, status_code=404)
+    return JSONResponse(content=analytics)
 
 
 @app.get("/get_latest_deals")
-def get_latest_deals():
+async def get_latest_deals():
     """
     Primary endpoint for the frontend Book Now flow.
     - Tries to read CSV_FILE_PATH and return as JSON {"deals": [...]}
     - If CSV missing or unreadable, falls back to MongoDB collection "flight_coupons"
+      (async driver, projected to EXPECTED_COLUMNS, streamed batch by batch)
     - Ensures returned JSON keys match EXPECTED_COLUMNS used throughout the project
+    - Only active deals are returned: expired ones (past expiry_date) are dropped
     """
-    EXPECTED_COLUMNS = [
-        "platform", "title", "offer", "coupon_code", "bank",
-        "payment_mode", "emi", "url", "expiry_date",
-        "current/upcoming", "flight_type"
-    ]
-
     # 1) Try CSV first
     try:
         if os.path.exists(CSV_FILE_PATH):
-            deals = []
-            with open(CSV_FILE_PATH, newline="", encoding="utf-8") as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    # normalize to expected columns: if missing columns exist, insert empty string
-                    normalized = {
-                        k: (row.get(k, "") if row.get(k, None) is not None else "")
-                        for k in EXPECTED_COLUMNS
-                    }
-                    deals.append(normalized)
+            deals = await asyncio.to_thread(_read_deals_csv, CSV_FILE_PATH)
             return JSONResponse(content={"deals": deals})
     except Exception as e:
         # Log but continue to fallback to MongoDB
-        print(f"[get_latest_deals] Error reading CSV ({CSV_FILE_PATH}): {e}")
+        logger.warning("[get_latest_deals] Error reading CSV (%s): %s", CSV_FILE_PATH, e)
 
     # 2) Fallback to MongoDB
+    cached = _deals_cache.get("deals", max_age=DEALS_CACHE_TTL)
+    metrics.record_cache("deals", cached is not None)
+    if cached is not None:
+        return JSONResponse(content={"deals": cached.active()})
+    version = deals_watcher.version()
+    deals = deal_catalogue.active_only(mongoDB.iter_deals_async("flight_coupons"))
     try:
-        client = mongoDB.connect_db()
-        coll = mongoDB.get_collection(client, "flight_coupons")
-        if coll is None:
-            return JSONResponse(
-                content={"deals": [], "error": "No data source available"},
-                status_code=500
-            )
-
-        docs = list(coll.find({}, {"_id": 0, "embedding": 0}))
-        # Ensure keys match EXPECTED_COLUMNS: convert keys if necessary or fill missing
-        normalized_docs = []
-        for d in docs:
-            normalized = {}
-            for k in EXPECTED_COLUMNS:
-                normalized[k] = d.get(k, "")
-            normalized_docs.append(normalized)
-
-        return JSONResponse(content={"deals": normalized_docs})
+        # Pull the first deal before answering so connection errors still get a 500
+        first = await deals.__anext__()
+    except StopAsyncIteration:
+        if deals_watcher.version() == version:
+            _deals_cache.set("deals", deal_catalogue.DealCatalogue([]))
+        return JSONResponse(content={"deals": []})
     except Exception as e:
-        print(f"[get_latest_deals] Mongo fallback error: {e}")
+        logger.error("[get_latest_deals] Mongo fallback error: %s", e)
         return JSONResponse(
             content={"deals": [], "error": str(e)},
             status_code=500
-        )                  
-                  
+        )
+    return StreamingResponse(_stream_deals(first, deals, version), media_type="application/json")
+
+
 #ooriginal functional main.py
 # from typing import List
 # from fastapi import FastAPI
@@ -0,0 +1,11 @@
+# tests/conftest.py
+# Runs before any test module imports `utils.*`: the offline stand-ins from
+# benchmarks/stubs.py replace SerpAPI, Bedrock, Gemini and MongoDB.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import stubs  # noqa: E402
+
+stubs.install()
@@ -0,0 +1,37 @@
+# tests/test_deal_catalogue.py
+from datetime import date, timedelta
+
+from utils import mongoDB
+from utils.deal_catalogue import DealCatalogue, STATUS_FIELD
+
+TODAY = date(2026, 3, 1)
+
+
+def _deal(title, **fields):
+    return mongoDB.normalize_deal({"title": title, STATUS_FIELD: "upcoming", **fields})
+
+
+def test_start_date_is_fetched_and_kept():
+    assert mongoDB.DEAL_PROJECTION["start_date"] == 1
+    deal = _deal("spring sale", start_date="2026-03-05")
+    assert deal["start_date"] == "2026-03-05"
+    assert "start_date" not in _deal("no start")
+
+
+def test_upcoming_deal_becomes_current_on_its_start_date():
+    starts = TODAY + timedelta(days=3)
+    catalogue = DealCatalogue(
+        [_deal("spring sale", start_date=starts.isoformat(), expiry_date="2026-04-01")], today=TODAY
+    )
+
+    assert [d[STATUS_FIELD] for d in catalogue.active(TODAY)] == ["upcoming"]
+    assert catalogue.next_change() == starts
+    assert [d[STATUS_FIELD] for d in catalogue.active(starts - timedelta(days=1))] == ["upcoming"]
+    assert [d[STATUS_FIELD] for d in catalogue.active(starts)] == ["current"]
+
+
+def test_deal_drops_out_the_day_after_expiry():
+    catalogue = DealCatalogue([_deal("last call", expiry_date="2026-03-02")], today=TODAY)
+
+    assert len(catalogue.active(date(2026, 3, 2))) == 1
+    assert catalogue.active(date(2026, 3, 3)) == []
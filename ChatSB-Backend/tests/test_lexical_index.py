@@ -0,0 +1,57 @@
+# tests/test_lexical_index.py
+import pytest
+
+from utils import lexical_index, rag_retriever
+from utils.lexical_index import BM25Index, rrf
+
+# Made only of entity tokens, so retrieve() takes the keyword-only fast path
+ENTITY_QUERIES = ["HDFC offers on MakeMyTrip", "ICICI credit card deals", "SBI"]
+
+
+def _texts(docs):
+    return [d.page_content for d in docs]
+
+
+@pytest.fixture
+def index():
+    rag_retriever.offer_index.invalidate()
+    return rag_retriever.offer_index.ensure_fresh()
+
+
+def test_rrf_of_one_ranking_keeps_its_order():
+    assert rrf([["a", "b", "c"]]) == ["a", "b", "c"]
+    assert rrf([["a", "b", "c"], ["a", "b", "c"]]) == ["a", "b", "c"]
+    # Ranked by both beats first place in only one
+    assert rrf([["x", "a", "b"], ["y", "a", "b"]])[0] == "a"
+
+
+def test_decisive_only_for_entity_queries():
+    idx = BM25Index.build([
+        ("Flat 10% off with HDFC cards", {"bank": "HDFC", "platform": "Cleartrip"}),
+        ("Cashback on weekend trips", {"bank": "ICICI", "platform": "Cleartrip"}),
+    ])
+    assert [i for i, _ in idx.decisive("HDFC offers on Cleartrip")] == [0]
+    assert idx.decisive("weekend cashback") is None
+    assert idx.decisive("Axis offers") is None
+
+
+@pytest.mark.parametrize("query", ENTITY_QUERIES)
+def test_fast_path_ranks_like_fused_path(index, monkeypatch, query):
+    hits = index.decisive(query, rag_retriever.RAG_K)
+    assert hits
+
+    searches = lexical_index.LEXICAL_SEARCHES
+    before = searches.value(path="keyword_only")
+    fast = _texts(rag_retriever.retrieve(query))
+    assert searches.value(path="keyword_only") == before + 1
+
+    # Same query forced through vector search + BM25 + RRF, with no vector hits
+    monkeypatch.setattr(BM25Index, "decisive", lambda self, q, k=10: None)
+    monkeypatch.setattr(rag_retriever.retriever, "invoke", lambda q: [])
+    fused = _texts(rag_retriever.retrieve(query))
+    assert [text for text in fused if text in fast] == fast
+
+    # And with a vector search that agrees with BM25, RRF changes nothing
+    monkeypatch.setattr(rag_retriever.retriever, "invoke", lambda q: rag_retriever._lexical_docs(index, hits))
+    fused = _texts(rag_retriever.retrieve(query))
+    assert fused[:len(fast)] == fast
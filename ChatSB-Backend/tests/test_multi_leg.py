@@ -0,0 +1,43 @@
+# tests/test_multi_leg.py
+import itertools
+import random
+
+import pytest
+
+from utils.flight_pipeline import cheapest_combinations, flight_price
+
+
+def _legs(seed, n_legs, per_leg):
+    rng = random.Random(seed)
+    return [
+        [{"booking_token": f"{leg}-{i}", "price": rng.randint(2000, 9000)} for i in range(per_leg)]
+        for leg in range(n_legs)
+    ]
+
+
+def _brute_force(legs, k, max_total=None):
+    totals = sorted(sum(flight_price(f) for f in combo) for combo in itertools.product(*legs))
+    return [t for t in totals if max_total is None or t <= max_total][:k]
+
+
+@pytest.mark.parametrize("seed,n_legs,per_leg", [(1, 2, 6), (2, 3, 5), (3, 4, 3)])
+def test_k_cheapest_match_brute_force(seed, n_legs, per_leg):
+    legs = _legs(seed, n_legs, per_leg)
+    combos = cheapest_combinations(legs, k=7)
+
+    assert [total for total, _ in combos] == _brute_force(legs, 7)
+    for total, picked in combos:
+        assert len(picked) == n_legs
+        assert total == sum(flight_price(f) for f in picked)
+
+
+def test_budget_cuts_off_combinations():
+    legs = _legs(4, 3, 4)
+    budget = _brute_force(legs, 5)[2]
+    assert [total for total, _ in cheapest_combinations(legs, k=10, max_total=budget)] == _brute_force(legs, 10, budget)
+
+
+def test_unpriced_flights_skipped_and_empty_leg_gives_nothing():
+    legs = [[{"price": 3000}, {"booking_token": "no-price"}], [{"price": 2500}]]
+    assert [total for total, _ in cheapest_combinations(legs)] == [5500]
+    assert cheapest_combinations([[{"price": 3000}], [{"booking_token": "no-price"}]]) == []
@@ -0,0 +1,67 @@
+# tests/test_refilter_cached.py
+import pytest
+
+from utils import flight_cache, get_flights
+
+PRICES = [4200, 6100, 7999, 8000, 8001, 12500, None, 5600]
+
+
+def _flight(i, price):
+    flight = {"booking_token": f"token-{i}", "flights": [{"flight_number": f"AI {100 + i}"}]}
+    if price is not None:
+        flight["price"] = price
+    return flight
+
+
+def _serpapi(params):
+    """
+    SerpAPI stand-in applying max_price upstream, the way a direct budgeted
+    search is answered.
+    """
+    limit = int(params["max_price"]) if params.get("max_price") else None
+    flights = [_flight(i, p) for i, p in enumerate(PRICES) if limit is None or p is None or p <= limit]
+    return {"best_flights": flights[:3], "other_flights": flights[3:]}
+
+
+@pytest.fixture
+def serpapi(monkeypatch):
+    calls = []
+
+    def search(upstream, params, priority):
+        calls.append(params.get("max_price"))
+        results = _serpapi(params)
+        get_flights._remember(params, results)
+        return results
+
+    monkeypatch.setattr(flight_cache, "shared", None)
+    monkeypatch.setattr(flight_cache, "FLIGHT_CACHE_TTL", 900.0)
+    monkeypatch.setattr(get_flights, "_search_upstream", search)
+    flight_cache.last_good.clear()
+    yield calls
+    flight_cache.last_good.clear()
+
+
+@pytest.mark.parametrize("budget", ["8000", "6000", "4000"])
+def test_refilter_of_unbounded_search_matches_direct_budgeted_search(serpapi, budget):
+    route = ("DEL", "MAA", "2026-11-02")
+    get_flights.get_flights(*route)
+
+    refiltered = get_flights.get_flights(*route, max_price=budget)
+    assert serpapi == [None]  # answered from the cached unbounded search
+
+    direct = get_flights.get_flights(*route, max_price=budget, refresh=True)
+    assert serpapi == [None, budget]
+    assert refiltered == direct
+
+
+def test_refilter_uses_tightest_covering_budget(serpapi):
+    route = ("DEL", "MAA", "2026-11-02")
+    get_flights.get_flights(*route, max_price="9000")
+
+    refiltered = get_flights.get_flights(*route, max_price="6000")
+    assert serpapi == ["9000"]
+    assert refiltered == get_flights.get_flights(*route, max_price="6000", refresh=True)
+
+    # A looser budget is not covered by the cached one and goes upstream
+    get_flights.get_flights(*route, max_price="10000")
+    assert serpapi == ["9000", "6000", "10000"]
@@ -0,0 +1,146 @@
+# utils/admission.py
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from utils import metrics
+from utils.logger import get_logger
+
+load_dotenv()
+
+logger = get_logger("admission")
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+
+ADMISSION_EVENTS = metrics.counter(
+    "chatsb_admission_total", "Admission decisions by lane and outcome (admitted, queued, shed_queue, shed_timeout)."
+)
+ADMISSION_ACTIVE = metrics.gauge("chatsb_admission_active", "Requests holding an admission slot, by lane.")
+ADMISSION_QUEUED = metrics.gauge("chatsb_admission_queued", "Requests waiting for an admission slot, by lane.")
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a lane is saturated. `retry_after` is a hint in seconds.
+    """
+
+    def __init__(self, lane: str, reason: str, retry_after: int = 1):
+        super().__init__(f"{lane} lane is overloaded ({reason})")
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Lane:
+    """
+    At most `limit` requests at once; up to `max_queue` more wait in FIFO
+    order for at most `max_wait` seconds, everything beyond that is shed
+    immediately. Lives on one event loop, so no locking is needed.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters = deque()
+        # Smoothed slot hold time, for Retry-After
+        self._hold = 1.0
+
+    def retry_after(self) -> int:
+        backlog = len(self._waiters) + 1
+        return max(1, math.ceil(self._hold * backlog / max(self.limit, 1)))
+
+    def _reject(self, reason: str):
+        ADMISSION_EVENTS.inc(lane=self.name, outcome=f"shed_{reason}")
+        return AdmissionRejected(self.name, reason, self.retry_after())
+
+    async def acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            ADMISSION_ACTIVE.set(self.active, lane=self.name)
+            ADMISSION_EVENTS.inc(lane=self.name, outcome="admitted")
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        ADMISSION_QUEUED.set(len(self._waiters), lane=self.name)
+        try:
+            done, _ = await asyncio.wait({waiter}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            # Client went away while queued: hand on a slot we were just given
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._forget(waiter)
+            raise
+        if not done:
+            self._forget(waiter)
+            raise self._reject("timeout")
+        ADMISSION_EVENTS.inc(lane=self.name, outcome="queued")
+
+    def _forget(self, waiter):
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        ADMISSION_QUEUED.set(len(self._waiters), lane=self.name)
+
+    def release(self):
+        # The slot passes straight to the oldest waiter, so active stays the same
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                ADMISSION_QUEUED.set(len(self._waiters), lane=self.name)
+                return
+        ADMISSION_QUEUED.set(0, lane=self.name)
+        self.active -= 1
+        ADMISSION_ACTIVE.set(self.active, lane=self.name)
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._hold = 0.8 * self._hold + 0.2 * (time.monotonic() - start)
+            self.release()
+
+
+def _lane_from_env(name: str, limit: str, queue: str, wait: str) -> Lane:
+    prefix = f"ADMISSION_{name.upper()}"
+    return Lane(
+        name,
+        limit=int(os.getenv(f"{prefix}_CONCURRENCY", limit)),
+        max_queue=int(os.getenv(f"{prefix}_QUEUE", queue)),
+        max_wait=float(os.getenv(f"{prefix}_MAX_WAIT_S", wait)),
+    )
+
+
+# /chat holds its slot across Gemini and SerpAPI calls; everything else is
+# short and gets its own reserved lane so it never waits behind chat
+CHAT = _lane_from_env("chat", "32", "64", "2")
+LIGHT = _lane_from_env("light", "64", "128", "1")
+
+# Paths that are never queued or shed (monitoring must work under load)
+EXEMPT_PATHS = {"/metrics"}
+LANE_BY_PATH = {"/chat": CHAT}
+
+
+def lane_for(path: str, method: str = "GET"):
+    """
+    Lane for a request, or None if it is exempt. CORS preflights (OPTIONS)
+    do no work and are never queued.
+    """
+    if not ADMISSION_ENABLED or path in EXEMPT_PATHS or method == "OPTIONS":
+        return None
+    return LANE_BY_PATH.get(path, LIGHT)
@@ -0,0 +1,62 @@
+# utils/booking_jobs.py
+import os
+import time
+import uuid
+import asyncio
+import contextvars
+from dotenv import load_dotenv
+from utils import flight_cache, metrics
+from utils.logger import get_logger
+
+load_dotenv()
+
+logger = get_logger("booking_jobs")
+
+# Answer /chat with shallow booking options and deep-search in the background
+BOOKING_TWO_PHASE = os.getenv("BOOKING_TWO_PHASE", "true").lower() == "true"
+# How long a finished job can still be polled
+BOOKING_JOB_TTL = float(os.getenv("BOOKING_JOB_TTL", "900"))
+
+BOOKING_JOBS = metrics.counter("chatsb_booking_jobs_total", "Deep-search booking jobs by outcome.")
+
+# Strong references: the event loop only keeps weak ones to running tasks
+_tasks = set()
+
+
+def _key(job_id: str) -> str:
+    return f"booking_job:{job_id}"
+
+
+def create(spec: dict) -> str:
+    """
+    Register a running job. The record lives in the flight cache (both
+    tiers), so any worker can answer a poll for it.
+    """
+    job_id = uuid.uuid4().hex
+    flight_cache.put(_key(job_id), {**spec, "job_id": job_id, "status": "running", "created": time.time()})
+    BOOKING_JOBS.inc(outcome="started")
+    return job_id
+
+
+def get(job_id: str):
+    return flight_cache.lookup(_key(job_id), BOOKING_JOB_TTL)
+
+
+def update(job_id: str, **fields):
+    record = get(job_id)
+    if record is None:
+        return
+    flight_cache.put(_key(job_id), {**record, **fields})
+    if "status" in fields:
+        BOOKING_JOBS.inc(outcome=fields["status"])
+
+
+def spawn(coro):
+    """
+    Run `coro` in the background on the current event loop, outside the
+    request's trace context.
+    """
+    task = asyncio.get_running_loop().create_task(coro, context=contextvars.Context())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
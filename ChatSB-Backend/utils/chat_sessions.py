@@ -0,0 +1,167 @@
+# utils/chat_sessions.py
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from utils import metrics, mongoDB, flight_cache
+from utils.flight_cache import TTLCache, cache_key
+from utils.logger import get_logger
+
+load_dotenv()
+
+logger = get_logger("chat_sessions")
+
+# "memory" (per worker) or "mongo" (shared by every worker)
+CHAT_SESSION_STORE = os.getenv("CHAT_SESSION_STORE", "memory").lower()
+# Idle seconds before a session is dropped
+CHAT_SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", "3600"))
+# Sessions kept by the in-memory store (least recently used go first)
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", "10000"))
+# Messages kept per session; older turns are dropped from the log
+CHAT_SESSION_MAX_MESSAGES = int(os.getenv("CHAT_SESSION_MAX_MESSAGES", "40"))
+# Tool results kept per session, and how long one is reused
+CHAT_SESSION_MAX_TOOL_RESULTS = int(os.getenv("CHAT_SESSION_MAX_TOOL_RESULTS", "8"))
+CHAT_SESSION_TOOL_TTL = float(os.getenv("CHAT_SESSION_TOOL_TTL", os.getenv("FLIGHT_CACHE_TTL", "900")))
+CHAT_SESSION_COLLECTION = os.getenv("CHAT_SESSION_COLLECTION", "chat_sessions")
+
+SESSION_EVENTS = metrics.counter("chatsb_chat_sessions_total", "Chat session lookups (resumed, created, expired).")
+
+
+class Session:
+    """
+    Compact server-side chat state: the message log in the same
+    {"role", "content"} shape rag_agent takes, plus the tool calls already
+    resolved, keyed by tool name and arguments. Tool payloads themselves
+    live in the flight cache under that key, so sessions stay small.
+    """
+
+    __slots__ = ("session_id", "messages", "tool_results")
+
+    def __init__(self, session_id: str = None, messages=None, tool_results=None):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.messages = list(messages or [])
+        self.tool_results = dict(tool_results or {})
+
+    def append(self, role: str, content: str):
+        self.messages.append({"role": role, "content": content})
+        del self.messages[:-CHAT_SESSION_MAX_MESSAGES]
+
+    @staticmethod
+    def _tool_key(name: str, args: dict) -> str:
+        return cache_key({"tool": name, **args})
+
+    def tool_result(self, name: str, args: dict):
+        """
+        Result of an earlier identical tool call in this session, if it is
+        younger than CHAT_SESSION_TOOL_TTL and still in the flight cache.
+        May read the shared cache tier, so async callers run it in a thread.
+        """
+        key = self._tool_key(name, args)
+        entry = self.tool_results.get(key)
+        value = None
+        if entry is not None and time.time() - entry["stored_at"] <= CHAT_SESSION_TOOL_TTL:
+            value = flight_cache.lookup(key, max_age=CHAT_SESSION_TOOL_TTL)
+        metrics.record_cache("session_tool_result", value is not None)
+        return value
+
+    def remember_tool_result(self, name: str, args: dict, value):
+        key = self._tool_key(name, args)
+        flight_cache.put(key, value)
+        self.tool_results[key] = {"stored_at": time.time()}
+        if len(self.tool_results) > CHAT_SESSION_MAX_TOOL_RESULTS:
+            oldest = sorted(self.tool_results, key=lambda k: self.tool_results[k]["stored_at"])
+            for key in oldest[:len(self.tool_results) - CHAT_SESSION_MAX_TOOL_RESULTS]:
+                del self.tool_results[key]
+
+    def to_doc(self) -> dict:
+        return {"_id": self.session_id, "messages": self.messages, "tool_results": self.tool_results}
+
+    @classmethod
+    def from_doc(cls, doc: dict):
+        return cls(doc["_id"], doc.get("messages"), doc.get("tool_results"))
+
+
+class MemorySessionStore:
+    """
+    Sessions in this worker's memory, LRU-bounded by CHAT_SESSION_MAX and
+    expired after CHAT_SESSION_TTL idle seconds.
+    """
+
+    def __init__(self, max_sessions: int = CHAT_SESSION_MAX, ttl: float = CHAT_SESSION_TTL):
+        self.ttl = ttl
+        self._sessions = TTLCache(max_sessions)
+
+    async def load(self, session_id: str):
+        return self._sessions.get(session_id, max_age=self.ttl)
+
+    async def save(self, session: Session):
+        self._sessions.set(session.session_id, session)
+
+
+class MongoSessionStore:
+    """
+    Sessions in a MongoDB collection so any worker can continue a chat.
+    A TTL index on `expires_at` drops sessions idle for CHAT_SESSION_TTL.
+    """
+
+    def __init__(self, collection_name: str = CHAT_SESSION_COLLECTION, ttl: float = CHAT_SESSION_TTL):
+        self.collection_name = collection_name
+        self.ttl = ttl
+        self._collection = None
+
+    async def collection(self):
+        if self._collection is None:
+            coll = await mongoDB.get_collection_async(self.collection_name)
+            if coll is None:
+                raise RuntimeError(f"Session collection {self.collection_name} is unavailable")
+            try:
+                await coll.create_index("expires_at", expireAfterSeconds=0)
+            except Exception as e:
+                logger.warning("⚠️ Could not create chat session TTL index: %s", e)
+            self._collection = coll
+        return self._collection
+
+    async def load(self, session_id: str):
+        coll = await self.collection()
+        doc = await coll.find_one({"_id": session_id})
+        # The TTL monitor only runs every minute; don't resume what it has yet to delete
+        if doc is None or doc["expires_at"].replace(tzinfo=timezone.utc) <= datetime.now(timezone.utc):
+            return None
+        return Session.from_doc(doc)
+
+    async def save(self, session: Session):
+        coll = await self.collection()
+        doc = session.to_doc()
+        doc["expires_at"] = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        await coll.replace_one({"_id": session.session_id}, doc, upsert=True)
+
+
+def make_store(kind: str = CHAT_SESSION_STORE):
+    if kind == "mongo":
+        return MongoSessionStore()
+    if kind != "memory":
+        logger.warning("⚠️ Unknown CHAT_SESSION_STORE %r, using memory", kind)
+    return MemorySessionStore()
+
+
+store = make_store()
+
+
+async def open_session(session_id: str = None) -> Session:
+    """
+    The stored session for `session_id`, or a new one (with a fresh id)
+    when it is missing or expired.
+    """
+    if session_id:
+        session = await store.load(session_id)
+        if session is not None:
+            SESSION_EVENTS.inc(event="resumed")
+            return session
+        SESSION_EVENTS.inc(event="expired")
+    SESSION_EVENTS.inc(event="created")
+    return Session()
+
+
+async def save_session(session: Session):
+    await store.save(session)
@@ -6,9 +6,13 @@ from pymongo.errors import PyMongoError
 from langchain_aws import BedrockEmbeddings
 from langchain.docstore.document import Document
 from langchain_mongodb import MongoDBAtlasVectorSearch
+from utils import deal_catalogue
+from utils.logger import get_logger
 
 load_dotenv()
 
+logger = get_logger("create_vector_store")
+
 
 def insert_csv_with_embeddings(csv_file: str, collection):
     """
@@ -17,7 +21,7 @@ def insert_csv_with_embeddings(csv_file: str, collection):
     Includes strict error handling and data sanitization.
     """
     if collection is None:
-        print("⚠️ Skipping insert because MongoDB connection failed.")
+        logger.warning("⚠️ Skipping insert because MongoDB connection failed.")
         return
 
     try:
@@ -40,11 +44,13 @@ def insert_csv_with_embeddings(csv_file: str, collection):
         # Load and validate CSV
         df = pd.read_csv(csv_file)
         if df.empty:
-            print(f"❌ CSV file '{csv_file}' is empty.")
+            logger.error("❌ CSV file '%s' is empty.", csv_file)
             return
 
         docs = []
         for _, row in df.iterrows():
+            if not deal_catalogue.is_active(row):
+                continue
             text_to_embed = generate_offer_string(row)
             emi_value = str(row.get("emi", "")).strip().lower()
             emi = 1 if emi_value == "y" else 0
@@ -59,24 +65,25 @@ def insert_csv_with_embeddings(csv_file: str, collection):
                 "emi": emi,
                 "url": str(row.get("url", "")).strip(),
                 "flight_type": str(row.get("flight_type", "")).strip(),
+                # Validity window, for expiry filtering and the purge job
+                "expiry_date": str(row.get("expiry_date", "")).strip(),
+                "current/upcoming": str(row.get("current/upcoming", "")).strip(),
             }
 
             docs.append(Document(page_content=text_to_embed, metadata=metadata))
 
         # Insert all documents into MongoDB Vector Index
         vector_store.add_documents(documents=docs)
-        print(f"✅ Successfully inserted {len(docs)} documents into MongoDB vector index.")
+        logger.info("✅ Successfully inserted %d documents into MongoDB vector index.", len(docs))
 
     except FileNotFoundError:
-        print(f"❌ CSV file '{csv_file}' not found.")
+        logger.error("❌ CSV file '%s' not found.", csv_file)
     except pd.errors.EmptyDataError:
-        print(f"❌ CSV file '{csv_file}' is empty or invalid.")
+        logger.error("❌ CSV file '%s' is empty or invalid.", csv_file)
     except PyMongoError as e:
-        print("❌ Failed to insert documents into MongoDB.")
-        print("Error:", e)
+        logger.error("❌ Failed to insert documents into MongoDB. Error: %s", e)
     except Exception as e:
-        print("❌ An unexpected error occurred while inserting CSV data.")
-        print("Error:", e)
+        logger.exception("❌ An unexpected error occurred while inserting CSV data. Error: %s", e)
 
 
 def generate_offer_string(row):
@@ -0,0 +1,295 @@
+# utils/deal_catalogue.py
+import os
+import uuid
+import heapq
+import socket
+import threading
+from datetime import date, datetime, timedelta, timezone
+from dotenv import load_dotenv
+from pymongo import errors
+from utils import mongoDB, metrics
+from utils.logger import get_logger
+
+load_dotenv()
+
+logger = get_logger("deal_catalogue")
+
+STATUS_FIELD = "current/upcoming"
+# Optional first day of validity; deals without one keep their stored status
+START_FIELD = "start_date"
+EXPIRY_FIELD = "expiry_date"
+
+# Opt-in purge of expired deals: "archive" (move them to DEAL_ARCHIVE_COLLECTION),
+# "delete", or "off"
+DEAL_PURGE_MODE = os.getenv("DEAL_PURGE_MODE", "off").lower()
+DEAL_PURGE_ENABLED = DEAL_PURGE_MODE in ("archive", "delete")
+DEAL_PURGE_INTERVAL_S = float(os.getenv("DEAL_PURGE_INTERVAL_S", "3600"))
+# Days past expiry before a deal's vector document is purged
+DEAL_PURGE_GRACE_DAYS = int(os.getenv("DEAL_PURGE_GRACE_DAYS", "1"))
+DEAL_ARCHIVE_COLLECTION = os.getenv("DEAL_ARCHIVE_COLLECTION", "flight_coupons_archive")
+# Lease documents so only one worker runs the purge at a time
+DEAL_PURGE_LOCK_COLLECTION = os.getenv("DEAL_PURGE_LOCK_COLLECTION", "job_locks")
+DEAL_PURGE_LOCK = "deal_purge"
+DEAL_PURGE_BATCH = 500
+
+DEALS_PURGED = metrics.counter("chatsb_deals_purged_total", "Expired deal documents purged, by mode.")
+DEALS_ROLLED = metrics.counter(
+    "chatsb_deals_rollover_total", "Catalogue rollovers, by change (expired, started)."
+)
+
+_DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%Y/%m/%d")
+
+
+def parse_date(value):
+    """
+    A deal date as a date, or None when missing or unreadable (treated
+    as open-ended).
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value or "").strip()[:10]
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def status(deal: dict, today: date = None) -> str:
+    """
+    "expired" after the expiry date (a deal is valid through that day),
+    "upcoming" before its start date, else "current" (or the stored
+    status when the deal has no start date).
+    """
+    today = today or date.today()
+    expiry = parse_date(deal.get(EXPIRY_FIELD))
+    if expiry is not None and expiry < today:
+        return "expired"
+    start = parse_date(deal.get(START_FIELD))
+    if start is not None:
+        return "upcoming" if start > today else "current"
+    return "upcoming" if str(deal.get(STATUS_FIELD, "")).strip().lower() == "upcoming" else "current"
+
+
+def is_active(deal: dict, today: date = None) -> bool:
+    return status(deal, today) != "expired"
+
+
+async def active_only(deals, today: date = None):
+    """
+    Drop expired deals from an async deal stream.
+    """
+    today = today or date.today()
+    async for deal in deals:
+        if is_active(deal, today):
+            yield deal
+
+
+class DealCatalogue:
+    """
+    Deals indexed by validity window: expiry buckets in a min-heap of
+    dates, and start-date buckets for upcoming deals. Reads roll the
+    catalogue forward to today, touching only the buckets whose date has
+    passed: expired deals drop out and upcoming ones become current.
+    """
+
+    def __init__(self, deals, today: date = None):
+        today = today or date.today()
+        self.today = today
+        self._deals = {}       # position -> deal, in listing order
+        self._expiring = {}    # expiry date -> positions
+        self._starting = {}    # start date -> positions
+        self._expiry_heap = []
+        self._start_heap = []
+        self._listing = None
+        self._lock = threading.Lock()
+        for position, deal in enumerate(deals):
+            if not is_active(deal, today):
+                continue
+            deal = dict(deal)
+            self._deals[position] = deal
+            expiry = parse_date(deal.get(EXPIRY_FIELD))
+            if expiry is not None:
+                self._bucket(self._expiring, self._expiry_heap, expiry, position)
+            start = parse_date(deal.get(START_FIELD))
+            if start is not None and start > today:
+                deal[STATUS_FIELD] = "upcoming"
+                self._bucket(self._starting, self._start_heap, start, position)
+            elif start is not None:
+                deal[STATUS_FIELD] = "current"
+
+    @staticmethod
+    def _bucket(buckets, heap, day, position):
+        if day not in buckets:
+            buckets[day] = []
+            heapq.heappush(heap, day)
+        buckets[day].append(position)
+
+    def __len__(self):
+        return len(self._deals)
+
+    def roll(self, today: date = None) -> int:
+        """
+        Apply every expiry and start date up to `today`; returns how many
+        deals changed.
+        """
+        today = today or date.today()
+        with self._lock:
+            if today <= self.today:
+                return 0
+            changed = 0
+            while self._expiry_heap and self._expiry_heap[0] < today:
+                for position in self._expiring.pop(heapq.heappop(self._expiry_heap)):
+                    if self._deals.pop(position, None) is not None:
+                        changed += 1
+                        DEALS_ROLLED.inc(change="expired")
+            while self._start_heap and self._start_heap[0] <= today:
+                for position in self._starting.pop(heapq.heappop(self._start_heap)):
+                    deal = self._deals.get(position)
+                    if deal is not None:
+                        deal[STATUS_FIELD] = "current"
+                        changed += 1
+                        DEALS_ROLLED.inc(change="started")
+            self.today = today
+            if changed:
+                self._listing = None
+            return changed
+
+    def next_change(self):
+        """
+        The first day on which roll() will change something, or None.
+        """
+        days = []
+        if self._expiry_heap:
+            days.append(self._expiry_heap[0] + timedelta(days=1))
+        if self._start_heap:
+            days.append(self._start_heap[0])
+        return min(days) if days else None
+
+    def active(self, today: date = None):
+        """
+        Deals valid today (current and upcoming), in their original order.
+        """
+        self.roll(today)
+        with self._lock:
+            if self._listing is None:
+                self._listing = [self._deals[p] for p in sorted(self._deals)]
+            return self._listing
+
+
+def expired_ids(collection, cutoff: date):
+    """
+    _ids of deals whose expiry date is before `cutoff`.
+    """
+    return [
+        doc["_id"]
+        for doc in collection.find({EXPIRY_FIELD: {"$exists": True}}, {"_id": 1, EXPIRY_FIELD: 1})
+        if (parse_date(doc.get(EXPIRY_FIELD)) or cutoff) < cutoff
+    ]
+
+
+def purge_expired(collection, archive=None, mode: str = DEAL_PURGE_MODE, today: date = None):
+    """
+    Remove deals more than DEAL_PURGE_GRACE_DAYS past expiry from the
+    vector collection, copying them to `archive` first in "archive" mode.
+    Returns the number of documents removed.
+    """
+    cutoff = (today or date.today()) - timedelta(days=DEAL_PURGE_GRACE_DAYS)
+    ids = expired_ids(collection, cutoff)
+    removed = 0
+    for i in range(0, len(ids), DEAL_PURGE_BATCH):
+        batch = ids[i:i + DEAL_PURGE_BATCH]
+        if mode == "archive":
+            archived_at = datetime.now(timezone.utc)
+            for doc in collection.find({"_id": {"$in": batch}}):
+                doc["archived_at"] = archived_at
+                # Upsert so a purge interrupted after archiving can be re-run
+                archive.replace_one({"_id": doc["_id"]}, doc, upsert=True)
+        removed += collection.delete_many({"_id": {"$in": batch}}).deleted_count
+    if removed:
+        DEALS_PURGED.inc(removed, mode=mode)
+        logger.info("🧹 Purged %d expired deals from %s (%s)", removed, collection.name, mode)
+    return removed
+
+
+def acquire_lease(locks, name: str, owner: str, ttl: float, now: datetime = None) -> bool:
+    """
+    Take or renew the lease `name` for `ttl` seconds. Only one owner holds
+    it at a time; a lease whose holder stopped renewing it can be taken over.
+    """
+    now = now or datetime.now(timezone.utc)
+    try:
+        locks.find_one_and_update(
+            {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lte": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=ttl)}},
+            upsert=True,
+        )
+        return True
+    except errors.DuplicateKeyError:
+        # Held by someone else: the upsert collided with their document
+        return False
+
+
+class DealPurger:
+    """
+    Background job running purge_expired() every `interval` seconds. Every
+    worker may start one, but a run only proceeds while it holds the purge
+    lease, so a single worker purges. The deletions reach in-process caches
+    through the deals watcher.
+    """
+
+    def __init__(self, interval=DEAL_PURGE_INTERVAL_S, mode=DEAL_PURGE_MODE):
+        self.interval = interval
+        self.mode = mode
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        client = mongoDB.connect_db()
+        collection = mongoDB.get_collection(client, "flight_coupons")
+        if collection is None:
+            return 0
+        archive = mongoDB.get_collection(client, DEAL_ARCHIVE_COLLECTION) if self.mode == "archive" else None
+        try:
+            locks = mongoDB.get_collection(client, DEAL_PURGE_LOCK_COLLECTION)
+            if not acquire_lease(locks, DEAL_PURGE_LOCK, self.owner, 2 * self.interval):
+                logger.debug("🔒 Deal purge lease held by another worker")
+                return 0
+            return purge_expired(collection, archive, self.mode)
+        except errors.PyMongoError as e:
+            logger.warning("⚠️ Expired deal purge failed: %s", e)
+            return 0
+        finally:
+            client.close()
+
+    def _loop(self):
+        while True:
+            self.run_once()
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self):
+        if self.mode not in ("archive", "delete"):
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="deal-purger", daemon=True)
+            self._thread.start()
+            logger.info("🧹 Expired deal purge started (%s, every %.0fs)", self.mode, self.interval)
+
+    def stop(self):
+        self._stop.set()
+
+
+purger = DealPurger()
+
+
+if __name__ == "__main__":
+    # One purge run, e.g. from cron instead of the in-app job
+    if not DEAL_PURGE_ENABLED:
+        raise SystemExit("Set DEAL_PURGE_MODE to archive or delete")
+    purger.run_once()
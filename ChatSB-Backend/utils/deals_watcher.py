@@ -0,0 +1,178 @@
+# utils/deals_watcher.py
+import os
+import json
+import time
+import hashlib
+import threading
+from dotenv import load_dotenv
+from pymongo import errors
+from utils import mongoDB, metrics
+from utils.logger import get_logger
+
+load_dotenv()
+
+logger = get_logger("deals_watcher")
+
+DEALS_WATCH_ENABLED = os.getenv("DEALS_WATCH_ENABLED", "true").lower() == "true"
+DEALS_WATCH_COLLECTION = os.getenv("DEALS_WATCH_COLLECTION", "flight_coupons")
+# "auto": change streams, falling back to polling where they are unsupported
+DEALS_WATCH_MODE = os.getenv("DEALS_WATCH_MODE", "auto").lower()
+# Checksum polling interval when change streams are unavailable
+DEALS_WATCH_POLL_S = float(os.getenv("DEALS_WATCH_POLL_S", "30"))
+# Changes arriving within this window (e.g. a bulk reload) are published once
+DEALS_WATCH_DEBOUNCE_S = float(os.getenv("DEALS_WATCH_DEBOUNCE_S", "1"))
+
+DEALS_INVALIDATIONS = metrics.counter(
+    "chatsb_deals_invalidations_total", "Deal cache invalidations published, by source (change_stream, poll)."
+)
+DEALS_WATCH_MODE_GAUGE = metrics.gauge(
+    "chatsb_deals_watch_mode", "Deals watcher mode (0 stopped, 1 change stream, 2 polling)."
+)
+
+# Change stream errors meaning "not supported here" (standalone server, no oplog, not permitted)
+_UNSUPPORTED_CODES = {40573, 115, 13, 8000}
+
+_subscribers = []
+_subscribers_lock = threading.Lock()
+_version = 0
+
+
+def subscribe(callback):
+    """
+    Call `callback(event)` after every published change; `event` holds
+    "version", "source" and "changes". Callbacks run on the watcher
+    thread and should only drop or mark cached state.
+    """
+    with _subscribers_lock:
+        _subscribers.append(callback)
+    return callback
+
+
+def version() -> int:
+    """
+    Increases with every published change. A cache can remember the
+    version it was filled at and refuse to store results read across a
+    change.
+    """
+    return _version
+
+
+def publish(source: str, changes: int = 1):
+    global _version
+    with _subscribers_lock:
+        _version += 1
+        event = {"version": _version, "source": source, "changes": changes}
+        callbacks = list(_subscribers)
+    DEALS_INVALIDATIONS.inc(source=source)
+    logger.info("🔔 Deals changed (%s, %d changes): invalidating caches", source, changes)
+    for callback in callbacks:
+        try:
+            callback(event)
+        except Exception as e:
+            logger.warning("⚠️ Deals invalidation subscriber %r failed: %s", callback, e)
+
+
+def checksum(collection) -> str:
+    """
+    Digest of every deal (without embedding and offer text), in _id order.
+    """
+    digest = hashlib.sha1()
+    for doc in collection.find({}, {"embedding": 0, "text": 0}).sort("_id", 1):
+        digest.update(json.dumps(doc, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class DealsWatcher:
+    """
+    Background thread publishing an invalidation whenever the deals
+    collection changes. Uses a MongoDB change stream when the deployment
+    supports one (Atlas does), else polls checksum() every `poll` seconds.
+    Bursts of changes are coalesced for `debounce` seconds.
+    """
+
+    def __init__(self, collection_name=DEALS_WATCH_COLLECTION, mode=DEALS_WATCH_MODE,
+                 poll=DEALS_WATCH_POLL_S, debounce=DEALS_WATCH_DEBOUNCE_S, connect=None):
+        self.collection_name = collection_name
+        self.mode = mode
+        self.poll = poll
+        self.debounce = debounce
+        self.connect = connect or (lambda: mongoDB.get_collection(mongoDB.connect_db(), collection_name))
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _collection(self):
+        while not self._stop.is_set():
+            collection = self.connect()
+            if collection is not None:
+                return collection
+            self._stop.wait(self.poll)
+        return None
+
+    def _watch(self, collection):
+        """
+        Follow the change stream until stopped. Returns False when change
+        streams are not supported, so the caller switches to polling.
+        """
+        resume_token = None
+        while not self._stop.is_set():
+            try:
+                with collection.watch(resume_after=resume_token, max_await_time_ms=int(self.debounce * 1000)) as stream:
+                    DEALS_WATCH_MODE_GAUGE.set(1)
+                    logger.info("👀 Watching %s with a change stream", self.collection_name)
+                    pending, first = 0, None
+                    while not self._stop.is_set() and stream.alive:
+                        change = stream.try_next()
+                        resume_token = stream.resume_token
+                        if change is not None:
+                            pending += 1
+                            first = first or time.monotonic()
+                        if pending and (change is None or time.monotonic() - first >= self.debounce):
+                            publish("change_stream", pending)
+                            pending, first = 0, None
+            except errors.OperationFailure as e:
+                if e.code in _UNSUPPORTED_CODES:
+                    logger.info("ℹ️ Change streams unavailable on %s (%s); polling instead", self.collection_name, e)
+                    return False
+                logger.warning("⚠️ Deals change stream failed: %s", e)
+                # Changes may have been missed while the stream was down
+                resume_token = None
+                publish("change_stream")
+                self._stop.wait(self.poll)
+            except errors.PyMongoError as e:
+                logger.warning("⚠️ Deals change stream interrupted: %s", e)
+                self._stop.wait(min(self.poll, 5.0))
+        return True
+
+    def _poll(self, collection):
+        DEALS_WATCH_MODE_GAUGE.set(2)
+        logger.info("👀 Polling %s for changes every %.0fs", self.collection_name, self.poll)
+        last = None
+        while not self._stop.is_set():
+            try:
+                current = checksum(collection)
+                if last is not None and current != last:
+                    publish("poll")
+                last = current
+            except errors.PyMongoError as e:
+                logger.warning("⚠️ Deals checksum poll failed: %s", e)
+            self._stop.wait(self.poll)
+
+    def _loop(self):
+        collection = self._collection()
+        if collection is None:
+            return
+        if self.mode == "poll" or not self._watch(collection):
+            self._poll(collection)
+        DEALS_WATCH_MODE_GAUGE.set(0)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="deals-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+watcher = DealsWatcher()
@@ -0,0 +1,178 @@
+# utils/embedding_batcher.py
+import os
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dotenv import load_dotenv
+from utils import metrics
+from utils.logger import get_logger
+
+load_dotenv()
+
+logger = get_logger("embedding_batcher")
+
+# "auto": batch only models that take a list of texts; "true" also batches
+# single-text models (Titan), where it only deduplicates; "false" disables
+EMBED_BATCH_ENABLED = os.getenv("EMBED_BATCH_ENABLED", "auto").lower()
+# How long the first query of a batch waits for others to join
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "32"))
+# Batches sent to Bedrock at the same time
+EMBED_BATCH_CONCURRENCY = int(os.getenv("EMBED_BATCH_CONCURRENCY", "4"))
+
+EMBED_BATCHES = metrics.counter("chatsb_embedding_batches_total", "Embedding batches sent upstream.")
+EMBED_TEXTS = metrics.counter(
+    "chatsb_embedding_texts_total", "Queries through the embedding batcher (queued, sent, deduplicated)."
+)
+EMBED_BATCH_SIZE = metrics.histogram(
+    "chatsb_embedding_batch_size", "Distinct texts per embedding batch.", buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+
+def supports_batch_input(model_id) -> bool:
+    """
+    Bedrock embedding models whose request takes a list of texts (Cohere
+    Embed). Titan takes a single inputText, so its batches fan out into
+    one request per distinct text.
+    """
+    return "cohere." in str(model_id or "")
+
+
+def batching_enabled(model_id) -> bool:
+    """
+    Whether query embeddings for `model_id` go through the batcher. With
+    Titan the fan-out adds the batch window and a thread hop for no
+    throughput gain, so "auto" leaves it unbatched.
+    """
+    if EMBED_BATCH_ENABLED == "auto":
+        return supports_batch_input(model_id)
+    return EMBED_BATCH_ENABLED == "true"
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent single-query embeddings. The first query waits up
+    to `window` seconds for others (at most `max_batch`); the batch is then
+    embedded with one `embed_many(texts)` call, or `embed_one(text)` per
+    distinct text when the model has no batch input, and every caller gets
+    its own vector. Identical queries in a batch are embedded once.
+    """
+
+    def __init__(self, embed_many=None, embed_one=None, window: float = EMBED_BATCH_WINDOW_MS / 1000.0,
+                 max_batch: int = EMBED_BATCH_MAX, concurrency: int = EMBED_BATCH_CONCURRENCY):
+        if embed_many is None and embed_one is None:
+            raise ValueError("EmbeddingBatcher needs embed_many or embed_one")
+        self.embed_many = embed_many
+        self.embed_one = embed_one
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._flushers = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed-batch")
+        self._fanout = (
+            ThreadPoolExecutor(max_workers=concurrency * max_batch, thread_name_prefix="embed-one")
+            if embed_many is None else None
+        )
+        self._collector = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, text: str) -> Future:
+        self._start()
+        future = Future()
+        self._queue.put((text, future))
+        EMBED_TEXTS.inc(stage="queued")
+        return future
+
+    def embed(self, text: str):
+        return self.submit(text).result()
+
+    async def aembed(self, text: str):
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _start(self):
+        if self._collector is not None:
+            return
+        with self._start_lock:
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect, name="embed-collector", daemon=True)
+                self._collector.start()
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Back-pressure: queries keep queueing (and batch up) while
+            # every flusher is busy
+            self._slots.acquire()
+            try:
+                self._flushers.submit(self._flush, batch)
+            except Exception as e:
+                self._slots.release()
+                self._fail(batch, e)
+
+    def _fail(self, batch, error):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def _flush(self, batch):
+        try:
+            waiting = {}
+            for text, future in batch:
+                if future.set_running_or_notify_cancel():
+                    waiting.setdefault(text, []).append(future)
+            if not waiting:
+                return
+            EMBED_BATCHES.inc()
+            EMBED_BATCH_SIZE.observe(len(waiting))
+            EMBED_TEXTS.inc(len(waiting), stage="sent")
+            EMBED_TEXTS.inc(sum(len(f) for f in waiting.values()) - len(waiting), stage="deduplicated")
+            with metrics.timed("embedding.batch"):
+                if self.embed_many is not None:
+                    self._embed_batch(waiting)
+                elif len(waiting) == 1:
+                    self._embed_text(*next(iter(waiting.items())))
+                else:
+                    # Each text's callers are answered as soon as its own request returns
+                    for done in [self._fanout.submit(self._embed_text, t, f) for t, f in waiting.items()]:
+                        done.result()
+        except Exception as e:
+            logger.exception("❌ Embedding batch failed unexpectedly: %s", e)
+            self._fail(batch, e)
+        finally:
+            self._slots.release()
+
+    def _embed_batch(self, waiting):
+        texts = list(waiting)
+        try:
+            vectors = self.embed_many(texts)
+            if len(vectors) != len(texts):
+                raise RuntimeError(f"expected {len(texts)} embeddings, got {len(vectors)}")
+        except Exception as e:
+            for futures in waiting.values():
+                for future in futures:
+                    future.set_exception(e)
+            return
+        for text, vector in zip(texts, vectors):
+            for future in waiting[text]:
+                future.set_result(vector)
+
+    def _embed_text(self, text, futures):
+        try:
+            vector = self.embed_one(text)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future in futures:
+            future.set_result(vector)
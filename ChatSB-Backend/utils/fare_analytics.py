@@ -0,0 +1,212 @@
+# utils/fare_analytics.py
+import os
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from utils import flight_cache, metrics
+from utils.flight_cache import TTLCache
+from utils.get_flights import LOCAL_FILTER_PARAMS, build_search_params, build_booking_params
+from utils.flight_pipeline import flight_price
+from utils.logger import get_logger
+
+load_dotenv()
+
+logger = get_logger("fare_analytics")
+
+# Seconds a route's flattened tables are reused before re-reading the cache
+FARE_ANALYTICS_TTL = float(os.getenv("FARE_ANALYTICS_TTL", "60"))
+
+_tables = TTLCache(max_entries=int(os.getenv("FARE_ANALYTICS_MAX_ROUTES", "200")))
+
+
+def _segment_hour(segment):
+    # SerpAPI times look like "2025-09-30 06:00"
+    time = (segment.get("departure_airport") or {}).get("time") or ""
+    try:
+        return int(time[-5:-3])
+    except ValueError:
+        return -1
+
+
+def flatten(searches, bookings):
+    """
+    Flatten SerpAPI search payloads and booking payloads (by booking_token)
+    into two columnar tables, one Python pass over the nested dicts:
+    itineraries (token, airline, hour, stops, duration, price) and
+    offers (itinerary row, seller, price).
+    """
+    tokens, airlines, hours, stops, durations, prices = [], [], [], [], [], []
+    offer_rows, sellers, offer_prices = [], [], []
+    seen = set()
+    for search in searches:
+        for flight in (search.get("best_flights") or []) + (search.get("other_flights") or []):
+            token = flight.get("booking_token")
+            if token is not None:
+                if token in seen:
+                    continue
+                seen.add(token)
+            segments = flight.get("flights") or [{}]
+            carriers = {s.get("airline") for s in segments if s.get("airline")}
+            row = len(tokens)
+            tokens.append(token)
+            airlines.append(carriers.pop() if len(carriers) == 1 else ("Multiple" if carriers else "Unknown"))
+            hours.append(_segment_hour(segments[0]))
+            stops.append(len(segments) - 1)
+            durations.append(flight.get("total_duration") or sum(s.get("duration") or 0 for s in segments))
+            prices.append(flight_price(flight) or np.nan)
+
+            for option in (bookings.get(token) or {}).get("booking_options") or []:
+                together = option.get("together") or {}
+                price = together.get("price")
+                if isinstance(price, (int, float)):
+                    offer_rows.append(row)
+                    sellers.append(together.get("book_with") or "Unknown")
+                    offer_prices.append(price)
+
+    itineraries = pd.DataFrame({
+        "token": tokens,
+        "airline": pd.Categorical(airlines),
+        "hour": np.asarray(hours, dtype=np.int8),
+        "stops": np.asarray(stops, dtype=np.int8),
+        "duration": np.asarray(durations, dtype=np.int32),
+        "price": np.asarray(prices, dtype=np.float64),
+    })
+    offers = pd.DataFrame({
+        "row": np.asarray(offer_rows, dtype=np.int64),
+        "seller": pd.Categorical(sellers),
+        "price": np.asarray(offer_prices, dtype=np.float64),
+    })
+    # Itineraries priced only through their booking options
+    if len(offers):
+        best_offer = offers.groupby("row")["price"].min()
+        missing = itineraries["price"].isna().to_numpy()
+        itineraries.loc[missing, "price"] = best_offer.reindex(np.flatnonzero(missing)).to_numpy()
+    return itineraries, offers
+
+
+def cheapest_by_airline(itineraries: pd.DataFrame):
+    priced = itineraries.dropna(subset=["price"])
+    best = priced.loc[priced.groupby("airline", observed=True)["price"].idxmin()]
+    best = best.sort_values("price")
+    return [
+        {"airline": airline, "price": int(price), "stops": int(stops)}
+        for airline, price, stops in zip(best["airline"], best["price"], best["stops"])
+    ]
+
+
+def price_by_hour(itineraries: pd.DataFrame):
+    priced = itineraries[(itineraries["hour"] >= 0) & itineraries["price"].notna()]
+    stats = priced.groupby("hour")["price"].agg(["min", "median", "count"])
+    return [
+        {"hour": int(hour), "min": int(row_min), "median": float(median), "count": int(count)}
+        for hour, row_min, median, count in zip(stats.index, stats["min"], stats["median"], stats["count"])
+    ]
+
+
+def seller_spread(offers: pd.DataFrame):
+    """
+    Per itinerary: cheapest and dearest seller price. Per seller: how many
+    offers it has, how often it is the cheapest, and its median premium
+    over the cheapest offer for the same itinerary.
+    """
+    if not len(offers):
+        return {"median_spread": None, "max_spread": None, "sellers": []}
+    by_row = offers.groupby("row")["price"]
+    cheapest = by_row.transform("min").to_numpy()
+    spread = (by_row.max() - by_row.min()).to_numpy()
+    premium = offers["price"].to_numpy() - cheapest
+
+    per_seller = pd.DataFrame({
+        "seller": offers["seller"],
+        "premium": premium,
+        "cheapest": premium == 0,
+    }).groupby("seller", observed=True).agg(
+        offers=("premium", "size"), median_premium=("premium", "median"), cheapest_share=("cheapest", "mean"),
+    ).sort_values(["cheapest_share", "median_premium"], ascending=[False, True])
+
+    return {
+        "median_spread": float(np.median(spread)),
+        "max_spread": float(spread.max()),
+        "sellers": [
+            {"seller": seller, "offers": int(n), "median_premium": float(p), "cheapest_share": round(float(s), 3)}
+            for seller, n, p, s in zip(per_seller.index, per_seller["offers"],
+                                       per_seller["median_premium"], per_seller["cheapest_share"])
+        ],
+    }
+
+
+def _cached_payloads(departure_id, arrival_id, departure_date):
+    """
+    Every cached search for the route (any budget) and the cached booking
+    payloads of their itineraries.
+    """
+    params = build_search_params(departure_id, arrival_id, departure_date)
+    budgets = {None} | set(flight_cache.indexed_values(params, "max_price", LOCAL_FILTER_PARAMS))
+    searches = []
+    for max_price in budgets:
+        search = flight_cache.get_stale(build_search_params(departure_id, arrival_id, departure_date, max_price))
+        if search:
+            searches.append(search)
+
+    tokens = []
+    for search in searches:
+        for flight in (search.get("best_flights") or []) + (search.get("other_flights") or []):
+            token = flight.get("booking_token")
+            if token:
+                tokens.append(token)
+    tokens = list(dict.fromkeys(tokens))
+    # Deep-search options when cached, else the shallow two-phase ones;
+    # one batched read for the whole route
+    keys = {
+        (token, deep): flight_cache.cache_key(
+            build_booking_params(token, departure_date, departure_id, arrival_id, deep=deep)
+        )
+        for token in tokens for deep in (True, False)
+    }
+    cached = flight_cache.lookup_many(keys.values())
+    bookings = {}
+    for token in tokens:
+        booking = cached.get(keys[(token, True)]) or cached.get(keys[(token, False)])
+        if booking:
+            bookings[token] = booking
+    return searches, bookings
+
+
+def route_tables(departure_id, arrival_id, departure_date):
+    """
+    Flattened (itineraries, offers) for a route, rebuilt at most every
+    FARE_ANALYTICS_TTL seconds. None if nothing is cached for it.
+    """
+    key = (departure_id.upper(), arrival_id.upper(), departure_date)
+    tables = _tables.get(key, max_age=FARE_ANALYTICS_TTL)
+    metrics.record_cache("fare_analytics", tables is not None)
+    if tables is None:
+        with metrics.timed("fare_analytics.flatten"):
+            searches, bookings = _cached_payloads(*key)
+            if not searches:
+                return None
+            tables = flatten(searches, bookings)
+        _tables.set(key, tables)
+    return tables
+
+
+def route_analytics(departure_id, arrival_id, departure_date):
+    """
+    Fare aggregates for a route from cached SerpAPI answers only (no
+    upstream calls). None if the route has not been searched recently.
+    """
+    tables = route_tables(departure_id, arrival_id, departure_date)
+    if tables is None:
+        return None
+    itineraries, offers = tables
+    with metrics.timed("fare_analytics.aggregate"):
+        return {
+            "departure_id": departure_id.upper(),
+            "arrival_id": arrival_id.upper(),
+            "departure_date": departure_date,
+            "itineraries": len(itineraries),
+            "offers": len(offers),
+            "cheapest_by_airline": cheapest_by_airline(itineraries),
+            "price_by_hour": price_by_hour(itineraries),
+            "seller_spread": seller_spread(offers),
+        }
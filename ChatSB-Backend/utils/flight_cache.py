@@ -0,0 +1,384 @@
+# utils/flight_cache.py
+import os
+import json
+import time
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from utils import metrics, mongoDB, resilience
+from utils.logger import get_logger
+
+load_dotenv()
+
+logger = get_logger("flight_cache")
+
+FLIGHT_CACHE_MAX_ENTRIES = int(os.getenv("FLIGHT_CACHE_MAX_ENTRIES", "2000"))
+# How long a SerpAPI response is served as-is without calling SerpAPI (0 disables)
+FLIGHT_CACHE_TTL = float(os.getenv("FLIGHT_CACHE_TTL", "900"))
+# How long a last-good SerpAPI response may be served when the upstream is down
+FLIGHT_CACHE_STALE_TTL = float(os.getenv("FLIGHT_CACHE_STALE_TTL", "21600"))
+
+# Shared second-level tier in MongoDB so all workers reuse each other's SerpAPI answers
+FLIGHT_CACHE_L2 = os.getenv("FLIGHT_CACHE_L2", "true").lower() == "true"
+FLIGHT_CACHE_COLLECTION = os.getenv("FLIGHT_CACHE_COLLECTION", "flight_cache")
+FLIGHT_CACHE_L2_RETRY_S = float(os.getenv("FLIGHT_CACHE_L2_RETRY_S", "60"))
+
+# Params that do not change the SerpAPI answer
+_VOLATILE_PARAMS = {"api_key", "no_cache"}
+
+
+def cache_key(params: dict) -> str:
+    """
+    Content-addressed key for a SerpAPI request: SHA-256 of the canonical
+    JSON of its answer-relevant params.
+    """
+    relevant = {k: v for k, v in params.items() if k not in _VOLATILE_PARAMS and v is not None}
+    canonical = json.dumps(relevant, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU map whose entries remember when they were stored;
+    readers decide how old an entry may be.
+    """
+
+    def __init__(self, max_entries: int = FLIGHT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set(self, key, value, stored_at: float = None):
+        with self._lock:
+            self._data[key] = (value, stored_at if stored_at is not None else time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def get(self, key, max_age: float = None):
+        """
+        Value stored under `key` if it is at most `max_age` seconds old.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if max_age is not None and time.time() - stored_at > max_age:
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def age(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return None if entry is None else time.time() - entry[1]
+
+    def pop(self, key):
+        with self._lock:
+            return self._data.pop(key, (None, None))[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MongoCacheTier:
+    """
+    Second-level cache in a MongoDB collection shared by every worker.
+    Documents are keyed by cache_key() and hold the zlib-compressed JSON
+    payload; a TTL index on `expires_at` lets MongoDB drop them once they
+    are too old even to serve as a stale fallback. Writes happen on a
+    background thread; reads never wait for the connection, are bounded by
+    the `mongo_cache` upstream deadline, and any failure is treated as a miss.
+    """
+
+    def __init__(self, collection_name: str = FLIGHT_CACHE_COLLECTION, ttl: float = FLIGHT_CACHE_STALE_TTL):
+        self.collection_name = collection_name
+        self.ttl = ttl
+        self._collection = None
+        self._retry_at = 0.0
+        self._connector = None
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="flight-cache-l2")
+
+    def _connect(self):
+        coll = mongoDB.get_collection(mongoDB.connect_db(), self.collection_name)
+        if coll is not None:
+            try:
+                coll.create_index("expires_at", expireAfterSeconds=0)
+            except Exception as e:
+                logger.warning("⚠️ Could not create flight cache TTL index: %s", e)
+        with self._lock:
+            self._collection = coll
+            self._connector = None
+            if coll is None:
+                self._retry_at = time.monotonic() + FLIGHT_CACHE_L2_RETRY_S
+                logger.warning("⚠️ Flight cache L2 unavailable, retrying in %.0fs", FLIGHT_CACHE_L2_RETRY_S)
+
+    def collection(self, wait: bool = False):
+        """
+        The shared collection, or None while it is unavailable. Connecting
+        (server selection can take seconds) runs on a background thread, so
+        request-path reads never wait for it and count as misses until it
+        is up; only `wait` callers (the background writer) block on it.
+        After a failed connect, retry only every FLIGHT_CACHE_L2_RETRY_S seconds.
+        """
+        if self._collection is not None:
+            return self._collection
+        with self._lock:
+            if self._collection is None and self._connector is None and time.monotonic() >= self._retry_at:
+                self._connector = threading.Thread(target=self._connect, name="flight-cache-l2-connect", daemon=True)
+                self._connector.start()
+            connector = self._connector
+        if wait and connector is not None:
+            connector.join()
+        return self._collection
+
+    @staticmethod
+    def encode(value) -> bytes:
+        return zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"), 6)
+
+    @staticmethod
+    def decode(payload: bytes):
+        return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+    def get(self, key: str):
+        """
+        (value, stored_at epoch seconds) or None.
+        """
+        coll = self.collection()
+        if coll is None:
+            return None
+        try:
+            doc = resilience.MONGO_CACHE.call(coll.find_one, {"_id": key}, idempotent=True)
+        except Exception as e:
+            logger.debug("⚠️ Flight cache L2 read failed: %r", e)
+            doc = None
+        metrics.record_cache("flight_cache_l2", doc is not None)
+        if not doc:
+            return None
+        return self.decode(doc["payload"]), doc["stored_at"]
+
+    def get_many(self, keys, batch: int = 500):
+        """
+        {key: (value, stored_at)} for the keys present, one `$in` query per
+        `batch` keys.
+        """
+        coll = self.collection()
+        if coll is None:
+            return {}
+        found = {}
+        keys = list(keys)
+        for i in range(0, len(keys), batch):
+            chunk = keys[i:i + batch]
+            try:
+                docs = resilience.MONGO_CACHE.call(
+                    lambda: list(coll.find({"_id": {"$in": chunk}})), idempotent=True
+                )
+            except Exception as e:
+                logger.debug("⚠️ Flight cache L2 batch read failed: %r", e)
+                docs = []
+            for doc in docs:
+                found[doc["_id"]] = (self.decode(doc["payload"]), doc["stored_at"])
+        metrics.record_cache("flight_cache_l2", bool(found))
+        return found
+
+    def _write(self, key: str, value, stored_at: float):
+        coll = self.collection(wait=True)
+        if coll is None:
+            return
+        doc = {
+            "_id": key,
+            "payload": self.encode(value),
+            "stored_at": stored_at,
+            "expires_at": datetime.fromtimestamp(stored_at, timezone.utc) + timedelta(seconds=self.ttl),
+        }
+        try:
+            resilience.MONGO_CACHE.call(coll.replace_one, {"_id": key}, doc, upsert=True)
+        except Exception as e:
+            logger.debug("⚠️ Flight cache L2 write failed: %r", e)
+
+    def set(self, key: str, value, stored_at: float):
+        self._writer.submit(self._write, key, value, stored_at)
+
+
+# Last successful response per SerpAPI request, used as a degraded answer
+last_good = TTLCache()
+shared = MongoCacheTier() if FLIGHT_CACHE_L2 else None
+
+
+def _adopt(key: str):
+    """
+    Copy the shared tier's entry into L1 (keeping its original timestamp so
+    ages stay comparable across workers) if it is newer than ours.
+    """
+    found = shared.get(key)
+    if found is not None:
+        _adopt_value(key, *found)
+
+
+def _adopt_value(key: str, value, stored_at: float):
+    local_age = last_good.age(key)
+    if local_age is None or time.time() - stored_at < local_age:
+        last_good.set(key, value, stored_at=stored_at)
+
+
+def _lookup(key: str, max_age: float):
+    """
+    L1 first; on a miss (or a too-old L1 entry) another worker may hold a
+    newer answer in the shared tier.
+    """
+    value = last_good.get(key, max_age=max_age)
+    if value is not None or shared is None:
+        return value
+    _adopt(key)
+    return last_good.get(key, max_age=max_age)
+
+
+def lookup_many(keys, max_age: float = FLIGHT_CACHE_STALE_TTL):
+    """
+    {key: value} for the raw keys cached in either tier. L1 misses are read
+    from the shared tier in batched `$in` queries instead of one round
+    trip per key.
+    """
+    found, missing = {}, []
+    for key in keys:
+        value = last_good.get(key, max_age=max_age)
+        if value is None:
+            missing.append(key)
+        else:
+            found[key] = value
+    if missing and shared is not None:
+        for key, (value, stored_at) in shared.get_many(missing).items():
+            _adopt_value(key, value, stored_at)
+            value = last_good.get(key, max_age=max_age)
+            if value is not None:
+                found[key] = value
+    return found
+
+
+def put(key: str, value):
+    """
+    Store `value` under a raw key in both tiers.
+    """
+    stored_at = time.time()
+    last_good.set(key, value, stored_at=stored_at)
+    if shared is not None:
+        shared.set(key, value, stored_at)
+
+
+def lookup(key: str, max_age: float = FLIGHT_CACHE_STALE_TTL):
+    """
+    Value under a raw key from either tier, if at most `max_age` seconds old.
+    """
+    return _lookup(key, max_age)
+
+
+def remember(params: dict, results):
+    put(cache_key(params), results)
+
+
+def get_stale(params: dict):
+    return _lookup(cache_key(params), FLIGHT_CACHE_STALE_TTL)
+
+
+# Per route (search params minus the locally filterable ones): the values
+# those params had in searches we have cached, e.g. {None, "8000"} for max_price
+search_variants = TTLCache()
+
+
+def _route_key(params: dict, local_fields) -> str:
+    return cache_key({k: v for k, v in params.items() if k not in local_fields})
+
+
+def index_search(params: dict, field: str, local_fields=("max_price",)):
+    """
+    Record that a search with this `field` value is cached for its route.
+    """
+    route = _route_key(params, local_fields)
+    values = set(search_variants.get(route, max_age=FLIGHT_CACHE_TTL) or ())
+    values.add(params.get(field))
+    search_variants.set(route, frozenset(values))
+
+
+def indexed_values(params: dict, field: str, local_fields=("max_price",)):
+    """
+    `field` values of recently cached searches for the same route.
+    """
+    return search_variants.get(_route_key(params, local_fields), max_age=FLIGHT_CACHE_TTL) or frozenset()
+
+
+def get_fresh(params: dict, cache: str = "flight_search"):
+    """
+    Cached response younger than FLIGHT_CACHE_TTL, or None. Counted in
+    the cache hit-ratio metrics under `cache`.
+    """
+    if FLIGHT_CACHE_TTL <= 0:
+        return None
+    value = _lookup(cache_key(params), FLIGHT_CACHE_TTL)
+    metrics.record_cache(cache, value is not None)
+    return value
+
+
+def age(params: dict):
+    """
+    Seconds since the response for `params` was stored, or None.
+    """
+    key = cache_key(params)
+    age = last_good.age(key)
+    if shared is not None and (age is None or age >= FLIGHT_CACHE_TTL):
+        # Another worker (or node) may have refreshed it already
+        _adopt(key)
+        age = last_good.age(key)
+    return age
+
+
+class RouteStats:
+    """
+    Exponentially decaying popularity score per (departure, arrival, date):
+    every search adds 1 and scores halve every `half_life` seconds, so the
+    ranking follows recent traffic.
+    """
+
+    def __init__(self, half_life: float = 3600.0, max_routes: int = 500):
+        self.half_life = half_life
+        self.max_routes = max_routes
+        self._scores = {}
+        self._lock = threading.Lock()
+
+    def _decayed(self, entry, now):
+        score, updated = entry
+        return score * 0.5 ** ((now - updated) / self.half_life)
+
+    def record(self, departure_id: str, arrival_id: str, date: str):
+        route = (str(departure_id).upper(), str(arrival_id).upper(), str(date))
+        now = time.time()
+        with self._lock:
+            entry = self._scores.get(route)
+            score = self._decayed(entry, now) if entry else 0.0
+            self._scores[route] = (score + 1.0, now)
+            if len(self._scores) > self.max_routes:
+                coldest = min(self._scores, key=lambda r: self._decayed(self._scores[r], now))
+                del self._scores[coldest]
+
+    def top(self, n: int, min_score: float = 0.0):
+        """
+        Up to `n` (route, score) pairs, hottest first.
+        """
+        now = time.time()
+        with self._lock:
+            scored = [(route, self._decayed(entry, now)) for route, entry in self._scores.items()]
+        scored = [item for item in scored if item[1] >= min_score]
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:n]
+
+
+popular_routes = RouteStats(half_life=float(os.getenv("PREFETCH_HALF_LIFE_S", "3600")))
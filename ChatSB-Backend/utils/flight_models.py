@@ -0,0 +1,309 @@
+# utils/flight_models.py
+import sys
+from datetime import datetime, timezone
+
+# SerpAPI Google Flights local times, e.g. "2025-09-30 06:00"
+TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __repr__(self):
+        return "MISSING"
+
+
+# Marks a key the payload did not have (None would be an explicit null)
+MISSING = _Missing()
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def _strings(value):
+    """
+    List of strings -> tuple of interned strings (anything else as-is).
+    """
+    if type(value) is list and all(type(v) is str for v in value):
+        return tuple(sys.intern(v) for v in value)
+    return value
+
+
+def _list(value):
+    return list(value) if type(value) is tuple else value
+
+
+def to_epoch(text):
+    """
+    Wall-clock time as epoch seconds (read as UTC, so no timezone is
+    invented), or the original value when it would not format back to the
+    same string.
+    """
+    if type(text) is not str:
+        return text
+    try:
+        seconds = int(datetime.strptime(text, TIME_FORMAT).replace(tzinfo=timezone.utc).timestamp())
+    except ValueError:
+        return text
+    return seconds if from_epoch(seconds) == text else text
+
+
+def from_epoch(value):
+    if type(value) is not int:
+        return value
+    return datetime.fromtimestamp(value, timezone.utc).strftime(TIME_FORMAT)
+
+
+def _split(data: dict, known):
+    """
+    Known keys in order (MISSING when absent) and a dict of the rest (None
+    when there is nothing else), so unknown SerpAPI fields survive.
+    """
+    values = [data.get(key, MISSING) for key in known]
+    if len(data) == sum(v is not MISSING for v in values):
+        return values, None
+    return values, {k: v for k, v in data.items() if k not in known}
+
+
+def _join(keys, values, extra):
+    out = {key: value for key, value in zip(keys, values) if value is not MISSING}
+    if extra:
+        out.update(extra)
+    return out
+
+
+class Segment:
+    """
+    One flight of an itinerary (an entry of SerpAPI's `flights` list).
+    Airports are flattened into slots and times kept as epoch seconds.
+    """
+
+    __slots__ = (
+        "departure_name", "departure_id", "departure_time",
+        "arrival_name", "arrival_id", "arrival_time",
+        "duration", "airplane", "airline", "airline_logo", "travel_class",
+        "flight_number", "legroom", "extensions", "overnight", "often_delayed", "extra",
+    )
+    KEYS = (
+        "departure_airport", "arrival_airport", "duration", "airplane", "airline", "airline_logo",
+        "travel_class", "flight_number", "legroom", "extensions", "overnight", "often_delayed_by_over_30_min",
+    )
+    AIRPORT_KEYS = ("name", "id", "time")
+
+    @classmethod
+    def from_json(cls, data: dict):
+        values, extra = _split(data, cls.KEYS)
+        (departure, arrival, duration, airplane, airline, logo, travel_class,
+         flight_number, legroom, extensions, overnight, often_delayed) = values
+        seg = cls.__new__(cls)
+        for prefix, airport in (("departure", departure), ("arrival", arrival)):
+            if (type(airport) is dict and airport and airport.keys() <= set(cls.AIRPORT_KEYS)
+                    and type(airport.get("time", "")) is str):
+                name, code, time = (airport.get(k, MISSING) for k in cls.AIRPORT_KEYS)
+                setattr(seg, f"{prefix}_name", _intern(name))
+                setattr(seg, f"{prefix}_id", _intern(code))
+                setattr(seg, f"{prefix}_time", to_epoch(time))
+            else:
+                # Unexpected airport shape: keep it verbatim
+                extra = {**(extra or {}), f"{prefix}_airport": airport} if airport is not MISSING else extra
+                for field in ("name", "id", "time"):
+                    setattr(seg, f"{prefix}_{field}", MISSING)
+        seg.duration = duration
+        seg.airplane = _intern(airplane)
+        seg.airline = _intern(airline)
+        seg.airline_logo = _intern(logo)
+        seg.travel_class = _intern(travel_class)
+        seg.flight_number = flight_number
+        seg.legroom = _intern(legroom)
+        seg.extensions = _strings(extensions)
+        seg.overnight = overnight
+        seg.often_delayed = often_delayed
+        seg.extra = extra
+        return seg
+
+    def _airport(self, prefix):
+        values = (getattr(self, f"{prefix}_name"), getattr(self, f"{prefix}_id"),
+                  from_epoch(getattr(self, f"{prefix}_time")))
+        if all(v is MISSING for v in values):
+            return MISSING
+        return _join(self.AIRPORT_KEYS, values, None)
+
+    def to_json(self) -> dict:
+        return _join(self.KEYS, (
+            self._airport("departure"), self._airport("arrival"), self.duration, self.airplane, self.airline,
+            self.airline_logo, self.travel_class, self.flight_number, self.legroom, _list(self.extensions),
+            self.overnight, self.often_delayed,
+        ), self.extra)
+
+
+class Itinerary:
+    """
+    A SerpAPI search result entry (best_flights / other_flights), also the
+    shape of booking responses' `selected_flights`.
+    """
+
+    __slots__ = (
+        "segments", "layovers", "total_duration", "carbon_emissions", "price", "type",
+        "airline_logo", "extensions", "booking_token", "extra",
+    )
+    KEYS = (
+        "flights", "layovers", "total_duration", "carbon_emissions", "price", "type",
+        "airline_logo", "extensions", "booking_token",
+    )
+
+    @classmethod
+    def from_json(cls, data: dict):
+        values, extra = _split(data, cls.KEYS)
+        flights, layovers, total_duration, carbon, price, kind, logo, extensions, token = values
+        it = cls.__new__(cls)
+        it.segments = (
+            tuple(Segment.from_json(s) for s in flights)
+            if type(flights) is list and all(type(s) is dict for s in flights) else flights
+        )
+        it.layovers = layovers
+        it.total_duration = total_duration
+        it.carbon_emissions = carbon
+        it.price = price
+        it.type = _intern(kind)
+        it.airline_logo = _intern(logo)
+        it.extensions = _strings(extensions)
+        it.booking_token = token
+        it.extra = extra
+        return it
+
+    def to_json(self) -> dict:
+        flights = self.segments
+        if type(flights) is tuple:
+            flights = [s.to_json() for s in flights]
+        return _join(self.KEYS, (
+            flights, self.layovers, self.total_duration, self.carbon_emissions, self.price, self.type,
+            self.airline_logo, _list(self.extensions), self.booking_token,
+        ), self.extra)
+
+
+class BookingOption:
+    """
+    A `{"together": {...}}` booking option: one seller and its price.
+    """
+
+    __slots__ = (
+        "book_with", "airline_logos", "marketed_as", "price", "baggage_prices",
+        "booking_url", "booking_post_data", "booking_request", "extra",
+    )
+    KEYS = ("book_with", "airline_logos", "marketed_as", "price", "baggage_prices", "booking_request")
+
+    @classmethod
+    def from_json(cls, data: dict):
+        """
+        None when the option is not the single-seller `together` shape.
+        """
+        together = data.get("together")
+        if len(data) != 1 or type(together) is not dict:
+            return None
+        values, extra = _split(together, cls.KEYS)
+        book_with, logos, marketed_as, price, baggage, request = values
+        opt = cls.__new__(cls)
+        opt.book_with = _intern(book_with)
+        opt.airline_logos = _strings(logos)
+        opt.marketed_as = _strings(marketed_as)
+        opt.price = price
+        opt.baggage_prices = _strings(baggage)
+        if type(request) is dict and request.keys() == {"url", "post_data"}:
+            opt.booking_url, opt.booking_post_data = _intern(request["url"]), request["post_data"]
+            opt.booking_request = MISSING
+        else:
+            opt.booking_url = opt.booking_post_data = MISSING
+            opt.booking_request = request
+        opt.extra = extra
+        return opt
+
+    def to_json(self) -> dict:
+        request = self.booking_request
+        if self.booking_url is not MISSING:
+            request = {"url": self.booking_url, "post_data": self.booking_post_data}
+        return {"together": _join(self.KEYS, (
+            self.book_with, _list(self.airline_logos), _list(self.marketed_as), self.price,
+            _list(self.baggage_prices), request,
+        ), self.extra)}
+
+
+def _itineraries(value):
+    if type(value) is list and all(type(f) is dict for f in value):
+        return tuple(Itinerary.from_json(f) for f in value)
+    return value
+
+
+def _itineraries_json(value):
+    return [f.to_json() for f in value] if type(value) is tuple else value
+
+
+class SearchResult:
+    """
+    Compact SerpAPI flight search response.
+    """
+
+    __slots__ = ("best_flights", "other_flights", "extra")
+    KEYS = ("best_flights", "other_flights")
+
+    @classmethod
+    def from_json(cls, data: dict):
+        (best, other), extra = _split(data, cls.KEYS)
+        result = cls.__new__(cls)
+        result.best_flights = _itineraries(best)
+        result.other_flights = _itineraries(other)
+        result.extra = extra
+        return result
+
+    def to_json(self) -> dict:
+        return _join(self.KEYS, (_itineraries_json(self.best_flights), _itineraries_json(self.other_flights)),
+                     self.extra)
+
+
+class BookingResult:
+    """
+    Compact SerpAPI booking options response.
+    """
+
+    __slots__ = ("selected_flights", "booking_options", "extra")
+    KEYS = ("selected_flights", "booking_options")
+
+    @classmethod
+    def from_json(cls, data: dict):
+        (selected, options), extra = _split(data, cls.KEYS)
+        result = cls.__new__(cls)
+        result.selected_flights = _itineraries(selected)
+        if type(options) is list and all(type(o) is dict for o in options):
+            # Options of other shapes (e.g. separate tickets) are kept as dicts
+            options = tuple(BookingOption.from_json(o) or o for o in options)
+        result.booking_options = options
+        result.extra = extra
+        return result
+
+    def to_json(self) -> dict:
+        options = self.booking_options
+        if type(options) is tuple:
+            options = [o.to_json() if type(o) is BookingOption else o for o in options]
+        return _join(self.KEYS, (_itineraries_json(self.selected_flights), options), self.extra)
+
+
+def pack(value):
+    """
+    Compact form of a SerpAPI search or booking response; other values
+    are returned unchanged.
+    """
+    if type(value) is dict:
+        if "best_flights" in value or "other_flights" in value:
+            return SearchResult.from_json(value)
+        if "booking_options" in value:
+            return BookingResult.from_json(value)
+    return value
+
+
+def unpack(value):
+    """
+    Inverse of pack(): the original JSON shape.
+    """
+    if type(value) in (SearchResult, BookingResult):
+        return value.to_json()
+    return value
@@ -0,0 +1,196 @@
+# utils/flight_pipeline.py
+# Pure-Python post-processing of SerpAPI flight payloads (no I/O), shared by
+# get_flights and model_with_tool and measured by benchmarks/bench_flight_pipeline.py
+import re
+import heapq
+import logging
+from utils.logger import get_logger, debug_sampled
+
+logger = get_logger("flight_pipeline")
+
+_NON_DIGITS_RE = re.compile(r"\D")
+
+# Phrases the flight tool treats as "no budget"
+TOOL_NO_LIMIT_PHRASES = ("no preference", "no budget", "any price", "unlimited", "no limit")
+# rag_agent is looser: any mention of "any" (any price, anything, ...) lifts the limit
+USER_NO_LIMIT_PHRASES = ("any", "no budget", "no preference", "unlimited", "no limit")
+
+# One alternation scan instead of a substring test per phrase
+_TOOL_NO_LIMIT_RE = re.compile("|".join(map(re.escape, TOOL_NO_LIMIT_PHRASES)))
+_USER_NO_LIMIT_RE = re.compile("|".join(map(re.escape, USER_NO_LIMIT_PHRASES)))
+
+
+def normalize_price(value):
+    """
+    Normalize a price string into digits only.
+    Examples:
+      "Rs19000" -> "19000"
+      "₹ 19,000" -> "19000"
+      "19000" -> "19000"
+    Returns None if no valid digits found.
+    """
+    if not value:
+        return None
+    if type(value) is int:
+        return str(value) if value > 0 else str(-value)
+    cleaned = _NON_DIGITS_RE.sub("", str(value))
+    return cleaned or None
+
+
+def price_limit(max_price):
+    """
+    Budget as an int, or None when there is no usable limit.
+    """
+    cleaned = normalize_price(max_price)
+    return int(cleaned) if cleaned else None
+
+
+def flight_price(flight):
+    """
+    Price of a SerpAPI flight as an int, or None if it cannot be determined.
+    Accepts the raw SerpAPI shape (`"price": 5639`) as well as
+    `{"price": {"amount": ...}}` and a flat `price_amount`.
+    """
+    amount = flight.get("price")
+    if type(amount) is dict:
+        amount = amount.get("amount")
+    if amount is None:
+        amount = flight.get("price_amount")
+    if not amount:
+        return None
+    if type(amount) is int:
+        return amount
+    try:
+        return int(str(amount).replace(",", ""))
+    except (ValueError, TypeError):
+        return None
+
+
+def is_flight_under_budget(flight, max_price):
+    """
+    Quick check if a flight is under budget before making expensive booking API calls.
+    Returns True if flight is under budget or if price cannot be determined.
+    """
+    limit = price_limit(max_price)
+    if limit is None:
+        return True  # No (valid) budget limit
+
+    price = flight_price(flight)
+    if price is None:
+        debug_sampled(logger, "⚠️ No parseable price for flight, including anyway")
+        return True  # Include flights without price info
+    is_under = price <= limit
+    debug_sampled(logger, "💰 Flight price %s %s max %s", price, "≤" if is_under else ">", limit)
+    return is_under
+
+
+def filter_under_budget(flights, max_price):
+    """
+    Single-pass budget filter: the limit is parsed once for the whole list
+    instead of once per flight. Flights without a parseable price are kept.
+    """
+    limit = price_limit(max_price)
+    if limit is None:
+        return list(flights)
+
+    debug = logger.isEnabledFor(logging.DEBUG)
+    kept = []
+    append = kept.append
+    for flight in flights:
+        price = flight_price(flight)
+        if price is None or price <= limit:
+            append(flight)
+        elif debug:
+            debug_sampled(logger, "💰 Flight price %s > max %s", price, limit)
+    return kept
+
+
+def merge_flight_results(results):
+    """
+    best_flights followed by other_flights, as one list.
+    """
+    return [*(results.get("best_flights") or ()), *(results.get("other_flights") or ())]
+
+
+def selected_flight_segments(booking_response):
+    """
+    Segments of the first selected flight in a booking-options response.
+    """
+    selected = booking_response.get("selected_flights")
+    if selected and type(selected) is list:
+        first = selected[0]
+        if type(first) is dict:
+            return first.get("flights") or []
+    return []
+
+
+def build_enhanced_flight(booking_response):
+    """
+    The tool's per-itinerary output shape: segments + booking options.
+    """
+    return {
+        "flight_data": selected_flight_segments(booking_response),
+        "booking_options": booking_response.get("booking_options", []),
+    }
+
+
+def build_unavailable_flight(flight):
+    """
+    Tool output for an itinerary whose booking options could not be
+    fetched: its search segments, no booking options, flagged so the
+    answer can say so instead of dropping the flight.
+    """
+    return {"flight_data": flight.get("flights") or [], "booking_options": [], "booking_unavailable": True}
+
+
+def cheapest_combinations(legs, k=5, max_total=None):
+    """
+    The k cheapest ways to pick one flight per leg, cheapest first, without
+    building the cross-product: a heap over index tuples into the
+    price-sorted legs, where each step moves one leg to its next-cheapest
+    flight. Flights without a parseable price are skipped.
+    Returns [(total_price, [flight for each leg]), ...].
+    """
+    priced = []
+    for flights in legs:
+        options = [(p, f) for f in flights if (p := flight_price(f)) is not None]
+        if not options:
+            return []
+        options.sort(key=lambda option: option[0])
+        priced.append(options)
+    if not priced:
+        return []
+
+    start = (0,) * len(priced)
+    heap = [(sum(options[0][0] for options in priced), start)]
+    seen = {start}
+    combos = []
+    while heap and len(combos) < k:
+        total, idx = heapq.heappop(heap)
+        if max_total is not None and total > max_total:
+            break  # every remaining combination is at least as expensive
+        combos.append((total, [priced[leg][j][1] for leg, j in enumerate(idx)]))
+        for leg, j in enumerate(idx):
+            if j + 1 < len(priced[leg]):
+                nxt = idx[:leg] + (j + 1,) + idx[leg + 1:]
+                if nxt not in seen:
+                    seen.add(nxt)
+                    heapq.heappush(heap, (total - priced[leg][j][0] + priced[leg][j + 1][0], nxt))
+    return combos
+
+
+def is_no_limit(value, pattern=_TOOL_NO_LIMIT_RE):
+    return pattern.search(str(value).lower()) is not None
+
+
+def parse_user_max_price(value):
+    """
+    Normalize the model-supplied max_price for rag_agent.
+    Returns (digits or None, no_limit) where no_limit is True when the user
+    explicitly asked for no budget.
+    """
+    raw = str(value).lower()
+    if _USER_NO_LIMIT_RE.search(raw):
+        return None, True
+    cleaned = _NON_DIGITS_RE.sub("", raw)
+    return (cleaned or None), False
@@ -2,67 +2,119 @@
 # this code runs max price
 # get_flights.py
 import os
-import re
+import asyncio
+import logging
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from serpapi import GoogleSearch
-from langchain_core.tools import tool
+from pydantic import BaseModel, Field
+from langchain_core.tools import StructuredTool
+from utils import metrics, tracing, serpapi_scheduler, serpapi_async, resilience, flight_cache, booking_jobs
+from utils.serpapi_scheduler import PRIORITY_INTERACTIVE, PRIORITY_BOOKING, PRIORITY_PREFETCH
+from utils.logger import get_logger, debug_sampled, redact_params
+from utils.flight_pipeline import (
+    normalize_price,
+    is_flight_under_budget,
+    filter_under_budget,
+    merge_flight_results,
+    build_enhanced_flight,
+    build_unavailable_flight,
+    is_no_limit,
+    price_limit,
+    flight_price,
+    cheapest_combinations,
+)
 
 load_dotenv()
 
-def normalize_price(value):
+logger = get_logger("get_flights")
+
+MULTI_LEG_MAX_LEGS = int(os.getenv("MULTI_LEG_MAX_LEGS", "6"))
+# Itineraries (one flight per leg) returned by the multi-leg tool
+MULTI_LEG_TOP_K = int(os.getenv("MULTI_LEG_TOP_K", "5"))
+# SerpAPI type for each leg of a multi-leg trip (2 = one way)
+LEG_FLIGHT_TYPE = "2"
+
+# SerpAPI search params the tool can also apply itself on a cached superset
+LOCAL_FILTER_PARAMS = ("max_price",)
+
+# Booking lookups one tool call keeps in the SerpAPI scheduler queue at once,
+# so a single chat cannot fill the shared queue and get its own lookups shed
+BOOKING_FANOUT = int(os.getenv("SERPAPI_BOOKING_FANOUT", "4"))
+
+BOOKING_UNAVAILABLE = metrics.counter(
+    "chatsb_booking_unavailable_total", "Itineraries returned without booking options (lookup shed or failed)."
+)
+
+
+def _with_booking(flight, booking_response):
     """
-    Normalize a price string into digits only.
-    Examples:
-      "Rs19000" -> "19000"
-      "₹ 19,000" -> "19000"
-      "19000" -> "19000"
-    Returns None if no valid digits found.
+    The tool's entry for one itinerary; counted and flagged when its
+    booking lookup came back empty.
     """
-    if not value:
-        return None
-    cleaned = re.sub(r"[^\d]", "", str(value))
-    return cleaned if cleaned.isdigit() else None
+    if booking_response:
+        return build_enhanced_flight(booking_response)
+    BOOKING_UNAVAILABLE.inc()
+    return build_unavailable_flight(flight)
+
+
+# Background deep searches running at once across all chats in this process
+DEEP_SEARCH_CONCURRENCY = int(os.getenv("SERPAPI_DEEP_SEARCH_CONCURRENCY", "8"))
+_deep_search_gate = asyncio.Semaphore(max(DEEP_SEARCH_CONCURRENCY, 1))
 
+# Booking lookups in flight, by cache key: concurrent chats asking for the
+# same itinerary share one SerpAPI call
+_booking_inflight = {}
 
-def is_flight_under_budget(flight, max_price):
+
+async def _gather_bookings(lookup, items, gate=None):
     """
-    Quick check if a flight is under budget before making expensive booking API calls.
-    Returns True if flight is under budget or if price cannot be determined.
+    await lookup(item) for every item, in order, with at most
+    BOOKING_FANOUT (or what `gate` allows) waiting on the scheduler at a time.
     """
-    if not max_price:
-        return True  # No budget limit
-    
-    cleaned_max_price = normalize_price(max_price)
-    if not cleaned_max_price:
-        return True  # Invalid max_price, show all flights
-    
-    # Extract price from flight data
-    price_amount = None
-    price_obj = flight.get("price", {})
-    if isinstance(price_obj, dict):
-        price_amount = price_obj.get("amount")
-    
-    if price_amount is None:
-        price_amount = flight.get("price_amount")
-    
-    if price_amount:
-        try:
-            price_int = int(str(price_amount).replace(",", ""))
-            is_under = price_int <= int(cleaned_max_price)
-            print(f"💰 [DEBUG] Flight price {price_int} {'≤' if is_under else '>'} max {cleaned_max_price}")
-            return is_under
-        except (ValueError, TypeError):
-            print(f"⚠️ [DEBUG] Could not parse price: {price_amount}, including flight")
-            return True  # Include flights with unparseable prices
-    
-    print(f"⚠️ [DEBUG] No price found for flight, including anyway")
-    return True  # Include flights without price info
+    gate = gate or asyncio.Semaphore(max(BOOKING_FANOUT, 1))
+
+    async def bounded(item):
+        async with gate:
+            return await lookup(item)
+
+    return await asyncio.gather(*(bounded(item) for item in items))
 
 
-def get_flights(departure_id, arrival_id, departure_date, max_price=None):
+async def _shared_lookup(key, lookup):
     """
-    Call SerpAPI Google Flights engine to fetch flights.
-    Uses SerpAPI's max_price filter to reduce API calls.
+    Join the in-flight lookup for `key`, or start it. A caller that is
+    cancelled leaves the lookup running for the others.
+    """
+    task = _booking_inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(lookup())
+        _booking_inflight[key] = task
+        task.add_done_callback(lambda _: _booking_inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+def _remember(params, results):
+    if isinstance(results, dict) and "error" not in results:
+        flight_cache.remember(params, results)
+        if "booking_token" not in params:
+            flight_cache.index_search(params, "max_price", LOCAL_FILTER_PARAMS)
+
+
+def _search_serpapi(params, priority):
+    """
+    One scheduled SerpAPI request; successful answers are kept as the
+    degraded fallback for when SerpAPI is slow or down.
+    """
+    results = serpapi_scheduler.search(params, priority)
+    _remember(params, results)
+    return results
+
+
+def build_search_params(departure_id, arrival_id, departure_date, max_price=None, flight_type=None):
+    """
+    SerpAPI params for a flight search (also the flight cache key input).
+    `flight_type` overrides FLIGHT_TYPE (1 round trip, 2 one way).
     """
     params = {
         "api_key": os.getenv("SERPAPI_API_KEY"),
@@ -71,7 +123,7 @@ def get_flights(departure_id, arrival_id, departure_date, max_price=None):
         "gl": os.getenv("COUNTRY"),
         "currency": os.getenv("CURRENCY"),
         "no_cache": True,
-        "type": os.getenv("FLIGHT_TYPE"),
+        "type": flight_type or os.getenv("FLIGHT_TYPE"),
         "departure_id": departure_id,
         "arrival_id": arrival_id,
         "outbound_date": departure_date,
@@ -82,54 +134,199 @@ def get_flights(departure_id, arrival_id, departure_date, max_price=None):
         cleaned = normalize_price(max_price)
         if cleaned:
             params["max_price"] = cleaned
-            print(f"🔎 [DEBUG] Using SerpAPI max_price filter: {cleaned}")
+            logger.debug("🔎 Using SerpAPI max_price filter: %s", cleaned)
+    return params
 
-    print("🔎 [DEBUG] Params sent to SerpAPI:", params)
 
-    search = GoogleSearch(params)
-    results = search.get_dict()
+def build_booking_params(booking_token, departure_date, departure_id, arrival_id, deep=True, flight_type=None):
+    """
+    SerpAPI params for the booking options of one itinerary. `deep` adds
+    hidden and deep-search results (complete, but the slowest SerpAPI mode).
+    `flight_type` must match the search that produced the token (defaults
+    to FLIGHT_TYPE).
+    """
+    params = {
+        "api_key": os.getenv("SERPAPI_API_KEY"),
+        "engine": os.getenv("SEARCH_ENGINE"),
+        "hl": os.getenv("LANGUAGE"),
+        "gl": os.getenv("COUNTRY"),
+        "currency": os.getenv("CURRENCY"),
+        "type": flight_type or os.getenv("FLIGHT_TYPE"),
+        "no_cache": True,
+        "departure_id": departure_id,
+        "arrival_id": arrival_id,
+        "outbound_date": departure_date,
+        "booking_token": booking_token,
+    }
+    if deep:
+        params["show_hidden"] = "true"
+        params["deep_search"] = "true"
+    return params
 
-    best_flights = results.get("best_flights", [])
-    other_flights = results.get("other_flights", [])
-    all_flights = best_flights + other_flights
-    
-    print(f"🔎 [DEBUG] SerpAPI returned {len(all_flights)} flights")
+
+def _logged_search_params(departure_id, arrival_id, departure_date, max_price, flight_type):
+    params = build_search_params(departure_id, arrival_id, departure_date, max_price, flight_type)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("🔎 Params sent to SerpAPI: %s", redact_params(params))
+    return params
+
+
+def _logged_booking_params(booking_token, departure_date, departure_id, arrival_id, deep, flight_type):
+    params = build_booking_params(booking_token, departure_date, departure_id, arrival_id, deep, flight_type)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("🔎 Fetching booking options with: %s", redact_params(params))
+    return params
+
+
+def _booking_failed(booking_token, error):
+    """
+    Log a failed booking lookup; lookups return None instead of raising.
+    """
+    if isinstance(error, serpapi_scheduler.SchedulerRejected):
+        logger.warning("⏳ Booking options for token %s... shed by scheduler (%s)", str(booking_token)[:10], error.reason)
+    else:
+        logger.error("❌ Error fetching booking options for token %s...: %s", str(booking_token)[:10], error)
+    return None
+
+
+def _search_flights(results):
+    all_flights = merge_flight_results(results)
+    logger.debug("🔎 SerpAPI returned %d flights", len(all_flights))
     return all_flights
 
 
-def fetch_booking_options(booking_token, departure_date, departure_id, arrival_id):
+def _covers(cached_budget, budget):
+    return cached_budget is None or int(cached_budget) >= int(budget)
+
+
+def _refilter_cached(params):
+    """
+    Answer a budgeted search from a fresh cached search of the same route
+    with a looser (or no) max_price, filtered in memory, so "ok, what about
+    under 6000" after "under 8000" costs no SerpAPI calls. The tightest
+    covering superset is tried first. Returns the flights, or None.
+    """
+    budget = params.get("max_price")
+    if budget is None:
+        return None
+    candidates = {b for b in flight_cache.indexed_values(params, "max_price", LOCAL_FILTER_PARAMS)
+                  if b != budget and _covers(b, budget)}
+    # The unbounded search may have been cached by another worker or the prefetcher
+    candidates.add(None)
+    for candidate in sorted(candidates, key=lambda b: float("inf") if b is None else int(b)):
+        superset = {k: v for k, v in params.items() if k != "max_price"}
+        if candidate is not None:
+            superset["max_price"] = candidate
+        cached = flight_cache.get_fresh(superset, "flight_search_superset")
+        if cached is not None:
+            with tracing.span("refilter", superset_max_price=candidate):
+                flights = filter_under_budget(merge_flight_results(cached), budget)
+            logger.info("♻️ Re-filtered cached search (max_price %s) to %s locally", candidate, budget)
+            return flights
+    return None
+
+
+def _search_upstream(upstream, params, priority):
+    """
+    SerpAPI call through `upstream`. Background prefetch is never hedged.
+    """
+    return upstream.call(
+        _search_serpapi, params, priority,
+        idempotent=priority != PRIORITY_PREFETCH,
+        fallback=lambda: flight_cache.get_stale(params),
+    )
+
+
+def _cached_or_search(upstream, params, priority, cache, refresh):
+    """
+    Fresh cached answer when there is one (unless `refresh`), otherwise a
+    SerpAPI call through `upstream`.
+    """
+    if not refresh:
+        cached = flight_cache.get_fresh(params, cache)
+        if cached is not None:
+            return cached
+    return _search_upstream(upstream, params, priority)
+
+
+def get_flights(departure_id, arrival_id, departure_date, max_price=None, priority=PRIORITY_INTERACTIVE, refresh=False, flight_type=None):
+    """
+    Call SerpAPI Google Flights engine to fetch flights.
+    Uses SerpAPI's max_price filter to reduce API calls.
+    Answers younger than FLIGHT_CACHE_TTL are served from the flight cache
+    unless `refresh` is set; a budgeted search can also be answered by
+    re-filtering a cached search with a looser budget. SerpAPI calls go through the shared scheduler
+    with a deadline, hedging and a circuit breaker; when SerpAPI fails the
+    last good answer for the same search is served. Raises
+    serpapi_scheduler.SchedulerRejected when the call is shed and nothing
+    is cached.
+    """
+    params = _logged_search_params(departure_id, arrival_id, departure_date, max_price, flight_type)
+
+    with metrics.timed("get_flights"):
+        results = None if refresh else flight_cache.get_fresh(params, "flight_search")
+        if results is None and not refresh:
+            refiltered = _refilter_cached(params)
+            if refiltered is not None:
+                return refiltered
+        if results is None:
+            results = _search_upstream(resilience.SERPAPI_SEARCH, params, priority)
+
+    return _search_flights(results)
+
+
+def fetch_booking_options(booking_token, departure_date, departure_id, arrival_id, priority=PRIORITY_BOOKING, refresh=False, deep=True, flight_type=None):
     """
     Fetch booking options for a given booking_token.
+    Returns None on failure, including when the scheduler sheds the call.
     """
     try:
-        params = {
-            "api_key": os.getenv("SERPAPI_API_KEY"),
-            "engine": os.getenv("SEARCH_ENGINE"),
-            "hl": os.getenv("LANGUAGE"),
-            "gl": os.getenv("COUNTRY"),
-            "currency": os.getenv("CURRENCY"),
-            "type": os.getenv("FLIGHT_TYPE"),
-            "no_cache": True,
-            "departure_id": departure_id,
-            "arrival_id": arrival_id,
-            "outbound_date": departure_date,
-            "booking_token": booking_token,
-            "show_hidden": "true",
-            "deep_search": "true",
-        }
+        params = _logged_booking_params(booking_token, departure_date, departure_id, arrival_id, deep, flight_type)
+        with metrics.timed("fetch_booking_options"):
+            return _cached_or_search(resilience.SERPAPI_BOOKING, params, priority, "booking_options", refresh)
+    except Exception as e:
+        return _booking_failed(booking_token, e)
 
-        print("🔎 [DEBUG] Fetching booking options with:", params)
 
-        search = GoogleSearch(params)
-        results = search.get_dict()
-        return results
-    except Exception as e:
-        print(f"❌ Error fetching booking options for token {booking_token}: {e}")
+def _resolve_max_price(max_price):
+    """
+    Budget the tool should apply: None for "no preference" style answers.
+    """
+    if not max_price:
+        return None
+    if is_no_limit(max_price):
+        logger.info("🔓 No price limit - showing all flights")
         return None
+    logger.info("💰 Price limit set to: %s", max_price)
+    return max_price
+
+
+def _start_aggregator(departure_id, arrival_id, departure_date, max_price, flavour):
+    """
+    Log the flight tool call, record the route's popularity (it feeds the
+    background prefetcher, utils/prefetch.py) and return the budget to
+    apply ("no preference" answers become None).
+    """
+    logger.info(
+        "🚀 Running get_flight_with_aggregator%s departure=%s arrival=%s date=%s max_price=%s",
+        flavour, departure_id, arrival_id, departure_date, max_price,
+    )
+    processed_max_price = _resolve_max_price(max_price)
+    flight_cache.popular_routes.record(departure_id, arrival_id, departure_date)
+    return processed_max_price
 
 
-@tool
-def get_flight_with_aggregator(
+def _bookable_under_budget(all_flights, max_price):
+    """
+    The searched itineraries under budget that have a booking token.
+    """
+    with tracing.span("filter_budget", flights=len(all_flights)):
+        budget_filtered_flights = filter_under_budget(all_flights, max_price)
+    logger.debug("🔎 Filtered %d flights to %d under budget", len(all_flights), len(budget_filtered_flights))
+    return [f for f in budget_filtered_flights if f.get("booking_token")]
+
+
+def _get_flight_with_aggregator(
     departure_id: str,
     arrival_id: str,
     departure_date: str,
@@ -143,66 +340,339 @@ def get_flight_with_aggregator(
     Args:
         max_price: Can be a number string (e.g., "15000"), None, or "no preference"
     """
-    print("🚀 [INFO] Running get_flight_with_aggregator")
-    print("   Departure:", departure_id)
-    print("   Arrival:", arrival_id)
-    print("   Date:", departure_date)
-    print("   Max Price:", max_price)
-
-    # Handle "no preference" cases
-    processed_max_price = None
-    if max_price:
-        max_price_lower = str(max_price).lower().strip()
-        if any(phrase in max_price_lower for phrase in ["no preference", "no budget", "any price", "unlimited", "no limit"]):
-            processed_max_price = None
-            print("🔓 [INFO] No price limit - showing all flights")
-        else:
-            processed_max_price = max_price
-            print(f"💰 [INFO] Price limit set to: {processed_max_price}")
+    processed_max_price = _start_aggregator(departure_id, arrival_id, departure_date, max_price, "")
 
     # Stage 1: Get flights with SerpAPI max_price filter (reduces initial results)
     all_flights = get_flights(departure_id, arrival_id, departure_date, max_price=processed_max_price)
-    
+
     # Stage 2: Filter flights before making expensive booking API calls
-    budget_filtered_flights = []
-    for flight in all_flights:
-        if is_flight_under_budget(flight, processed_max_price):
-            budget_filtered_flights.append(flight)
-    
-    print(f"🔎 [DEBUG] Filtered {len(all_flights)} flights to {len(budget_filtered_flights)} under budget")
-    
+    flights = _bookable_under_budget(all_flights, processed_max_price)
+
     # Stage 3: Only make booking API calls for flights under budget
     enhanced_flights = []
-    api_calls_made = 0
-    
-    for flight in budget_filtered_flights:
-        token = flight.get("booking_token")
-        if token:
-            api_calls_made += 1
-            print(f"📞 [DEBUG] Making booking API call #{api_calls_made} for token: {token[:10]}...")
-            
-            booking_options = fetch_booking_options(token, departure_date, departure_id, arrival_id)
-            if not booking_options:
-                continue
-
-            selected = booking_options.get("selected_flights", [])
-            booking_opts = booking_options.get("booking_options", [])
-
-            flight_obj = []
-            if selected and isinstance(selected, list):
-                first = selected[0]
-                if isinstance(first, dict) and first.get("flights"):
-                    flight_obj = first.get("flights")
-
-            enhanced_flights.append({
-                "flight_data": flight_obj,
-                "booking_options": booking_opts,
-            })
-
-    print(f"✅ [INFO] Made {api_calls_made} booking API calls (reduced from {len(all_flights)} potential calls)")
+    for api_calls_made, flight in enumerate(flights, 1):
+        token = flight["booking_token"]
+        debug_sampled(logger, "📞 Making booking API call #%d for token: %s...", api_calls_made, token[:10])
+        booking_options = fetch_booking_options(token, departure_date, departure_id, arrival_id)
+        enhanced_flights.append(_with_booking(flight, booking_options))
+
+    logger.info("✅ Made %d booking API calls (reduced from %d potential calls)", len(flights), len(all_flights))
     return enhanced_flights
 
 
+# ---------------------------------------------------------------- asyncio path
+async def _search_serpapi_async(params, priority):
+    results = await serpapi_async.search(params, priority)
+    _remember(params, results)
+    return results
+
+
+async def _search_upstream_async(upstream, params, priority):
+    return await upstream.call_async(
+        _search_serpapi_async, params, priority,
+        idempotent=priority != PRIORITY_PREFETCH,
+        fallback=lambda: asyncio.to_thread(flight_cache.get_stale, params),
+    )
+
+
+async def _cached_or_search_async(upstream, params, priority, cache, refresh):
+    """
+    Async counterpart of _cached_or_search(). Cache lookups may touch the
+    shared MongoDB tier, so they run in a worker thread.
+    """
+    if not refresh:
+        cached = await asyncio.to_thread(flight_cache.get_fresh, params, cache)
+        if cached is not None:
+            return cached
+    return await _search_upstream_async(upstream, params, priority)
+
+
+async def get_flights_async(departure_id, arrival_id, departure_date, max_price=None, priority=PRIORITY_INTERACTIVE, refresh=False, flight_type=None):
+    """
+    Async get_flights(): same params, cache and resilience policy, but
+    SerpAPI is called over the pooled httpx client in utils/serpapi_async.py.
+    """
+    params = _logged_search_params(departure_id, arrival_id, departure_date, max_price, flight_type)
+
+    with metrics.timed("get_flights"):
+        results = None if refresh else await asyncio.to_thread(flight_cache.get_fresh, params, "flight_search")
+        if results is None and not refresh:
+            refiltered = await asyncio.to_thread(_refilter_cached, params)
+            if refiltered is not None:
+                return refiltered
+        if results is None:
+            results = await _search_upstream_async(resilience.SERPAPI_SEARCH, params, priority)
+
+    return _search_flights(results)
+
+
+async def fetch_booking_options_async(booking_token, departure_date, departure_id, arrival_id, priority=PRIORITY_BOOKING, refresh=False, deep=True, flight_type=None):
+    """
+    Async fetch_booking_options(); returns None on failure.
+    """
+    try:
+        params = _logged_booking_params(booking_token, departure_date, departure_id, arrival_id, deep, flight_type)
+        with metrics.timed("fetch_booking_options"):
+            return await _shared_lookup(
+                flight_cache.cache_key(params),
+                lambda: _cached_or_search_async(resilience.SERPAPI_BOOKING, params, priority, "booking_options", refresh),
+            )
+    except Exception as e:
+        return _booking_failed(booking_token, e)
+
+
+async def _get_flight_with_aggregator_async(
+    departure_id: str,
+    arrival_id: str,
+    departure_date: str,
+    max_price: str = None
+):
+    """
+    Async variant of the flight tool: booking options for the flights under
+    budget are fetched concurrently, BOOKING_FANOUT at a time (the
+    scheduler still paces SerpAPI).
+    """
+    flights = await _flights_under_budget_async(departure_id, arrival_id, departure_date, max_price)
+    responses = await _gather_bookings(
+        lambda f: fetch_booking_options_async(f["booking_token"], departure_date, departure_id, arrival_id),
+        flights,
+    )
+    enhanced_flights = [_with_booking(f, r) for f, r in zip(flights, responses)]
+
+    logger.info("✅ Made %d booking API calls", len(flights))
+    return enhanced_flights
+
+
+async def _flights_under_budget_async(departure_id, arrival_id, departure_date, max_price):
+    """
+    Stages 1-2 of the async flight tool: search, then the itineraries under
+    budget that have a booking token.
+    """
+    processed_max_price = _start_aggregator(departure_id, arrival_id, departure_date, max_price, " (async)")
+    all_flights = await get_flights_async(departure_id, arrival_id, departure_date, max_price=processed_max_price)
+    return _bookable_under_budget(all_flights, processed_max_price)
+
+
+async def get_flight_with_aggregator_two_phase(departure_id, arrival_id, departure_date, max_price=None):
+    """
+    Two-phase flight tool for /chat. Itineraries whose deep-search booking
+    options are cached get them right away; the rest get shallow options
+    (no deep_search/show_hidden, much faster) and a background job fetches
+    their deep options. Returns (enhanced_flights, job_id), job_id being
+    None when nothing was left to deep-search; poll booking_updates(job_id).
+    """
+    flights = await _flights_under_budget_async(departure_id, arrival_id, departure_date, max_price)
+    tokens = [f["booking_token"] for f in flights]
+
+    def cached_deep():
+        return [
+            flight_cache.get_fresh(build_booking_params(t, departure_date, departure_id, arrival_id), "booking_options")
+            for t in tokens
+        ]
+
+    deep = await asyncio.to_thread(cached_deep)
+    missing = [t for t, d in zip(tokens, deep) if d is None]
+    shallow = await _gather_bookings(
+        lambda t: fetch_booking_options_async(t, departure_date, departure_id, arrival_id, PRIORITY_INTERACTIVE, deep=False),
+        missing,
+    )
+    shallow_by_token = dict(zip(missing, shallow))
+    responses = [d if d is not None else shallow_by_token.get(t) for t, d in zip(tokens, deep)]
+    enhanced_flights = [_with_booking(f, r) for f, r in zip(flights, responses)]
+
+    job_id = None
+    if missing:
+        job_id = booking_jobs.create({
+            "departure_id": departure_id,
+            "arrival_id": arrival_id,
+            "departure_date": departure_date,
+            "tokens": tokens,
+        })
+        booking_jobs.spawn(_deep_search_job(job_id, missing, departure_date, departure_id, arrival_id))
+    logger.info("✅ %d itineraries answered, %d deep searches in background", len(enhanced_flights), len(missing))
+    return enhanced_flights, job_id
+
+
+async def _deep_search_job(job_id, tokens, departure_date, departure_id, arrival_id):
+    try:
+        responses = await _gather_bookings(
+            lambda t: fetch_booking_options_async(t, departure_date, departure_id, arrival_id, deep=True),
+            tokens,
+            gate=_deep_search_gate,
+        )
+        failed = [t for t, r in zip(tokens, responses) if not r]
+        await asyncio.to_thread(booking_jobs.update, job_id, status="done", failed=len(failed))
+    except Exception as e:
+        logger.error("❌ Deep-search job %s failed: %r", job_id, e)
+        await asyncio.to_thread(booking_jobs.update, job_id, status="failed")
+
+
+def booking_updates(job_id):
+    """
+    Current view of a two-phase job: every itinerary with its deep-search
+    booking options when ready, otherwise the shallow ones. None if the job
+    is unknown or expired.
+    """
+    record = booking_jobs.get(job_id)
+    if record is None:
+        return None
+    route = (record["departure_date"], record["departure_id"], record["arrival_id"])
+    flight_data, deep_ready = [], 0
+    for token in record["tokens"]:
+        response = flight_cache.get_stale(build_booking_params(token, *route, deep=True))
+        if response is not None:
+            deep_ready += 1
+        else:
+            response = flight_cache.get_stale(build_booking_params(token, *route, deep=False))
+        if response:
+            flight_data.append(build_enhanced_flight(response))
+    return {
+        "job_id": job_id,
+        "status": record["status"],
+        "deep_ready": deep_ready,
+        "total": len(record["tokens"]),
+        "flight_data": flight_data,
+    }
+
+
+get_flight_with_aggregator = StructuredTool.from_function(
+    func=_get_flight_with_aggregator,
+    coroutine=_get_flight_with_aggregator_async,
+    name="get_flight_with_aggregator",
+)
+
+
+# ---------------------------------------------------------------- multi-leg trips
+class FlightLeg(BaseModel):
+    departure_id: str = Field(description="Departure airport code, e.g. DEL")
+    arrival_id: str = Field(description="Arrival airport code, e.g. MAA")
+    departure_date: str = Field(description="Departure date, YYYY-MM-DD")
+
+
+def _normalize_legs(legs):
+    legs = [leg.model_dump() if isinstance(leg, BaseModel) else dict(leg) for leg in legs or []]
+    if not legs:
+        raise ValueError("At least one leg is required")
+    if len(legs) > MULTI_LEG_MAX_LEGS:
+        raise ValueError(f"At most {MULTI_LEG_MAX_LEGS} legs are supported")
+    for leg in legs:
+        flight_cache.popular_routes.record(leg["departure_id"], leg["arrival_id"], leg["departure_date"])
+    return legs
+
+
+def _build_itineraries(combos, legs, booking_by_token):
+    """
+    Tool output for multi-leg trips: one entry per combination with its
+    total and, per leg, the segments and booking options.
+    """
+    itineraries = []
+    for total, flights in combos:
+        itinerary_legs = []
+        for leg, flight in zip(legs, flights):
+            enhanced = _with_booking(flight, booking_by_token.get(flight.get("booking_token")))
+            itinerary_legs.append({**leg, "price": flight_price(flight), **enhanced})
+        itineraries.append({"total_price": total, "legs": itinerary_legs})
+    return itineraries
+
+
+def _plan_trip(legs, max_total_price, flavour):
+    """
+    Normalized legs, the trip budget as SerpAPI max_price and as a number.
+    """
+    legs = _normalize_legs(legs)
+    max_total_price = normalize_price(_resolve_max_price(max_total_price))
+    budget = price_limit(max_total_price)
+    logger.info("🧭 Multi-leg search%s: %d legs, total budget %s", flavour, len(legs), budget)
+    return legs, max_total_price, budget
+
+
+def _combine_legs(per_leg, legs, budget):
+    """
+    The cheapest combinations within budget, and the (token, leg) pairs
+    whose booking options they need.
+    """
+    with tracing.span("combine_legs", legs=len(legs)):
+        combos = cheapest_combinations(per_leg, MULTI_LEG_TOP_K, budget)
+    return combos, _combo_tokens(combos, legs)
+
+
+def _combo_tokens(combos, legs):
+    """
+    Unique (token, leg) pairs across the chosen combinations; flights
+    shared by several combinations are only looked up once.
+    """
+    pairs = {}
+    for _, flights in combos:
+        for leg, flight in zip(legs, flights):
+            token = flight.get("booking_token")
+            if token:
+                pairs.setdefault(token, leg)
+    return pairs
+
+
+def _get_multi_leg_itinerary(legs: List[FlightLeg], max_total_price: str = None):
+    """
+    Search a round-trip or multi-city trip in one call. Every leg is searched
+    concurrently as a one-way flight, and the cheapest combinations (one
+    flight per leg) within max_total_price are returned, cheapest first.
+    For a round trip pass two legs: outbound and return.
+
+    Args:
+        legs: Ordered legs of the trip
+        max_total_price: Budget for the whole trip: a number string, None, or "no preference"
+    """
+    legs, max_total_price, budget = _plan_trip(legs, max_total_price, "")
+
+    with ThreadPoolExecutor(max_workers=len(legs), thread_name_prefix="leg") as pool:
+        futures = [
+            pool.submit(tracing.wrap(get_flights), leg["departure_id"], leg["arrival_id"], leg["departure_date"],
+                        max_price=max_total_price, flight_type=LEG_FLIGHT_TYPE)
+            for leg in legs
+        ]
+        per_leg = [f.result() for f in futures]
+
+    combos, pairs = _combine_legs(per_leg, legs, budget)
+    booking_by_token = {}
+    if pairs:
+        with ThreadPoolExecutor(max_workers=min(len(pairs), max(BOOKING_FANOUT, 1)), thread_name_prefix="leg-booking") as pool:
+            futures = {
+                token: pool.submit(tracing.wrap(fetch_booking_options), token, leg["departure_date"],
+                                   leg["departure_id"], leg["arrival_id"], flight_type=LEG_FLIGHT_TYPE)
+                for token, leg in pairs.items()
+            }
+            booking_by_token = {token: f.result() for token, f in futures.items()}
+    return _build_itineraries(combos, legs, booking_by_token)
+
+
+async def _get_multi_leg_itinerary_async(legs: List[FlightLeg], max_total_price: str = None):
+    """
+    Async multi-leg search: legs and booking lookups run concurrently on
+    the event loop.
+    """
+    legs, max_total_price, budget = _plan_trip(legs, max_total_price, " (async)")
+
+    per_leg = await asyncio.gather(*(
+        get_flights_async(leg["departure_id"], leg["arrival_id"], leg["departure_date"],
+                          max_price=max_total_price, flight_type=LEG_FLIGHT_TYPE)
+        for leg in legs
+    ))
+
+    combos, pairs = _combine_legs(per_leg, legs, budget)
+    responses = await _gather_bookings(
+        lambda pair: fetch_booking_options_async(pair[0], pair[1]["departure_date"], pair[1]["departure_id"],
+                                                 pair[1]["arrival_id"], flight_type=LEG_FLIGHT_TYPE),
+        list(pairs.items()),
+    )
+    return _build_itineraries(combos, legs, dict(zip(pairs, responses)))
+
+
+get_multi_leg_itinerary = StructuredTool.from_function(
+    func=_get_multi_leg_itinerary,
+    coroutine=_get_multi_leg_itinerary_async,
+    name="get_multi_leg_itinerary",
+)
+
+
 
 
 #this getflights returns flight details from serpapi but is empty array
@@ -0,0 +1,176 @@
+# utils/lexical_index.py
+import os
+import re
+import math
+import time
+import heapq
+import threading
+from collections import Counter, defaultdict
+from dotenv import load_dotenv
+from utils import metrics
+from utils.logger import get_logger
+
+load_dotenv()
+
+logger = get_logger("lexical_index")
+
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "true").lower() == "true"
+# Seconds before the index is rebuilt from MongoDB
+LEXICAL_INDEX_REFRESH_S = float(os.getenv("LEXICAL_INDEX_REFRESH_S", "600"))
+# Reciprocal rank fusion constant: 1 / (RRF_K + rank)
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Offer metadata (as stored by create_vector_store) indexed next to the offer string
+INDEXED_FIELDS = ("title", "offer", "coupon_code", "bank", "platform", "payment_mode", "flight_type")
+# Fields whose values are exact entities a query can name (coupon codes, banks, ...)
+ENTITY_FIELDS = ("coupon_code", "bank", "platform", "payment_mode", "flight_type")
+
+# Words that say nothing about which offer is wanted
+_GENERIC = frozenset("""
+a an and any are at available bank banks book booking by can card cards code codes coupon coupons deal deals discount
+discounts do find flight flights for from get give have i in is me my of off offer offers on or please promo show
+some the there to using via what with you your
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+LEXICAL_SEARCHES = metrics.counter(
+    "chatsb_lexical_search_total", "Offer retrievals by path (keyword_only, hybrid, vector_only)."
+)
+
+
+def tokenize(text) -> list:
+    return _TOKEN_RE.findall(str(text or "").lower())
+
+
+class BM25Index:
+    """
+    In-memory inverted index with Okapi BM25 scoring over offer documents
+    (offer string plus INDEXED_FIELDS). Entity tokens (coupon codes, banks,
+    platforms, payment modes, flight types) are tracked separately so a
+    query made only of them can be answered without embeddings.
+    """
+
+    def __init__(self):
+        self.docs = []          # (text, metadata)
+        self.postings = {}      # token -> [(doc index, term frequency)]
+        self.idf = {}
+        self.lengths = []
+        self.avgdl = 0.0
+        self.entities = {}      # token -> set of doc indices whose entity fields contain it
+        self.built_at = 0.0
+
+    @classmethod
+    def build(cls, docs):
+        """
+        `docs`: iterable of (text, metadata) pairs.
+        """
+        index = cls()
+        postings = defaultdict(list)
+        entities = defaultdict(set)
+        for i, (text, meta) in enumerate(docs):
+            tokens = tokenize(text) + [t for f in INDEXED_FIELDS for t in tokenize(meta.get(f))]
+            for token, tf in Counter(tokens).items():
+                postings[token].append((i, tf))
+            for field in ENTITY_FIELDS:
+                for token in tokenize(meta.get(field)):
+                    entities[token].add(i)
+            index.docs.append((text, meta))
+            index.lengths.append(len(tokens))
+        n = len(index.docs)
+        index.postings = dict(postings)
+        index.entities = {t: frozenset(ids) for t, ids in entities.items()}
+        index.idf = {t: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for t, p in index.postings.items()}
+        index.avgdl = (sum(index.lengths) / n) if n else 0.0
+        index.built_at = time.time()
+        return index
+
+    def __len__(self):
+        return len(self.docs)
+
+    def search(self, query: str, k: int = 10):
+        """
+        Up to `k` (doc index, BM25 score) pairs, best first. Generic words
+        ("offers", "flights", ...) are not scored.
+        """
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            idf = self.idf.get(token)
+            if idf is None or token in _GENERIC:
+                continue
+            for i, tf in self.postings[token]:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[i] / self.avgdl)
+                scores[i] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def decisive(self, query: str, k: int = 10):
+        """
+        Keyword-only answer, or None when embeddings are needed. Decisive when
+        every meaningful query word is a known entity token (e.g. "ICICI
+        offers on Cleartrip", or a coupon code): the answer is the offers
+        having all of them, ranked by BM25.
+        """
+        terms = [t for t in tokenize(query) if t not in _GENERIC]
+        if not terms or any(t not in self.entities for t in terms):
+            return None
+        matching = frozenset.intersection(*(self.entities[t] for t in terms))
+        if not matching:
+            return None
+        ranked = [(i, s) for i, s in self.search(query, len(self.docs)) if i in matching]
+        return ranked[:k]
+
+
+def rrf(rankings, k: int = RRF_K):
+    """
+    Reciprocal rank fusion of several best-first lists of hashable keys.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            scores[key] += 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class OfferIndex:
+    """
+    Process-wide BM25Index over the offer collection, rebuilt from MongoDB
+    every LEXICAL_INDEX_REFRESH_S seconds. `load` returns (text, metadata)
+    pairs; a failed rebuild keeps the previous index.
+    """
+
+    def __init__(self, load, refresh: float = LEXICAL_INDEX_REFRESH_S):
+        self.load = load
+        self.refresh = refresh
+        self.index = BM25Index()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def stale(self) -> bool:
+        return time.time() - self.index.built_at >= self.refresh
+
+    def ensure_fresh(self):
+        if not self.stale():
+            return self.index
+        with self._lock:
+            if self.stale():
+                generation = self._generation
+                try:
+                    with metrics.timed("lexical_index.build"):
+                        index = BM25Index.build(self.load())
+                    if generation != self._generation:
+                        # Invalidated while loading: serve it, but rebuild on the next query
+                        index.built_at = 0.0
+                    self.index = index
+                    logger.info("🔤 Lexical offer index built with %d documents", len(self.index))
+                except Exception as e:
+                    # Keep serving the old index; try again after another refresh period
+                    self.index.built_at = time.time()
+                    logger.warning("⚠️ Lexical offer index rebuild failed: %s", e)
+        return self.index
+
+    def invalidate(self):
+        self._generation += 1
+        self.index.built_at = 0.0
@@ -0,0 +1,184 @@
+# utils/logger.py
+import os
+import re
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # "text" or "json"
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+ROOT_LOGGER = "chatsb"
+
+# Param keys whose values must never reach the logs
+SECRET_KEYS = {
+    "api_key", "serpapi_api_key", "aws_access_key_id", "aws_secret_access_key",
+    "google_api_key", "password", "token", "booking_token",
+}
+
+# Env vars holding secrets; their literal values are scrubbed from every message
+SECRET_ENV_VARS = (
+    "SERPAPI_API_KEY", "AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY",
+    "GOOGLE_API_KEY", "MONGO_DB_URI",
+)
+
+_KEY_VALUE_RE = re.compile(
+    r"""(['"]?(?:api_key|aws_secret_access_key|aws_access_key_id|google_api_key|password)['"]?\s*[:=]\s*['"]?)([^'"\s,&}]+)""",
+    re.IGNORECASE,
+)
+_MONGO_CREDS_RE = re.compile(r"(mongodb(?:\+srv)?://[^:/@\s]+:)([^@\s]+)(@)")
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+def redact(text: str) -> str:
+    """
+    Mask secrets in a log string: key=value pairs, Mongo URI passwords
+    and the literal values of the secret env vars.
+    """
+    text = _KEY_VALUE_RE.sub(r"\1***", text)
+    text = _MONGO_CREDS_RE.sub(r"\1***\3", text)
+    for var in SECRET_ENV_VARS:
+        value = os.getenv(var)
+        if value and len(value) >= 6 and value in text:
+            text = text.replace(value, "***")
+    return text
+
+
+def redact_params(params: dict) -> dict:
+    """
+    Return a shallow copy of a request params dict with secret values masked.
+    Long tokens are truncated so they stay recognisable without being usable.
+    """
+    safe = {}
+    for key, value in params.items():
+        if key.lower() in SECRET_KEYS and value:
+            value = str(value)
+            safe[key] = f"{value[:6]}***" if key == "booking_token" else "***"
+        else:
+            safe[key] = value
+    return safe
+
+
+def sampled(rate: float = None) -> bool:
+    """
+    Return True for roughly `rate` of calls (defaults to LOG_SAMPLE_RATE).
+    Use it to guard per-item log lines inside hot loops.
+    """
+    rate = LOG_SAMPLE_RATE if rate is None else rate
+    return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+
+def debug_sampled(logger: logging.Logger, msg: str, *args, rate: float = None):
+    """
+    Emit a DEBUG line for a sampled subset of calls. The level check comes
+    first so disabled debug logging costs a single attribute lookup.
+    """
+    if logger.isEnabledFor(logging.DEBUG) and sampled(rate):
+        logger.debug(msg, *args)
+
+
+class RedactingFilter(logging.Filter):
+    """
+    Render the message once, scrub secrets, and freeze the result on the
+    record so handlers on the listener thread never see raw arguments.
+    """
+
+    def filter(self, record):
+        record.msg = redact(record.getMessage())
+        record.args = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line; any `extra={...}` fields are included as-is.
+    """
+
+    def format(self, record):
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Already rendered by DroppingQueueHandler.prepare
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks the caller: when the queue is full the
+    record is dropped and counted instead of raising or waiting.
+    """
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+    def prepare(self, record):
+        # Message is already rendered by RedactingFilter; drop exc_info
+        # objects (tracebacks are not picklable/thread-safe to keep around).
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging():
+    """
+    Configure the backend's logger tree once: records are redacted on the
+    calling thread, pushed onto a bounded queue and written to stderr by a
+    background QueueListener.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(RedactingFilter())
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    root.addHandler(handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Return a logger under the backend's namespace, e.g. get_logger("get_flights").
+    """
+    setup_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
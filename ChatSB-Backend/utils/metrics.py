@@ -0,0 +1,205 @@
+# utils/metrics.py
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from utils import tracing
+
+# Upstream calls range from a few ms (Mongo) to tens of seconds (deep search)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str):
+        self.name = name
+        self.doc = doc
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+    def items(self):
+        """
+        [(label pairs, value), ...] snapshot, for reports and tests.
+        """
+        with self._lock:
+            return list(self._values.items())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket (non-cumulative) counts + overflow slot, sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = (("le", _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+def _register(metric):
+    with _registry_lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+
+def counter(name: str, doc: str) -> Counter:
+    return _register(Counter(name, doc))
+
+
+def gauge(name: str, doc: str) -> Gauge:
+    return _register(Gauge(name, doc))
+
+
+def histogram(name: str, doc: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, doc, buckets))
+
+
+# Stage instrumentation shared by every upstream call site
+STAGE_LATENCY = histogram("chatsb_stage_duration_seconds", "Latency of backend stages and upstream calls.")
+STAGE_CALLS = counter("chatsb_stage_calls_total", "Stage invocations by outcome.")
+STAGE_IN_FLIGHT = gauge("chatsb_stage_in_flight", "Stage invocations currently running.")
+
+CACHE_REQUESTS = counter("chatsb_cache_requests_total", "Cache lookups by cache and result (hit/miss).")
+CACHE_HIT_RATIO = gauge("chatsb_cache_hit_ratio", "Hit ratio per cache since process start.")
+
+HTTP_LATENCY = histogram("chatsb_http_request_duration_seconds", "HTTP request latency by route.")
+HTTP_REQUESTS = counter("chatsb_http_requests_total", "HTTP requests by route and status code.")
+HTTP_IN_FLIGHT = gauge("chatsb_http_in_flight", "HTTP requests currently being served.")
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    Time a block as `stage`: records latency, success/error count and the
+    in-flight gauge, and opens a span of the same name when the call is
+    part of a trace. Exceptions propagate unchanged.
+    """
+    STAGE_IN_FLIGHT.inc(stage=stage)
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        with tracing.span(stage):
+            yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, stage=stage)
+        STAGE_CALLS.inc(stage=stage, outcome=outcome)
+        STAGE_IN_FLIGHT.dec(stage=stage)
+
+
+def record_cache(cache: str, hit: bool):
+    """
+    Count a cache lookup; the hit ratio gauge is derived at scrape time.
+    """
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def _refresh_cache_ratios():
+    caches = {dict(key)["cache"] for key in list(CACHE_REQUESTS._values)}
+    for cache in caches:
+        hits = CACHE_REQUESTS.value(cache=cache, result="hit")
+        misses = CACHE_REQUESTS.value(cache=cache, result="miss")
+        total = hits + misses
+        CACHE_HIT_RATIO.set(hits / total if total else 0.0, cache=cache)
+
+
+def render_prometheus() -> str:
+    """
+    Render every registered metric in the Prometheus text exposition format.
+    """
+    _refresh_cache_ratios()
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
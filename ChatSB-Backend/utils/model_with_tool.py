@@ -1,20 +1,25 @@
 #model_with_tool.py
 # max filter
 # model_with_tool.py
-import re
+import asyncio
 from typing import List
 from dotenv import load_dotenv
-from utils import rag_retriever, get_flights
+from utils import rag_retriever, get_flights, flight_pipeline, metrics, tracing, resilience, booking_jobs
+from utils.serpapi_scheduler import SchedulerRejected
 from langchain.chat_models import init_chat_model
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from utils.logger import get_logger
 
 load_dotenv()
 
+logger = get_logger("model_with_tool")
+
 model = init_chat_model("gemini-2.5-flash", model_provider="google_genai")
 
 model_with_tool = model.bind_tools([
     rag_retriever.rag_tool,
-    get_flights.get_flight_with_aggregator
+    get_flights.get_flight_with_aggregator,
+    get_flights.get_multi_leg_itinerary,
 ])
 
 system_prompt = """
@@ -32,69 +37,223 @@ You must ALWAYS ask the user for their maximum price before calling the tool.
 - If the user provides a number (e.g., "19000" or "Rs 19000"), normalize it to digits only.
 - If the user says "any price", "no budget", "no preference", "unlimited", or "no limit", set max_price=None.
 - Do not call the tool until max_price is clarified (either a number or explicit "no preference").
+
+For round trips and multi-city trips, call get_multi_leg_itinerary once instead:
+- legs: one {departure_id, arrival_id, departure_date} per flight, in travel order
+  (a round trip is two legs: outbound and return)
+- max_total_price: the budget for the whole trip, asked and normalized like max_price
 """
 
-def rag_agent(chat_history: List[dict]):
+GEMINI_UNAVAILABLE = "Sorry, I'm having trouble responding right now 😕 Please try again in a moment."
+SERPAPI_BUSY = "We're getting a lot of flight searches right now 🙏 Please try again in a moment."
+
+
+def _build_messages(chat_history: List[dict]):
     messages = [SystemMessage(system_prompt)]
     for msg in chat_history:
         if msg["role"] == "human":
             messages.append(HumanMessage(msg["content"]))
         elif msg["role"] == "ai":
             messages.append(AIMessage(msg["content"]))
-
-    ai_msg = model_with_tool.invoke(messages)
-    ai_msg_content = ""
-    flight_data = None
-
-    if ai_msg.tool_calls:
-        for call in ai_msg.tool_calls:
-            if call["name"] == "rag_tool":
-                tool_msg = rag_retriever.rag_tool.invoke(call)
-                ai_msg_content += tool_msg.content
-
-            elif call["name"] == "get_flight_with_aggregator":
-                try:
-                    params = call.get("args", {}) or {}
-
-                    # ✅ Enforce max_price requirement
-                    if "max_price" not in params or params["max_price"] in ("", None):
-                        ai_msg_content += "Sure, I can help you with that! What is your maximum price?"
-                        continue  # Don't call the tool yet
-
-                    # Normalize Rs/₹ input and handle "no preference" cases
-                    raw_price = str(params["max_price"]).lower().strip()
-                    if any(phrase in raw_price for phrase in ["any", "no budget", "no preference", "unlimited", "no limit"]):
-                        params["max_price"] = None
-                        print("🔓 [INFO] User specified no price limit")
-                    else:
-                        cleaned = re.sub(r"[^\d]", "", raw_price)
-                        params["max_price"] = cleaned if cleaned else None
-                        if params["max_price"]:
-                            print(f"💰 [INFO] User specified max price: {params['max_price']}")
-
-                    # Call the tool (returns Python list/dict now)
-                    flight_data = get_flights.get_flight_with_aggregator.invoke({
-                        "departure_id": params["departure_id"],
-                        "arrival_id": params["arrival_id"],
-                        "departure_date": params["departure_date"],
-                        "max_price": params.get("max_price")
-                    })
-
-                    if flight_data and len(flight_data) > 0:
-                        if params["max_price"]:
-                            ai_msg_content += f"Found {len(flight_data)} flight options under your budget ✈️"
-                        else:
-                            ai_msg_content += f"Found {len(flight_data)} flight options ✈️"
-                    else:
-                        ai_msg_content += "No flights found for that search 😕"
-
-                except Exception as e:
-                    print(f"Flight search error: {e}")
-                    ai_msg_content += "Error occurred while fetching flights."
-    else:
-        ai_msg_content += ai_msg.content
-
-    return {"content": ai_msg_content, "flight_data": flight_data}
+    return messages
+
+
+def _flight_tool_args(call):
+    """
+    Validate and normalize the model's flight tool call.
+    Returns (tool args, None) or (None, reply asking for the missing budget).
+    """
+    params = call.get("args", {}) or {}
+
+    # ✅ Enforce max_price requirement
+    if "max_price" not in params or params["max_price"] in ("", None):
+        return None, "Sure, I can help you with that! What is your maximum price?"
+
+    # Normalize Rs/₹ input and handle "no preference" cases
+    max_price, no_limit = flight_pipeline.parse_user_max_price(params["max_price"])
+    if no_limit:
+        logger.info("🔓 User specified no price limit")
+    elif max_price:
+        logger.info("💰 User specified max price: %s", max_price)
+
+    return {
+        "departure_id": params["departure_id"],
+        "arrival_id": params["arrival_id"],
+        "departure_date": params["departure_date"],
+        "max_price": max_price,
+    }, None
+
+
+def _multi_leg_tool_args(call):
+    """
+    Same budget rule as _flight_tool_args() for get_multi_leg_itinerary.
+    """
+    params = call.get("args", {}) or {}
+    if "max_total_price" not in params or params["max_total_price"] in ("", None):
+        return None, "Sure, I can help you plan that trip! What is your total budget?"
+
+    max_total_price, no_limit = flight_pipeline.parse_user_max_price(params["max_total_price"])
+    if no_limit:
+        logger.info("🔓 User specified no price limit for the trip")
+    elif max_total_price:
+        logger.info("💰 User specified trip budget: %s", max_total_price)
+    return {"legs": params.get("legs") or [], "max_total_price": max_total_price}, None
+
+
+def _multi_leg_reply(itineraries, legs):
+    if itineraries:
+        return f"Found {len(itineraries)} itinerary options for your {len(legs)}-leg trip ✈️"
+    return "No itineraries found for that trip 😕"
+
+
+def _flight_reply(flight_data, max_price):
+    if flight_data and len(flight_data) > 0:
+        if max_price:
+            reply = f"Found {len(flight_data)} flight options under your budget ✈️"
+        else:
+            reply = f"Found {len(flight_data)} flight options ✈️"
+        unavailable = sum(1 for f in flight_data if isinstance(f, dict) and f.get("booking_unavailable"))
+        if unavailable:
+            reply += f" (booking links for {unavailable} are temporarily unavailable, please try again shortly)"
+        return reply
+    return "No flights found for that search 😕"
+
+
+# Flight tools: argument check, reply for their result, and the name used in logs
+FLIGHT_TOOLS = {
+    "get_flight_with_aggregator": (
+        _flight_tool_args, lambda data, args: _flight_reply(data, args["max_price"]), "Flight search",
+    ),
+    "get_multi_leg_itinerary": (
+        _multi_leg_tool_args, lambda data, args: _multi_leg_reply(data, args["legs"]), "Itinerary search",
+    ),
+}
+
+
+def _gemini_failed(error):
+    logger.error("❌ Gemini call failed: %r", error)
+    return {"content": GEMINI_UNAVAILABLE, "flight_data": None}
+
+
+def _tool_span(name, args):
+    if "legs" in args:
+        return tracing.span(f"tool.{name}", legs=len(args["legs"]))
+    return tracing.span(f"tool.{name}")
+
+
+def _tool_failed(label, error):
+    """
+    Reply for a flight tool call that raised; called from its except block.
+    """
+    if isinstance(error, SchedulerRejected):
+        logger.warning("⏳ %s shed by SerpAPI scheduler: %s", label, error.reason)
+        return SERPAPI_BUSY
+    logger.exception("%s error: %s", label, error)
+    return "Error occurred while fetching flights."
+
+
+def _agent_result(content, flight_data, booking_job=None):
+    result = {"content": "".join(content), "flight_data": flight_data}
+    if booking_job:
+        result["booking_job"] = booking_job
+    return result
+
+
+@tracing.traced("rag_agent")
+def rag_agent(chat_history: List[dict]):
+    messages = _build_messages(chat_history)
+
+    try:
+        with metrics.timed("model_with_tool.invoke"):
+            ai_msg = resilience.GEMINI.call(model_with_tool.invoke, messages)
+    except Exception as e:
+        return _gemini_failed(e)
+    if not ai_msg.tool_calls:
+        return _agent_result([ai_msg.content], None)
+
+    content, flight_data = [], None
+    for call in ai_msg.tool_calls:
+        name = call["name"]
+        if name == "rag_tool":
+            with tracing.span("tool.rag_tool"):
+                content.append(rag_retriever.rag_tool.invoke(call).content)
+        elif name in FLIGHT_TOOLS:
+            parse_args, reply, label = FLIGHT_TOOLS[name]
+            try:
+                args, ask = parse_args(call)
+                if args is None:
+                    content.append(ask)
+                    continue  # Don't call the tool yet
+                with _tool_span(name, args):
+                    flight_data = getattr(get_flights, name).invoke(args)
+                content.append(reply(flight_data, args))
+            except Exception as e:
+                content.append(_tool_failed(label, e))
+    return _agent_result(content, flight_data)
+
+
+async def _session_result(session, name, args):
+    if session is None:
+        return None
+    return await asyncio.to_thread(session.tool_result, name, args)
+
+
+async def _run_flight_tool_async(name, args):
+    """
+    {"flight_data", and "booking_job" for the two-phase flight tool}.
+    """
+    if name == "get_flight_with_aggregator" and booking_jobs.BOOKING_TWO_PHASE:
+        flight_data, booking_job = await get_flights.get_flight_with_aggregator_two_phase(**args)
+        return {"flight_data": flight_data, "booking_job": booking_job}
+    return {"flight_data": await getattr(get_flights, name).ainvoke(args)}
+
+
+@tracing.traced("rag_agent")
+async def rag_agent_async(chat_history: List[dict], session=None):
+    """
+    Async rag_agent(): Gemini and SerpAPI are awaited instead of blocking a
+    threadpool slot, so one worker can serve many concurrent chats.
+    With BOOKING_TWO_PHASE, flights come back with shallow booking options
+    and the result carries `booking_job` to poll for the deep-search ones.
+    With a chat `session`, flight tool results are reused when the model
+    repeats an identical call within the session.
+    """
+    messages = _build_messages(chat_history)
+
+    try:
+        with metrics.timed("model_with_tool.invoke"):
+            ai_msg = await resilience.GEMINI.call_async(model_with_tool.ainvoke, messages)
+    except Exception as e:
+        return _gemini_failed(e)
+    if not ai_msg.tool_calls:
+        return _agent_result([ai_msg.content], None)
+
+    content, flight_data, booking_job = [], None, None
+    for call in ai_msg.tool_calls:
+        name = call["name"]
+        if name == "rag_tool":
+            with tracing.span("tool.rag_tool"):
+                content.append((await rag_retriever.rag_tool.ainvoke(call)).content)
+        elif name in FLIGHT_TOOLS:
+            parse_args, reply, label = FLIGHT_TOOLS[name]
+            try:
+                args, ask = parse_args(call)
+                if args is None:
+                    content.append(ask)
+                    continue
+                result = await _session_result(session, name, args)
+                if result is None:
+                    with _tool_span(name, args):
+                        result = await _run_flight_tool_async(name, args)
+                    if session is not None:
+                        session.remember_tool_result(name, args, result)
+                flight_data = result["flight_data"]
+                if "booking_job" in result:
+                    booking_job = result["booking_job"]
+                content.append(reply(flight_data, args))
+            except Exception as e:
+                content.append(_tool_failed(label, e))
+    return _agent_result(content, flight_data, booking_job)
 
 
 
@@ -1,42 +1,60 @@
 # utils/mongoDB.py
 import os
 from dotenv import load_dotenv
-from pymongo import MongoClient, errors
+from pymongo import MongoClient, AsyncMongoClient, errors
+from utils import metrics
+from utils.logger import get_logger
 
 load_dotenv()
 
+logger = get_logger("mongoDB")
+
+# Deal fields returned to the frontend (also the CSV header)
+EXPECTED_COLUMNS = [
+    "platform", "title", "offer", "coupon_code", "bank",
+    "payment_mode", "emi", "url", "expiry_date",
+    "current/upcoming", "flight_type"
+]
+# Deal fields passed through only when a deal has them (start_date lets an
+# upcoming deal turn current on its own, see utils/deal_catalogue.py)
+OPTIONAL_COLUMNS = ["start_date"]
+# Only fetch what the frontend needs; embeddings and text stay on the server
+DEAL_PROJECTION = {"_id": 0, **{column: 1 for column in EXPECTED_COLUMNS + OPTIONAL_COLUMNS}}
+
+MONGO_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", "500"))
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+
 def connect_db():
     """
     Connects to MongoDB Atlas and returns a client.
-    Handles errors and prints connection status.
+    Handles errors and logs connection status.
     """
     uri = os.getenv("MONGO_DB_URI")
     if not uri:
-        print("❌ MONGO_DB_URI not set in env")
+        logger.error("❌ MONGO_DB_URI not set in env")
         return None
 
     try:
-        client = MongoClient(uri, serverSelectionTimeoutMS=5000)
-        client.admin.command("ping")  # test connection
-        print("✅ Successfully connected to MongoDB Atlas")
+        with metrics.timed("connect_db"):
+            client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+            client.admin.command("ping")  # test connection
+        logger.info("✅ Successfully connected to MongoDB Atlas")
         return client
     except errors.ServerSelectionTimeoutError as e:
-        print("❌ Connection timed out. Check your URI and internet connection.")
-        print("Error:", e)
+        logger.error("❌ Connection timed out. Check your URI and internet connection. Error: %s", e)
         return None
     except Exception as e:
-        print("❌ Failed to connect to MongoDB Atlas.")
-        print("Error:", e)
+        logger.error("❌ Failed to connect to MongoDB Atlas. Error: %s", e)
         return None
 
 def get_collection(client, collection: str):
     if client is None:
-        print("⚠️ No MongoDB client available. Returning None.")
+        logger.warning("⚠️ No MongoDB client available. Returning None.")
         return None
 
     db_name = os.getenv("DB_NAME")
     if not db_name:
-        print("❌ DB_NAME not set in env")
+        logger.error("❌ DB_NAME not set in env")
         return None
 
     db = client[db_name]
@@ -64,5 +82,105 @@ def get_all_deals(collection_name: str = "flight_coupons"):
         docs = list(coll.find({}, {"_id": 0, "embedding": 0}))
         return docs
     except Exception as e:
-        print(f"[get_all_deals] error: {e}")
-        return []
\ No newline at end of file
+        logger.error("[get_all_deals] error: %s", e)
+        return []
+
+
+def normalize_deal(doc: dict) -> dict:
+    """
+    Deal with exactly EXPECTED_COLUMNS (missing fields become ""), plus
+    the OPTIONAL_COLUMNS it has.
+    """
+    deal = {k: doc.get(k, "") for k in EXPECTED_COLUMNS}
+    deal.update({k: doc[k] for k in OPTIONAL_COLUMNS if doc.get(k)})
+    return deal
+
+
+# ---------------------------------------------------------------- asyncio
+_async_client = None
+
+
+async def connect_db_async():
+    """
+    Process-wide AsyncMongoClient, created and pinged on first use.
+    Returns None if MongoDB is unreachable (the next call retries).
+    """
+    global _async_client
+    if _async_client is not None:
+        return _async_client
+
+    uri = os.getenv("MONGO_DB_URI")
+    if not uri:
+        logger.error("❌ MONGO_DB_URI not set in env")
+        return None
+
+    try:
+        with metrics.timed("connect_db"):
+            client = AsyncMongoClient(uri, serverSelectionTimeoutMS=5000, maxPoolSize=MONGO_MAX_POOL_SIZE)
+            await client.admin.command("ping")
+        logger.info("✅ Successfully connected to MongoDB Atlas (async)")
+        _async_client = client
+        return client
+    except Exception as e:
+        logger.error("❌ Failed to connect to MongoDB Atlas (async). Error: %s", e)
+        return None
+
+
+async def get_collection_async(collection: str):
+    return get_collection(await connect_db_async(), collection)
+
+
+async def close_async():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+
+async def iter_deals_async(collection_name: str = "flight_coupons", batch_size: int = MONGO_BATCH_SIZE):
+    """
+    Stream deals from MongoDB in `batch_size` batches, projected to
+    EXPECTED_COLUMNS and normalized.
+    Raises RuntimeError if the collection is unavailable.
+    """
+    coll = await get_collection_async(collection_name)
+    if coll is None:
+        raise RuntimeError("No data source available")
+    cursor = coll.find({}, DEAL_PROJECTION).batch_size(batch_size)
+    async for doc in cursor:
+        yield normalize_deal(doc)
+
+
+async def get_all_deals_async(collection_name: str = "flight_coupons"):
+    """
+    Async get_all_deals(): list of normalized deals ([] on error).
+    """
+    try:
+        return [deal async for deal in iter_deals_async(collection_name)]
+    except Exception as e:
+        logger.error("[get_all_deals_async] error: %s", e)
+        return []
+
+
+async def vector_search_async(collection_name: str, query_vector, k: int = 10, score_threshold: float = 0.0,
+                              index_name: str = "vector_index", path: str = "embedding"):
+    """
+    Atlas $vectorSearch over `collection_name`; returns documents (without
+    the embedding) carrying their similarity in `score`, best first.
+    """
+    coll = await get_collection_async(collection_name)
+    if coll is None:
+        raise RuntimeError("No data source available")
+    pipeline = [
+        {"$vectorSearch": {
+            "index": index_name,
+            "path": path,
+            "queryVector": list(query_vector),
+            "numCandidates": k * 10,
+            "limit": k,
+        }},
+        {"$project": {"_id": 0, path: 0, "score": {"$meta": "vectorSearchScore"}}},
+        {"$match": {"score": {"$gte": score_threshold}}},
+    ]
+    cursor = await coll.aggregate(pipeline)
+    return [doc async for doc in cursor]
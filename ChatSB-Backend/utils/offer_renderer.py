@@ -0,0 +1,103 @@
+# utils/offer_renderer.py
+import os
+import re
+from dotenv import load_dotenv
+from utils import metrics
+from utils.logger import get_logger
+
+load_dotenv()
+
+logger = get_logger("offer_renderer")
+
+# "auto": template unless the query needs reasoning, "template": always, "llm": never
+OFFER_RENDER_MODE = os.getenv("OFFER_RENDER_MODE", "auto").lower()
+
+OFFER_RENDERS = metrics.counter("chatsb_offer_renders_total", "Offer answers by renderer (template, llm).")
+
+NO_OFFERS = "Sorry, I couldn't find any offers or discounts for that 😕 Want me to check another bank or platform?"
+
+# Queries that ask to compare, rank or explain offers rather than list them
+_REASONING_RE = re.compile(
+    r"\b(best|better|compare|comparison|vs|versus|most|maximum|highest|cheapest|biggest|"
+    r"should|why|how much|difference|combine|stack|recommend|worth|explain)\b"
+)
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]")
+
+# Metadata fields (as stored by create_vector_store) a query can narrow offers by
+FILTER_FIELDS = ("bank", "platform", "payment_mode", "flight_type")
+
+
+def needs_reasoning(query: str) -> bool:
+    return _REASONING_RE.search(query.lower()) is not None
+
+
+def use_template(query: str) -> bool:
+    if OFFER_RENDER_MODE == "template":
+        return True
+    if OFFER_RENDER_MODE == "llm":
+        return False
+    return not needs_reasoning(query)
+
+
+def _norm(text) -> str:
+    return _NON_ALNUM_RE.sub("", str(text).lower())
+
+
+def _mentioned(value, query_norm: str) -> bool:
+    """
+    "HDFC Bank" matches "hdfc bank" and "HDFCBank"; "Credit Card" also
+    matches a bare "credit".
+    """
+    value = str(value or "").strip()
+    if not value:
+        return False
+    first = _norm(value.split()[0])
+    return _norm(value) in query_norm or (len(first) >= 4 and first in query_norm)
+
+
+def filter_offers(query: str, docs):
+    """
+    Keep offers matching what the query names. A field only filters when the
+    query mentions one of the values the retrieved offers actually have,
+    e.g. "HDFC" narrows by bank but says nothing about the platform.
+    """
+    query_norm = _norm(query)
+    for field in FILTER_FIELDS:
+        wanted = {_norm(d.metadata.get(field)) for d in docs if _mentioned(d.metadata.get(field), query_norm)}
+        if wanted:
+            docs = [d for d in docs if _norm(d.metadata.get(field)) in wanted]
+    if re.search(r"\bemi\b", query.lower()) and any(d.metadata.get("emi") == 1 for d in docs):
+        docs = [d for d in docs if d.metadata.get("emi") == 1]
+    return docs
+
+
+def _offer_line(i: int, meta: dict, fallback_text: str) -> str:
+    offer = str(meta.get("offer") or "").strip() or fallback_text.strip()
+    details = [str(meta[k]).strip() for k in ("title", "platform") if str(meta.get(k) or "").strip()]
+    line = f"{i}. **{offer.rstrip('.')}.**"
+    if details:
+        line += f" {' on '.join(details)}."
+    code = str(meta.get("coupon_code") or "").strip()
+    if code and code.lower() not in ("nan", "none", "na", "-"):
+        line += f" Use code `{code}`."
+    return line
+
+
+def render_offers(query: str, docs) -> str:
+    """
+    Numbered, bold offer list straight from the stored offer metadata,
+    in the format the offers prompt asks Gemini for.
+    """
+    docs = filter_offers(query, docs)
+    seen, lines = set(), []
+    for doc in docs:
+        meta = doc.metadata
+        key = (_norm(meta.get("platform")), _norm(meta.get("offer") or doc.page_content), _norm(meta.get("coupon_code")))
+        if key in seen:
+            continue
+        seen.add(key)
+        lines.append(_offer_line(len(lines) + 1, meta, doc.page_content))
+    if not lines:
+        return NO_OFFERS
+    intro = "Here's the offer I found for you 🎉" if len(lines) == 1 else "Here are the offers I found for you 🎉"
+    return intro + "\n\n" + "\n".join(lines)
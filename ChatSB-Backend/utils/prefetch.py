@@ -0,0 +1,188 @@
+# utils/prefetch.py
+import os
+import time
+import threading
+from collections import deque
+from datetime import date, timedelta
+from dotenv import load_dotenv
+from utils import metrics, flight_cache, get_flights, serpapi_scheduler
+from utils.flight_pipeline import flight_price, merge_flight_results
+from utils.serpapi_scheduler import PRIORITY_PREFETCH, SchedulerRejected
+from utils.logger import get_logger
+
+load_dotenv()
+
+logger = get_logger("prefetch")
+
+# Opt-in: prefetch spends SerpAPI quota on searches nobody is waiting for
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "false").lower() == "true"
+PREFETCH_INTERVAL_S = float(os.getenv("PREFETCH_INTERVAL_S", "60"))
+# Fixed routes to keep warm: "DEL-MAA,DEL-BOM@2025-12-01" (no date = PREFETCH_DAYS_AHEAD)
+PREFETCH_ROUTES = os.getenv("PREFETCH_ROUTES", "")
+PREFETCH_DAYS_AHEAD = os.getenv("PREFETCH_DAYS_AHEAD", "0,1,2")
+# Learned routes: the N hottest with a decayed score of at least PREFETCH_MIN_SCORE
+PREFETCH_TOP_ROUTES = int(os.getenv("PREFETCH_TOP_ROUTES", "20"))
+PREFETCH_MIN_SCORE = float(os.getenv("PREFETCH_MIN_SCORE", "2"))
+# Refresh once an entry has used this fraction of FLIGHT_CACHE_TTL
+PREFETCH_REFRESH_AT = float(os.getenv("PREFETCH_REFRESH_AT", "0.8"))
+PREFETCH_BOOKING_TOP = int(os.getenv("PREFETCH_BOOKING_TOP", "3"))
+# SerpAPI calls prefetch may spend per rolling hour, across all workers;
+# each one gets its 1/SERPAPI_WORKERS share, like the scheduler's limits
+PREFETCH_MAX_CALLS_PER_HOUR = int(os.getenv("PREFETCH_MAX_CALLS_PER_HOUR", "120"))
+
+PREFETCH_EVENTS = metrics.counter(
+    "chatsb_prefetch_total", "Background prefetch outcomes (refreshed, fresh, budget, shed, error)."
+)
+PREFETCH_TARGETS = metrics.gauge("chatsb_prefetch_targets", "Routes considered in the last prefetch cycle.")
+
+
+def parse_routes(spec: str, days_ahead: str = PREFETCH_DAYS_AHEAD, today: date = None):
+    """
+    Expand a PREFETCH_ROUTES spec into (departure, arrival, date) tuples.
+    """
+    today = today or date.today()
+    offsets = [int(d) for d in days_ahead.split(",") if d.strip()]
+    routes = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item or "-" not in item:
+            continue
+        route, _, day = item.partition("@")
+        departure_id, arrival_id = (part.strip().upper() for part in route.split("-", 1))
+        days = [day.strip()] if day.strip() else [(today + timedelta(days=o)).isoformat() for o in offsets]
+        routes.extend((departure_id, arrival_id, d) for d in days)
+    return routes
+
+
+class CallBudget:
+    """
+    At most `limit` calls in any rolling `window` seconds.
+    """
+
+    def __init__(self, limit: int, window: float = 3600.0):
+        self.limit = limit
+        self.window = window
+        self._calls = deque()
+
+    def try_spend(self) -> bool:
+        now = time.monotonic()
+        while self._calls and now - self._calls[0] > self.window:
+            self._calls.popleft()
+        if len(self._calls) >= self.limit:
+            return False
+        self._calls.append(now)
+        return True
+
+
+class Prefetcher:
+    """
+    Keeps the flight cache warm for hot routes: every `interval` seconds it
+    re-runs searches (and the booking options of their cheapest itineraries)
+    whose cached answer is missing or about to expire. Runs at
+    PRIORITY_PREFETCH, so interactive traffic always goes first.
+
+    Only the unbounded search (no max_price) is warmed. Interactive
+    searches carry a budget, so they hit it through get_flights'
+    superset re-filter (_refilter_cached), which serves any budget from it.
+    """
+
+    def __init__(self, interval=PREFETCH_INTERVAL_S, routes=PREFETCH_ROUTES, budget=PREFETCH_MAX_CALLS_PER_HOUR):
+        self.interval = interval
+        self.routes = routes
+        self.budget = CallBudget(budget // max(serpapi_scheduler.SERPAPI_WORKERS, 1))
+        self._stop = threading.Event()
+        self._thread = None
+
+    def targets(self):
+        """
+        Configured routes first, then learned ones; past dates are skipped.
+        """
+        today = date.today().isoformat()
+        learned = [route for route, _ in flight_cache.popular_routes.top(PREFETCH_TOP_ROUTES, PREFETCH_MIN_SCORE)]
+        seen, ordered = set(), []
+        for route in parse_routes(self.routes) + learned:
+            if route not in seen and route[2] >= today:
+                seen.add(route)
+                ordered.append(route)
+        return ordered
+
+    def _needs_refresh(self, params):
+        age = flight_cache.age(params)
+        return age is None or age >= flight_cache.FLIGHT_CACHE_TTL * PREFETCH_REFRESH_AT
+
+    def refresh_route(self, departure_id, arrival_id, departure_date):
+        """
+        Refresh one route; returns the number of SerpAPI calls made.
+        Raises SchedulerRejected when SerpAPI has no room for prefetch.
+        """
+        calls = 0
+        params = get_flights.build_search_params(departure_id, arrival_id, departure_date)
+        if self._needs_refresh(params):
+            if not self.budget.try_spend():
+                PREFETCH_EVENTS.inc(event="budget")
+                return calls
+            flights = get_flights.get_flights(
+                departure_id, arrival_id, departure_date, priority=PRIORITY_PREFETCH, refresh=True
+            )
+            calls += 1
+            PREFETCH_EVENTS.inc(event="refreshed")
+        else:
+            PREFETCH_EVENTS.inc(event="fresh")
+            flights = merge_flight_results(flight_cache.get_stale(params) or {})
+
+        priced = [f for f in flights if f.get("booking_token")]
+        priced.sort(key=lambda f: flight_price(f) or float("inf"))
+        for flight in priced[:PREFETCH_BOOKING_TOP]:
+            token = flight["booking_token"]
+            booking_params = get_flights.build_booking_params(token, departure_date, departure_id, arrival_id)
+            if not self._needs_refresh(booking_params):
+                continue
+            if not self.budget.try_spend():
+                PREFETCH_EVENTS.inc(event="budget")
+                break
+            get_flights.fetch_booking_options(
+                token, departure_date, departure_id, arrival_id, priority=PRIORITY_PREFETCH, refresh=True
+            )
+            calls += 1
+        return calls
+
+    def run_once(self):
+        """
+        One prefetch cycle over all targets; returns SerpAPI calls made.
+        """
+        targets = self.targets()
+        PREFETCH_TARGETS.set(len(targets))
+        calls = 0
+        for departure_id, arrival_id, departure_date in targets:
+            if self._stop.is_set():
+                break
+            try:
+                calls += self.refresh_route(departure_id, arrival_id, departure_date)
+            except SchedulerRejected as e:
+                # SerpAPI is busy or the quota floor is reached: try next cycle
+                PREFETCH_EVENTS.inc(event="shed")
+                logger.info("⏳ Prefetch paused (%s)", e.reason)
+                break
+            except Exception as e:
+                PREFETCH_EVENTS.inc(event="error")
+                logger.warning("⚠️ Prefetch failed for %s-%s %s: %r", departure_id, arrival_id, departure_date, e)
+        if calls:
+            logger.info("🔥 Prefetch cycle warmed %d targets with %d SerpAPI calls", len(targets), calls)
+        return calls
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="prefetch", daemon=True)
+            self._thread.start()
+            logger.info("🔥 Prefetcher started (every %.0fs)", self.interval)
+
+    def stop(self):
+        self._stop.set()
+
+
+prefetcher = Prefetcher()
@@ -0,0 +1,256 @@
+# utils/profiling.py
+import os
+import sys
+import hmac
+import time
+import uuid
+import random
+import asyncio
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from utils import metrics
+from utils.logger import get_logger
+
+load_dotenv()
+
+logger = get_logger("profiling")
+
+# Profiling and the /admin endpoints are disabled unless a token is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+ADMIN_HEADER = "x-admin-token"
+PROFILE_HEADER = "x-profile"
+# Fraction of /chat requests profiled without being asked
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Profiles kept on disk; older files are deleted
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+# Requests profiled at the same time (each one runs a sampler thread)
+PROFILE_MAX_ACTIVE = int(os.getenv("PROFILE_MAX_ACTIVE", "2"))
+
+PROFILES = metrics.counter("chatsb_profiles_total", "Profiled requests by trigger (header, sampled) and outcome.")
+
+_write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profile-write")
+_recent = deque()
+_recent_lock = threading.Lock()
+_active = threading.BoundedSemaphore(PROFILE_MAX_ACTIVE)
+
+
+def is_admin(headers) -> bool:
+    token = str(headers.get(ADMIN_HEADER, ""))
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def trigger(headers):
+    """
+    "header" when an admin asked for a profile (`X-Profile: 1` plus
+    `X-Admin-Token`), "sampled" for PROFILE_SAMPLE_RATE, else None.
+    """
+    if not ADMIN_TOKEN:
+        return None
+    if str(headers.get(PROFILE_HEADER, "")).lower() in ("1", "true", "yes") and is_admin(headers):
+        return "header"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+
+def _label(code) -> str:
+    # Folded stacks use ";" between frames and a space before the count
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{os.path.basename(code.co_filename)}:{name}".replace(";", ",").replace(" ", "_")
+
+
+def _frame_of(awaitable):
+    return getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+
+
+def _pending_tasks(values, exclude=None):
+    tasks = []
+    for value in values:
+        for item in (value if isinstance(value, (list, tuple, set, frozenset)) else (value,)):
+            if isinstance(item, asyncio.Task) and item is not exclude and not item.done():
+                tasks.append(item)
+    return tasks
+
+
+class TaskSampler:
+    """
+    Wall-clock sampling profiler for one asyncio task. Every `interval`
+    seconds a background thread records the task's await chain (coroutine
+    frames), following the tasks it waits on (gather, wait_for, upstream
+    calls) into their own chains. When the innermost coroutine is running,
+    the synchronous frames it called are read from the event loop thread,
+    so CPU-bound work (tool code, JSON serialization) shows up under the
+    coroutine that ran it; otherwise the stack ends in what it waits on.
+    """
+
+    MAX_DEPTH = 8
+
+    def __init__(self, task: asyncio.Task, interval: float = PROFILE_INTERVAL_MS / 1000.0):
+        self.task = task
+        self.interval = interval
+        self.loop_thread = threading.get_ident()
+        self.stacks = Counter()
+        self.samples = 0
+        self.on_cpu = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.wall_s = time.perf_counter() - self.started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                stacks = self.sample()
+            except Exception:
+                # The task moved on while being read; drop this sample
+                continue
+            if stacks:
+                self.samples += 1
+                self.on_cpu += any(running for _, running in stacks)
+                for stack, _ in stacks:
+                    self.stacks[stack] += 1
+
+    def sample(self):
+        """
+        One (folded stack, running) pair per branch the task is in: more
+        than one while it waits on several tasks at once.
+        """
+        out = []
+        self._walk(self.task, [], out, 0)
+        return out
+
+    def _walk(self, task, labels, out, depth):
+        labels = list(labels)
+        innermost = awaiting = None
+        awaitable = task.get_coro()
+        while awaitable is not None:
+            frame = _frame_of(awaitable)
+            if frame is None:
+                break
+            labels.append(_label(frame.f_code))
+            innermost = awaitable
+            awaiting = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+            if awaiting is None or _frame_of(awaiting) is None:
+                break
+            awaitable = awaiting
+        if innermost is None:
+            return
+
+        if getattr(innermost, "cr_running", False) or getattr(innermost, "gi_running", False):
+            top = _frame_of(innermost)
+            called = []
+            frame = sys._current_frames().get(self.loop_thread)
+            while frame is not None and frame is not top:
+                called.append(_label(frame.f_code))
+                frame = frame.f_back
+            if frame is top:
+                labels.extend(reversed(called))
+            out.append((";".join(labels), True))
+            return
+
+        waiter = getattr(task, "_fut_waiter", None)
+        if isinstance(waiter, asyncio.Task):
+            children = [waiter]
+        else:
+            # asyncio.gather() waits on a future holding its children;
+            # wait_for() and wait() keep the tasks in their locals
+            children = _pending_tasks(getattr(waiter, "_children", None) or ())
+            if not children:
+                children = _pending_tasks(_frame_of(innermost).f_locals.values(), task)
+        if children and depth < self.MAX_DEPTH:
+            for child in children:
+                self._walk(child, labels + [f"<task:{child.get_name()}>"], out, depth + 1)
+            return
+        labels.append(f"<await:{type(waiter if waiter is not None else awaiting).__name__}>")
+        out.append((";".join(labels), False))
+
+
+def _store(record, folded: str):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(record["path"], "w", encoding="utf-8") as f:
+        f.write(folded)
+    with _recent_lock:
+        _recent.append(record)
+        expired = [_recent.popleft() for _ in range(max(0, len(_recent) - PROFILE_KEEP))]
+    for old in expired:
+        try:
+            os.remove(old["path"])
+        except OSError:
+            pass
+    logger.info("🔥 Stored profile %s (%d samples, %.0f ms)", record["profile_id"], record["samples"], record["wall_ms"])
+
+
+def _write(record, folded: str):
+    try:
+        _store(record, folded)
+    except OSError as e:
+        logger.warning("⚠️ Could not write profile %s: %s", record["path"], e)
+
+
+@contextmanager
+def profile_request(headers, route: str):
+    """
+    Profile the current asyncio task when `trigger(headers)` says so.
+    Yields the profile id, or None when the request is not profiled. The
+    profile is written to PROFILE_DIR as folded stacks (flamegraph.pl,
+    speedscope, inferno) after the block exits.
+    """
+    how = trigger(headers)
+    if how is None:
+        yield None
+        return
+    if not _active.acquire(blocking=False):
+        PROFILES.inc(trigger=how, outcome="busy")
+        yield None
+        return
+    profile_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    sampler = TaskSampler(asyncio.current_task())
+    sampler.start()
+    try:
+        yield profile_id
+    finally:
+        sampler.stop()
+        _active.release()
+        PROFILES.inc(trigger=how, outcome="stored")
+        record = {
+            "profile_id": profile_id,
+            "route": route,
+            "trigger": how,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "wall_ms": round(sampler.wall_s * 1000.0, 1),
+            "samples": sampler.samples,
+            "on_cpu_samples": sampler.on_cpu,
+            "interval_ms": PROFILE_INTERVAL_MS,
+            "path": os.path.join(PROFILE_DIR, f"{profile_id}.folded"),
+        }
+        folded = "".join(f"{stack} {count}\n" for stack, count in sampler.stacks.most_common())
+        _write_pool.submit(_write, record, folded)
+
+
+def recent_profiles():
+    """
+    Stored profiles, newest first.
+    """
+    with _recent_lock:
+        return [{k: v for k, v in r.items() if k != "path"} for r in reversed(_recent)]
+
+
+def profile_path(profile_id: str):
+    with _recent_lock:
+        for record in _recent:
+            if record["profile_id"] == profile_id:
+                return record["path"]
+    return None
@@ -1,20 +1,93 @@
 #rag_retriever.py
 import os
-from utils import mongoDB
+import asyncio
+from utils import mongoDB, metrics, resilience, offer_renderer, lexical_index, embedding_batcher, deals_watcher, deal_catalogue
 from dotenv import load_dotenv
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_aws import BedrockEmbeddings
 from langchain.chat_models import init_chat_model
 from langchain_mongodb import MongoDBAtlasVectorSearch
+from utils.logger import get_logger
 
 load_dotenv()
+
+logger = get_logger("rag_retriever")
+
+
+# Texts per Cohere Embed request on Bedrock
+COHERE_MAX_TEXTS = 96
+
+
+def _cohere_query_embeddings(bedrock: BedrockEmbeddings, texts):
+    """
+    Cohere Embed vectors for several retrieval queries in one Bedrock
+    request. Uses input_type "search_query" like embed_query() does;
+    embed_documents() would embed them as documents.
+    """
+    body = bedrock._invoke_model(input_body={
+        "input_type": "search_query",
+        "texts": [text.replace(os.linesep, " ") for text in texts],
+    })
+    vectors = body.get("embeddings")
+    return [bedrock._normalize_vector(v) for v in vectors] if bedrock.normalize else vectors
+
+
+class ResilientEmbeddings(Embeddings):
+    """
+    Routes Bedrock embedding calls through the resilience layer
+    (deadline + circuit breaker). Query embeddings go through a
+    micro-batcher that coalesces concurrent queries.
+    """
+
+    def __init__(self, inner: Embeddings, upstream: resilience.Upstream, batch: bool = False):
+        self.inner = inner
+        self.upstream = upstream
+        self.batcher = None
+        if batch:
+            if embedding_batcher.supports_batch_input(getattr(inner, "model_id", None)):
+                self.batcher = embedding_batcher.EmbeddingBatcher(
+                    embed_many=self._embed_queries,
+                    max_batch=min(embedding_batcher.EMBED_BATCH_MAX, COHERE_MAX_TEXTS),
+                )
+            else:
+                self.batcher = embedding_batcher.EmbeddingBatcher(embed_one=self._embed_query)
+
+    def embed_documents(self, texts):
+        return self.upstream.call(self.inner.embed_documents, texts)
+
+    def _embed_queries(self, texts):
+        return self.upstream.call(_cohere_query_embeddings, self.inner, texts, idempotent=True)
+
+    def _embed_query(self, text):
+        return self.upstream.call(self.inner.embed_query, text, idempotent=True)
+
+    def embed_query(self, text):
+        if self.batcher is not None:
+            return self.batcher.embed(text)
+        return self._embed_query(text)
+
+    async def aembed_documents(self, texts):
+        return await self.upstream.call_async(self.inner.aembed_documents, texts)
+
+    async def aembed_query(self, text):
+        if self.batcher is not None:
+            return await self.batcher.aembed(text)
+        return await self.upstream.call_async(self.inner.aembed_query, text, idempotent=True)
+
+
 # Setup
-embeddings = BedrockEmbeddings(
-                model_id= os.getenv("EMBEDDING_MODEL_ID"),
-                region_name= os.getenv("AWS_DEFAULT_REGION"),
-                aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-                aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-            )
+embeddings = ResilientEmbeddings(
+    BedrockEmbeddings(
+        model_id= os.getenv("EMBEDDING_MODEL_ID"),
+        region_name= os.getenv("AWS_DEFAULT_REGION"),
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+    ),
+    resilience.BEDROCK,
+    batch=embedding_batcher.batching_enabled(os.getenv("EMBEDDING_MODEL_ID")),
+)
 
 mongo_client = mongoDB.connect_db()
 collection = mongoDB.get_collection(mongo_client, "flight_coupons")
@@ -26,21 +99,114 @@ vector_store = MongoDBAtlasVectorSearch(
     index_name="vector_index",
 )
 
+# Tune with benchmarks/eval_retrieval.py
+RAG_K = int(os.getenv("RAG_K", "10"))
+RAG_SCORE_THRESHOLD = float(os.getenv("RAG_SCORE_THRESHOLD", "0.75"))
+OFFERS_UNAVAILABLE = "Sorry, I couldn't look up offers right now 😕 Please try again in a moment."
+
 retriever = vector_store.as_retriever(
     search_type="similarity_score_threshold",
-    search_kwargs={"k": 10, "score_threshold": 0.75,},
+    search_kwargs={"k": RAG_K, "score_threshold": RAG_SCORE_THRESHOLD,},
 )
 
-@tool
-def rag_tool(query: str):
+
+def _load_offers():
     """
-    this tool is used to return the offers on flights.
+    (offer string, metadata) for every active stored offer, for the lexical
+    index.
     """
-    docs = retriever.invoke(query)
-    context = "\n".join(d.page_content for d in docs)
+    if collection is None:
+        raise RuntimeError("flight_coupons collection is unavailable")
+    for doc in collection.find({}, {"_id": 0, "embedding": 0}):
+        if deal_catalogue.is_active(doc):
+            yield doc.pop("text", ""), doc
+
+
+offer_index = lexical_index.OfferIndex(_load_offers)
+# Rebuild on the next query after the offers change
+deals_watcher.subscribe(lambda event: offer_index.invalidate())
+
+
+def _active(docs):
+    # Expired offers stay in the vector collection (and an index built
+    # yesterday) until the purge job removes them
+    return [d for d in docs if deal_catalogue.is_active(d.metadata)]
+
+
+def _lexical_docs(index, hits):
+    return [Document(page_content=index.docs[i][0], metadata=dict(index.docs[i][1])) for i, _ in hits]
+
+
+def _fuse(index, query: str, vector_docs):
+    """
+    Reciprocal rank fusion of the vector hits and the BM25 hits.
+    """
+    lexical_docs = _lexical_docs(index, index.search(query, RAG_K))
+    by_text = {d.page_content: d for d in lexical_docs}
+    by_text.update((d.page_content, d) for d in vector_docs)
+    order = lexical_index.rrf([[d.page_content for d in vector_docs], [d.page_content for d in lexical_docs]])
+    return [by_text[text] for text in order[:RAG_K]]
+
+
+def _keyword_only(index, query: str):
+    if not len(index):
+        return None
+    hits = index.decisive(query, RAG_K)
+    if hits is None:
+        return None
+    lexical_index.LEXICAL_SEARCHES.inc(path="keyword_only")
+    return _lexical_docs(index, hits)
+
 
-    llm = init_chat_model("gemini-2.5-flash", model_provider="google_genai")
-    prompt = f"""
+def _combine(index, query: str, vector_docs):
+    if not len(index):
+        lexical_index.LEXICAL_SEARCHES.inc(path="vector_only")
+        return vector_docs
+    lexical_index.LEXICAL_SEARCHES.inc(path="hybrid")
+    return _fuse(index, query, vector_docs)
+
+
+def retrieve(query: str):
+    """
+    Hybrid retrieval: keyword-only when the query is made of exact offer
+    entities (coupon code, bank, platform, ...), otherwise vector search
+    fused with BM25 via reciprocal rank fusion. Expired offers are dropped.
+    """
+    if not lexical_index.LEXICAL_INDEX_ENABLED:
+        return _active(retriever.invoke(query))
+    index = offer_index.ensure_fresh()
+    docs = _keyword_only(index, query)
+    if docs is None:
+        docs = _combine(index, query, retriever.invoke(query))
+    return _active(docs)
+
+
+async def _avector_search(query: str):
+    vector = await embeddings.aembed_query(query)
+    hits = await mongoDB.vector_search_async(
+        "flight_coupons", vector, k=RAG_K, score_threshold=RAG_SCORE_THRESHOLD,
+    )
+    return [Document(page_content=hit.pop("text", ""), metadata=hit) for hit in hits]
+
+
+async def aretrieve(query: str):
+    """
+    Async retrieve(): the vector side embeds the query and runs $vectorSearch
+    through the async MongoDB driver (same k and score threshold as
+    `retriever`).
+    """
+    if not lexical_index.LEXICAL_INDEX_ENABLED:
+        return _active(await _avector_search(query))
+    index = await asyncio.to_thread(offer_index.ensure_fresh) if offer_index.stale() else offer_index.index
+    docs = _keyword_only(index, query)
+    if docs is None:
+        docs = _combine(index, query, await _avector_search(query))
+    return _active(docs)
+
+
+def _offers_prompt(query: str, docs):
+    context = "\n".join(d.page_content for d in docs)
+    return f"""
         You are a helpful assistant.  
 
         You will receive:  
@@ -76,5 +242,80 @@ def rag_tool(query: str):
         """
 
 
-    resp = llm.invoke(prompt)
-    return resp.content
\ No newline at end of file
+def _retrieval_failed(query: str, error):
+    logger.warning("⚠️ Offer retrieval failed for %r: %s", query, error)
+    return OFFERS_UNAVAILABLE
+
+
+def _templated_answer(query: str, docs):
+    """
+    The rendered offers when the query needs no Gemini answer, else None.
+    """
+    if offer_renderer.use_template(query):
+        offer_renderer.OFFER_RENDERS.inc(renderer="template")
+        return offer_renderer.render_offers(query, docs)
+    offer_renderer.OFFER_RENDERS.inc(renderer="llm")
+    return None
+
+
+def _offers_llm():
+    return init_chat_model("gemini-2.5-flash", model_provider="google_genai")
+
+
+def _llm_failed(query: str, docs, error):
+    logger.warning("⚠️ Gemini offer answer failed, rendering offers instead: %s", error)
+    # Degraded answer when Gemini is unavailable: the rendered offers
+    return offer_renderer.render_offers(query, docs) if docs else OFFERS_UNAVAILABLE
+
+
+def _llm_text(resp):
+    return resp.content if hasattr(resp, "content") else resp
+
+
+def _rag_tool(query: str):
+    """
+    this tool is used to return the offers on flights.
+    """
+    try:
+        with metrics.timed("retriever.invoke"):
+            docs = retrieve(query)
+    except Exception as e:
+        return _retrieval_failed(query, e)
+
+    answer = _templated_answer(query, docs)
+    if answer is not None:
+        return answer
+    try:
+        with metrics.timed("rag_tool.llm"):
+            resp = resilience.GEMINI.call(_offers_llm().invoke, _offers_prompt(query, docs))
+    except Exception as e:
+        return _llm_failed(query, docs, e)
+    return _llm_text(resp)
+
+
+async def _rag_tool_async(query: str):
+    """
+    Async rag_tool: async MongoDB vector search and awaited Gemini call.
+    """
+    try:
+        with metrics.timed("retriever.invoke"):
+            docs = await aretrieve(query)
+    except Exception as e:
+        return _retrieval_failed(query, e)
+
+    answer = _templated_answer(query, docs)
+    if answer is not None:
+        return answer
+    try:
+        with metrics.timed("rag_tool.llm"):
+            resp = await resilience.GEMINI.call_async(_offers_llm().ainvoke, _offers_prompt(query, docs))
+    except Exception as e:
+        return _llm_failed(query, docs, e)
+    return _llm_text(resp)
+
+
+rag_tool = StructuredTool.from_function(
+    func=_rag_tool,
+    coroutine=_rag_tool_async,
+    name="rag_tool",
+)
@@ -0,0 +1,309 @@
+# utils/resilience.py
+import os
+import time
+import asyncio
+import inspect
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+from utils import metrics, tracing
+from utils.logger import get_logger
+from utils.serpapi_scheduler import SchedulerRejected
+
+load_dotenv()
+
+logger = get_logger("resilience")
+
+UPSTREAM_WORKERS = int(os.getenv("UPSTREAM_WORKERS", "64"))
+
+BREAKER_STATE = metrics.gauge("chatsb_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open).")
+UPSTREAM_EVENTS = metrics.counter(
+    "chatsb_upstream_events_total", "Upstream resilience events (timeout, hedge, hedge_won, short_circuit, fallback)."
+)
+
+# Upstream calls run here so the caller can stop waiting at the deadline.
+# A timed-out call keeps its worker until the upstream returns; the pool
+# size bounds how many such stragglers can pile up.
+_executor = ThreadPoolExecutor(max_workers=UPSTREAM_WORKERS, thread_name_prefix="upstream")
+
+
+class UpstreamError(Exception):
+    """
+    Base class for failures raised by the resilience layer itself.
+    """
+
+
+class UpstreamTimeout(UpstreamError):
+    pass
+
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+class LatencyTracker:
+    """
+    Sliding window of recent successful latencies for p95 estimation.
+    """
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float, min_samples: int = 20):
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures; after
+    `reset_timeout` seconds one probe call is let through (half-open) and
+    its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        BREAKER_STATE.set(self.state, upstream=name)
+
+    def _set(self, state):
+        if state != self.state:
+            logger.warning("⚡ Circuit %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        BREAKER_STATE.set(state, upstream=self.name)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def release_probe(self):
+        """
+        End a call that says nothing about the upstream (shed locally,
+        cancelled) without changing the state, so a half-open circuit
+        can send another probe.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            self._set(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set(self.OPEN)
+
+
+class Upstream:
+    """
+    Per-upstream policy: deadline, optional hedging after the observed p95,
+    and a circuit breaker. Exceptions listed in `passthrough` (e.g. local
+    load shedding) are re-raised without counting as upstream failures.
+    """
+
+    def __init__(self, name, timeout, hedge=False, min_hedge_delay=0.5,
+                 failure_threshold=5, reset_timeout=30.0, passthrough=()):
+        self.name = name
+        self.timeout = timeout
+        self.hedge = hedge
+        self.min_hedge_delay = min_hedge_delay
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.latency = LatencyTracker()
+        self.passthrough = tuple(passthrough)
+
+    def hedge_delay(self):
+        p95 = self.latency.percentile(95)
+        return None if p95 is None else max(self.min_hedge_delay, p95)
+
+    def _run(self, fn, args, kwargs, idempotent):
+        deadline = time.monotonic() + self.timeout
+        # One context copy per submission: a Context cannot be entered by
+        # two threads at once, and a hedge runs alongside the primary
+        primary = _executor.submit(tracing.wrap(fn), *args, **kwargs)
+        pending = {primary}
+
+        delay = self.hedge_delay() if (self.hedge and idempotent) else None
+        if delay is not None and delay < self.timeout:
+            done, _ = wait(pending, timeout=delay)
+            if not done:
+                UPSTREAM_EVENTS.inc(upstream=self.name, event="hedge")
+                pending.add(_executor.submit(tracing.wrap(fn), *args, **kwargs))
+
+        error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        UPSTREAM_EVENTS.inc(upstream=self.name, event="hedge_won")
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = future.exception()
+                if isinstance(error, self.passthrough):
+                    raise error
+        if error is not None and not pending:
+            raise error
+        UPSTREAM_EVENTS.inc(upstream=self.name, event="timeout")
+        raise UpstreamTimeout(f"{self.name} did not answer within {self.timeout:.1f}s")
+
+    def call(self, fn, *args, idempotent=False, fallback=None, **kwargs):
+        """
+        Call `fn(*args, **kwargs)` under this upstream's policy. On failure,
+        `fallback()` is tried first; if it returns None the error is raised.
+        """
+        if not self.breaker.allow():
+            UPSTREAM_EVENTS.inc(upstream=self.name, event="short_circuit")
+            return self._fallback(fallback, CircuitOpenError(f"{self.name} circuit is open"))
+
+        start = time.monotonic()
+        try:
+            result = self._run(fn, args, kwargs, idempotent)
+        except self.passthrough as e:
+            self.breaker.release_probe()
+            return self._fallback(fallback, e)
+        except Exception as e:
+            self.breaker.record_failure()
+            logger.warning("⚠️ %s call failed after %.2fs: %r", self.name, time.monotonic() - start, e)
+            return self._fallback(fallback, e)
+        except BaseException:
+            # Cancelled by the caller: neither a success nor a failure
+            self.breaker.release_probe()
+            raise
+        self.breaker.record_success()
+        self.latency.add(time.monotonic() - start)
+        return result
+
+    def _fallback(self, fallback, error):
+        if fallback is not None:
+            value = fallback()
+            if value is not None:
+                UPSTREAM_EVENTS.inc(upstream=self.name, event="fallback")
+                logger.info("🩹 Serving degraded result for %s (%s)", self.name, type(error).__name__)
+                return value
+        raise error
+
+    # ------------------------------------------------------------ asyncio
+    async def _run_async(self, fn, args, kwargs, idempotent):
+        deadline = time.monotonic() + self.timeout
+        primary = asyncio.ensure_future(fn(*args, **kwargs))
+        pending = {primary}
+
+        delay = self.hedge_delay() if (self.hedge and idempotent) else None
+        if delay is not None and delay < self.timeout:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                UPSTREAM_EVENTS.inc(upstream=self.name, event="hedge")
+                pending.add(asyncio.ensure_future(fn(*args, **kwargs)))
+
+        error = None
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is not primary:
+                            UPSTREAM_EVENTS.inc(upstream=self.name, event="hedge_won")
+                        return future.result()
+                    error = future.exception()
+                    if isinstance(error, self.passthrough):
+                        raise error
+        finally:
+            # Unlike threads, coroutines can really be stopped at the deadline
+            for future in pending:
+                future.cancel()
+        if error is not None and not pending:
+            raise error
+        UPSTREAM_EVENTS.inc(upstream=self.name, event="timeout")
+        raise UpstreamTimeout(f"{self.name} did not answer within {self.timeout:.1f}s")
+
+    async def call_async(self, fn, *args, idempotent=False, fallback=None, **kwargs):
+        """
+        asyncio flavour of call(): `fn` is a coroutine function and
+        `fallback` may be sync or async.
+        """
+        if not self.breaker.allow():
+            UPSTREAM_EVENTS.inc(upstream=self.name, event="short_circuit")
+            return await self._fallback_async(fallback, CircuitOpenError(f"{self.name} circuit is open"))
+
+        start = time.monotonic()
+        try:
+            result = await self._run_async(fn, args, kwargs, idempotent)
+        except self.passthrough as e:
+            self.breaker.release_probe()
+            return await self._fallback_async(fallback, e)
+        except Exception as e:
+            self.breaker.record_failure()
+            logger.warning("⚠️ %s call failed after %.2fs: %r", self.name, time.monotonic() - start, e)
+            return await self._fallback_async(fallback, e)
+        except BaseException:
+            # Cancelled by the caller: neither a success nor a failure
+            self.breaker.release_probe()
+            raise
+        self.breaker.record_success()
+        self.latency.add(time.monotonic() - start)
+        return result
+
+    async def _fallback_async(self, fallback, error):
+        if fallback is not None:
+            value = fallback()
+            if inspect.isawaitable(value):
+                value = await value
+            if value is not None:
+                UPSTREAM_EVENTS.inc(upstream=self.name, event="fallback")
+                logger.info("🩹 Serving degraded result for %s (%s)", self.name, type(error).__name__)
+                return value
+        raise error
+
+
+SERPAPI_SEARCH = Upstream(
+    "serpapi_search",
+    timeout=float(os.getenv("SERPAPI_TIMEOUT_S", "25")),
+    hedge=os.getenv("SERPAPI_HEDGE", "true").lower() == "true",
+    passthrough=(SchedulerRejected,),
+)
+SERPAPI_BOOKING = Upstream(
+    "serpapi_booking",
+    timeout=float(os.getenv("SERPAPI_BOOKING_TIMEOUT_S", "30")),
+    hedge=os.getenv("SERPAPI_HEDGE", "true").lower() == "true",
+    passthrough=(SchedulerRejected,),
+)
+BEDROCK = Upstream("bedrock", timeout=float(os.getenv("BEDROCK_TIMEOUT_S", "10")))
+GEMINI = Upstream("gemini", timeout=float(os.getenv("GEMINI_TIMEOUT_S", "45")))
+MONGO_CACHE = Upstream("mongo_cache", timeout=float(os.getenv("FLIGHT_CACHE_L2_TIMEOUT_S", "0.5")))
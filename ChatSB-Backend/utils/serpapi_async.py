@@ -0,0 +1,81 @@
+# utils/serpapi_async.py
+import os
+import httpx
+from dotenv import load_dotenv
+from utils import serpapi_scheduler
+from utils.serpapi_scheduler import PRIORITY_INTERACTIVE
+from utils.logger import get_logger
+
+load_dotenv()
+
+logger = get_logger("serpapi_async")
+
+SERPAPI_URL = os.getenv("SERPAPI_URL", "https://serpapi.com/search")
+SERPAPI_MAX_CONNECTIONS = int(os.getenv("SERPAPI_MAX_CONNECTIONS", "100"))
+SERPAPI_MAX_KEEPALIVE = int(os.getenv("SERPAPI_MAX_KEEPALIVE", "20"))
+SERPAPI_KEEPALIVE_EXPIRY_S = float(os.getenv("SERPAPI_KEEPALIVE_EXPIRY_S", "30"))
+
+_client = None
+_transport = None
+
+
+def configure(transport=None):
+    """
+    Swap the HTTP transport (e.g. httpx.MockTransport for offline runs).
+    Takes effect on the next request.
+    """
+    global _client, _transport
+    _transport = transport
+    _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Process-wide AsyncClient so connections to SerpAPI stay alive between
+    searches. Created lazily inside the running event loop.
+    """
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            transport=_transport,
+            limits=httpx.Limits(
+                max_connections=SERPAPI_MAX_CONNECTIONS,
+                max_keepalive_connections=SERPAPI_MAX_KEEPALIVE,
+                keepalive_expiry=SERPAPI_KEEPALIVE_EXPIRY_S,
+            ),
+            # Deadlines are enforced by utils.resilience; this is only a backstop
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            headers={"Accept": "application/json"},
+        )
+    return _client
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _query(params: dict) -> dict:
+    # Same wire format as serpapi.GoogleSearch: JSON output, booleans as "true"/"false"
+    query = {"output": "json", "source": "python"}
+    for key, value in params.items():
+        if value is None:
+            continue
+        query[key] = str(value).lower() if isinstance(value, bool) else value
+    return query
+
+
+async def search(params: dict, priority: int = PRIORITY_INTERACTIVE, timeout: float = None):
+    """
+    Async counterpart of serpapi_scheduler.search(): waits for a scheduler
+    token without holding a thread, then calls SerpAPI over the pooled client.
+    """
+    await serpapi_scheduler.scheduler.acquire_async(priority, timeout)
+    response = await get_client().get(SERPAPI_URL, params=_query(params))
+    try:
+        return response.json()
+    except ValueError:
+        response.raise_for_status()
+        raise
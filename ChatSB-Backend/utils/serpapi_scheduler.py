@@ -0,0 +1,339 @@
+# utils/serpapi_scheduler.py
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from serpapi import GoogleSearch
+from utils import metrics
+from utils.logger import get_logger
+
+load_dotenv()
+
+logger = get_logger("serpapi_scheduler")
+
+# Lower value = served first
+PRIORITY_INTERACTIVE = 0  # get_flights searches for a waiting user
+PRIORITY_BOOKING = 1      # fetch_booking_options deep searches
+PRIORITY_PREFETCH = 2     # background cache warming
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_BOOKING: "booking",
+    PRIORITY_PREFETCH: "prefetch",
+}
+
+SCHEDULER_DECISIONS = metrics.counter(
+    "chatsb_serpapi_scheduler_total", "SerpAPI scheduler decisions by priority and outcome."
+)
+SCHEDULER_QUEUE_DEPTH = metrics.gauge("chatsb_serpapi_queue_depth", "SerpAPI calls waiting for a token.")
+SCHEDULER_WAIT = metrics.histogram(
+    "chatsb_serpapi_queue_wait_seconds", "Time SerpAPI calls spent waiting for a token."
+)
+QUOTA_REMAINING = metrics.gauge("chatsb_serpapi_quota_remaining", "SerpAPI searches left this month.")
+
+# Server processes sharing one SerpAPI account (uvicorn/gunicorn workers).
+# The bucket and quota live in process memory, so each gets 1/N of them.
+SERPAPI_WORKERS = int(os.getenv("SERPAPI_WORKERS", os.getenv("WEB_CONCURRENCY", "1")))
+
+
+class SchedulerRejected(Exception):
+    """
+    Raised when a SerpAPI call is shed (queue full, waited too long or
+    monthly quota exhausted). `retry_after` is a hint in seconds.
+    """
+
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        super().__init__(f"SerpAPI call shed: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, at most `capacity` banked.
+    Not thread-safe on its own; the scheduler calls it under its lock.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self._refill()
+        self.tokens -= 1
+
+    def refund(self):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class MonthlyQuota:
+    """
+    Counts searches against the SerpAPI plan for the current UTC month.
+    Prefetch is only allowed while more than `prefetch_floor` searches
+    remain, and bookings while more than `booking_floor` remain, so the
+    last searches of the month go to interactive users.
+    """
+
+    def __init__(self, limit: int, used: int = 0, prefetch_floor: int = 0, booking_floor: int = 0):
+        self.limit = limit  # 0 = unlimited
+        self.used = used
+        self.prefetch_floor = prefetch_floor
+        self.booking_floor = booking_floor
+        self.month = self._month()
+
+    @staticmethod
+    def _month():
+        return datetime.now(timezone.utc).strftime("%Y-%m")
+
+    def remaining(self):
+        if self.month != self._month():
+            self.month, self.used = self._month(), 0
+        return None if not self.limit else max(0, self.limit - self.used)
+
+    def allows(self, priority: int) -> bool:
+        left = self.remaining()
+        if left is None:
+            return True
+        floor = {PRIORITY_PREFETCH: self.prefetch_floor, PRIORITY_BOOKING: self.booking_floor}.get(priority, 0)
+        return left > floor
+
+    def consume(self):
+        self.remaining()
+        self.used += 1
+        left = self.remaining()
+        if left is not None:
+            QUOTA_REMAINING.set(left)
+
+    def refund(self):
+        self.used = max(0, self.used - 1)
+        left = self.remaining()
+        if left is not None:
+            QUOTA_REMAINING.set(left)
+
+
+class _Waiter:
+    __slots__ = ("priority", "deadline", "enqueued", "state", "reason", "event", "loop", "future")
+
+    def __init__(self, priority, deadline, loop=None):
+        self.priority = priority
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.state = "waiting"  # waiting | granted | rejected
+        self.reason = None
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def _notify(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+
+    def grant(self):
+        self.state = "granted"
+        self._notify()
+
+    def reject(self, reason):
+        self.state = "rejected"
+        self.reason = reason
+        self._notify()
+
+
+class SerpApiScheduler:
+    """
+    Central gate for every SerpAPI request. Callers block in acquire()
+    (or await acquire_async()) until a dispatcher thread hands them a token,
+    always serving the lowest priority value first. Requests are shed with
+    SchedulerRejected instead of queueing forever.
+    """
+
+    def __init__(self, rate_per_sec=5.0, burst=10, monthly_quota=0, quota_used=0,
+                 max_queue=100, max_wait=None, prefetch_floor=0, booking_floor=0):
+        self.bucket = TokenBucket(rate_per_sec, burst)
+        self.quota = MonthlyQuota(monthly_quota, quota_used, prefetch_floor, booking_floor)
+        self.max_queue = max_queue
+        self.max_wait = max_wait or {PRIORITY_INTERACTIVE: 10.0, PRIORITY_BOOKING: 8.0, PRIORITY_PREFETCH: 30.0}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls):
+        """
+        Rate, burst, monthly quota and floors are account-wide settings;
+        each process enforces its 1/SERPAPI_WORKERS share, so N workers
+        together stay within them.
+        """
+        workers = max(SERPAPI_WORKERS, 1)
+        return cls(
+            rate_per_sec=float(os.getenv("SERPAPI_RATE_PER_SEC", "5")) / workers,
+            burst=max(1.0, float(os.getenv("SERPAPI_BURST", "10")) / workers),
+            monthly_quota=int(os.getenv("SERPAPI_MONTHLY_QUOTA", "0")) // workers,
+            quota_used=int(os.getenv("SERPAPI_QUOTA_USED", "0")) // workers,
+            max_queue=int(os.getenv("SERPAPI_QUEUE_SIZE", "100")),
+            max_wait={
+                PRIORITY_INTERACTIVE: float(os.getenv("SERPAPI_MAX_WAIT_INTERACTIVE_S", "10")),
+                PRIORITY_BOOKING: float(os.getenv("SERPAPI_MAX_WAIT_BOOKING_S", "8")),
+                PRIORITY_PREFETCH: float(os.getenv("SERPAPI_MAX_WAIT_PREFETCH_S", "30")),
+            },
+            prefetch_floor=int(os.getenv("SERPAPI_PREFETCH_QUOTA_FLOOR", "500")) // workers,
+            booking_floor=int(os.getenv("SERPAPI_BOOKING_QUOTA_FLOOR", "100")) // workers,
+        )
+
+    # -------------------------------------------------------------- internals
+    def _ensure_dispatcher(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._dispatch, name="serpapi-scheduler", daemon=True)
+            self._thread.start()
+
+    def _record(self, waiter, outcome):
+        SCHEDULER_DECISIONS.inc(priority=PRIORITY_NAMES.get(waiter.priority, waiter.priority), outcome=outcome)
+
+    def _expire_locked(self, now):
+        if not any(w.deadline <= now for _, _, w in self._heap):
+            return
+        alive = []
+        for item in self._heap:
+            waiter = item[2]
+            if waiter.deadline <= now and waiter.state == "waiting":
+                waiter.reject("deadline")
+                self._record(waiter, "shed_deadline")
+            elif waiter.state == "waiting":
+                alive.append(item)
+        heapq.heapify(alive)
+        self._heap = alive
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    self._expire_locked(now)
+                    SCHEDULER_QUEUE_DEPTH.set(len(self._heap))
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    wait = self.bucket.wait_time()
+                    if wait <= 0:
+                        break
+                    next_deadline = min(w.deadline for _, _, w in self._heap)
+                    self._cond.wait(timeout=max(0.001, min(wait, next_deadline - now)))
+
+                _, _, waiter = heapq.heappop(self._heap)
+                if waiter.state != "waiting":
+                    continue
+                if not self.quota.allows(waiter.priority):
+                    waiter.reject("quota")
+                    self._record(waiter, "shed_quota")
+                    continue
+                self.bucket.consume()
+                self.quota.consume()
+                SCHEDULER_WAIT.observe(time.monotonic() - waiter.enqueued)
+                self._record(waiter, "granted")
+                waiter.grant()
+
+    def _enqueue(self, priority, timeout, loop=None):
+        if not self.quota.allows(priority):
+            SCHEDULER_DECISIONS.inc(priority=PRIORITY_NAMES.get(priority, priority), outcome="shed_quota")
+            raise SchedulerRejected("quota", retry_after=3600.0)
+
+        max_wait = timeout if timeout is not None else self.max_wait.get(priority, 10.0)
+        waiter = _Waiter(priority, time.monotonic() + max_wait, loop)
+        with self._cond:
+            self._ensure_dispatcher()
+            live = [item for item in self._heap if item[2].state == "waiting"]
+            if len(live) >= self.max_queue:
+                # Full: evict the least important waiter if the newcomer outranks it
+                victim = max(live, key=lambda item: (item[0], item[1]))
+                if victim[0] <= priority:
+                    SCHEDULER_DECISIONS.inc(priority=PRIORITY_NAMES.get(priority, priority), outcome="shed_queue")
+                    raise SchedulerRejected("queue_full", retry_after=len(live) / max(self.bucket.rate, 0.001))
+                victim[2].reject("evicted")
+                self._record(victim[2], "shed_evicted")
+            heapq.heappush(self._heap, (priority, next(self._seq), waiter))
+            self._cond.notify()
+        return waiter, max_wait
+
+    @staticmethod
+    def _outcome(waiter):
+        if waiter.state == "granted":
+            return
+        raise SchedulerRejected(waiter.reason or "timeout")
+
+    # -------------------------------------------------------------- public API
+    def acquire(self, priority: int = PRIORITY_INTERACTIVE, timeout: float = None):
+        """
+        Block until this call may hit SerpAPI. Raises SchedulerRejected
+        if it is shed.
+        """
+        waiter, max_wait = self._enqueue(priority, timeout)
+        if not waiter.event.wait(max_wait + 1.0):
+            with self._cond:
+                if waiter.state == "waiting":
+                    waiter.reject("timeout")
+        self._outcome(waiter)
+
+    async def acquire_async(self, priority: int = PRIORITY_INTERACTIVE, timeout: float = None):
+        """
+        asyncio flavour of acquire(); waits without holding a thread.
+        """
+        waiter, max_wait = self._enqueue(priority, timeout, loop=asyncio.get_running_loop())
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), max_wait + 1.0)
+        except asyncio.TimeoutError:
+            with self._cond:
+                if waiter.state == "waiting":
+                    waiter.reject("timeout")
+        except asyncio.CancelledError:
+            # Hedge loser or disconnected client: the search will never run
+            with self._cond:
+                if waiter.state == "waiting":
+                    waiter.reject("cancelled")
+                    self._record(waiter, "cancelled")
+                elif waiter.state == "granted":
+                    self.bucket.refund()
+                    self.quota.refund()
+                    self._record(waiter, "refunded")
+                self._cond.notify()
+            raise
+        self._outcome(waiter)
+
+    def stats(self):
+        with self._cond:
+            waiting = [w.priority for _, _, w in self._heap if w.state == "waiting"]
+            return {
+                "queued": {PRIORITY_NAMES[p]: waiting.count(p) for p in PRIORITY_NAMES},
+                "tokens": round(self.bucket.tokens, 2),
+                "quota_remaining": self.quota.remaining(),
+            }
+
+
+scheduler = SerpApiScheduler.from_env()
+
+
+def search(params: dict, priority: int = PRIORITY_INTERACTIVE, timeout: float = None):
+    """
+    Run one SerpAPI request through the shared scheduler and return its dict.
+    """
+    scheduler.acquire(priority, timeout)
+    return GoogleSearch(params).get_dict()
@@ -0,0 +1,230 @@
+# utils/tracing.py
+import os
+import re
+import json
+import time
+import uuid
+import random
+import threading
+import inspect
+import functools
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from utils.logger import get_logger
+
+load_dotenv()
+
+logger = get_logger("tracing")
+
+TRACE_FILE = os.getenv("TRACE_FILE")  # JSONL exporter target; unset disables export
+TRACE_EXPORT_RATE = float(os.getenv("TRACE_EXPORT_RATE", "1.0"))
+TRACE_SERVER_TIMING = os.getenv("TRACE_SERVER_TIMING", "false").lower() == "true"
+DEBUG_HEADER = "x-debug-trace"
+
+_current_span = contextvars.ContextVar("chatsb_current_span", default=None)
+_export_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-export")
+_export_lock = threading.Lock()
+_TIMING_NAME_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start", "end", "attributes", "error")
+
+    def __init__(self, trace, name, parent_id, attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+
+    @property
+    def duration_ms(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000.0
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class Trace:
+    """
+    All spans recorded for one request. Spans can be appended from worker
+    threads, so the list is guarded by a lock.
+    """
+
+    def __init__(self, name):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def root(self):
+        return self.spans[0] if self.spans else None
+
+    def critical_path(self):
+        """
+        Walk from the root, always following the child that finished last;
+        that chain is what bounded the request's latency.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        children = {}
+        for s in spans:
+            children.setdefault(s.parent_id, []).append(s)
+        path = []
+        node = spans[0] if spans else None
+        while node is not None:
+            path.append(node.name)
+            kids = [k for k in children.get(node.span_id, []) if k.end is not None]
+            node = max(kids, key=lambda k: k.end) if kids else None
+        return path
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "timestamp": self.wall_start,
+            "duration_ms": round(spans[0].duration_ms, 3) if spans else 0.0,
+            "critical_path": self.critical_path(),
+            "spans": [
+                {
+                    "name": s.name,
+                    "span_id": s.span_id,
+                    "parent_id": s.parent_id,
+                    "start_ms": round((s.start - self.start) * 1000.0, 3),
+                    "duration_ms": round(s.duration_ms, 3),
+                    "attributes": s.attributes,
+                    "error": s.error,
+                }
+                for s in spans
+            ],
+        }
+
+    def server_timing(self):
+        """
+        Server-Timing header value, one entry per span name (durations summed
+        so repeated calls such as booking fetches collapse into one metric).
+        """
+        totals = {}
+        with self._lock:
+            spans = list(self.spans)
+        for s in spans:
+            key = _TIMING_NAME_RE.sub("_", s.name)
+            count, dur = totals.get(key, (0, 0.0))
+            totals[key] = (count + 1, dur + s.duration_ms)
+        return ", ".join(
+            f'{name};dur={dur:.1f};desc="x{count}"' if count > 1 else f"{name};dur={dur:.1f}"
+            for name, (count, dur) in totals.items()
+        )
+
+
+def current_trace():
+    span = _current_span.get()
+    return span.trace if span is not None else None
+
+
+@contextmanager
+def start_trace(name: str, **attributes):
+    """
+    Open a new trace with a root span; the trace is exported on exit when
+    TRACE_FILE is configured.
+    """
+    trace = Trace(name)
+    root = Span(trace, name, None, attributes)
+    trace.add(root)
+    token = _current_span.set(root)
+    try:
+        yield trace
+    except BaseException as e:
+        root.error = repr(e)
+        raise
+    finally:
+        root.end = time.perf_counter()
+        _current_span.reset(token)
+        if TRACE_FILE and random.random() < TRACE_EXPORT_RATE:
+            export(trace)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Record a child span of the current one. Outside a trace this is a no-op,
+    so instrumented code costs almost nothing for untraced calls.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    parent.trace.add(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = repr(e)
+        raise
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def traced(name: str):
+    """
+    Decorator form of span() for whole functions.
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def wrap(fn):
+    """
+    Bind `fn` to the caller's context so spans opened inside a thread pool
+    worker attach to the caller's trace.
+    """
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+def debug_requested(headers) -> bool:
+    return str(headers.get(DEBUG_HEADER, "")).lower() in ("1", "true", "yes")
+
+
+def _write(line: str):
+    try:
+        with _export_lock, open(TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        logger.warning("⚠️ Could not write trace to %s: %s", TRACE_FILE, e)
+
+
+def export(trace: Trace):
+    """
+    Append the trace as one JSON line to TRACE_FILE on a background thread.
+    """
+    line = json.dumps(trace.to_dict(), default=str, ensure_ascii=False)
+    _export_pool.submit(_write, line)